@@ -19,6 +19,8 @@ from src.database.connection import db, init_db, get_supabase
 from src.utils.logger import setup_logger
 from src.middleware.security import setup_security_headers
 from src.middleware.rate_limiter import setup_rate_limiting
+from src.middleware.idempotency import setup_idempotency
+from src.middleware.response_cache import setup_response_cache
 
 # Import API blueprints
 from src.api.payments import payments_bp
@@ -28,7 +30,11 @@ from src.api.health import health_bp
 from src.api.offline_demo import offline_demo_bp
 
 # Import plugin system
-from src.plugins.plugin_manager import PluginManager
+from src.plugins.plugin_manager import init_plugins
+from src.models.plugin_log import init_plugin_log_writer
+from src.services.user_activity_store import init_user_activity_store
+from src.services.transaction_rollups import init_transaction_rollups
+from src.services.system_metrics import init_system_metrics
 
 # Import queue system
 from src.task_queue.task_queue import init_celery
@@ -61,7 +67,8 @@ def create_app(config_name='development'):
         r"/*": {
             "origins": ["http://localhost:3000", "http://localhost:3001", "http://localhost:19006", "http://localhost:8080"],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key", "If-None-Match"],
+            "expose_headers": ["ETag"],
             "supports_credentials": True
         }
     })
@@ -72,6 +79,8 @@ def create_app(config_name='development'):
     # Security middleware
     setup_security_headers(app)
     setup_rate_limiting(app)
+    setup_idempotency(app)
+    setup_response_cache(app)
 
     # Proxy fix for deployment
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1,
@@ -81,9 +90,20 @@ def create_app(config_name='development'):
     with app.app_context():
         init_db()
 
-    # Initialize plugin system
-    plugin_manager = PluginManager()
-    app.plugin_manager = plugin_manager
+    # Buffer plugin logs and write them in batches off the request path
+    init_plugin_log_writer(app)
+
+    # Rebuild per-user activity windows used by the risk checks
+    init_user_activity_store(app)
+
+    # Batch hourly and daily dashboard rollups of finished transactions
+    init_transaction_rollups(app)
+
+    # Sample host metrics and dependency health off the request path
+    init_system_metrics(app)
+
+    # Initialize plugin system once; requests reuse the warm plugin instances
+    plugin_manager = init_plugins(app)
 
     # Initialize Celery for async tasks
     init_celery(app)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark RateLimiter checks per second with 100k distinct clients
+Compares the previous timestamp-deque limiter against the GCRA limiter
+"""
+
+import sys
+import os
+import random
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+# Add src to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.middleware.rate_limiter import RateLimiter
+
+CLIENTS = 100000
+CHECKS = 500000
+
+class TimestampRateLimiter:
+    """Previous RateLimiter: a deque of request timestamps per key"""
+    
+    def __init__(self):
+        self.requests = defaultdict(deque)
+        self.per_minute_limit = 60
+        self.per_hour_limit = 1000
+    
+    def is_allowed(self, key):
+        now = time.time()
+        while self.requests[key] and now - self.requests[key][0] > 3600:
+            self.requests[key].popleft()
+        if len([t for t in self.requests[key] if now - t < 60]) >= self.per_minute_limit:
+            return False
+        if len([t for t in self.requests[key] if now - t < 3600]) >= self.per_hour_limit:
+            return False
+        self.requests[key].append(now)
+        return True
+
+def measure(name, limiter_class, keys):
+    """Run CHECKS checks spread over the client keys"""
+    limiter = limiter_class()
+    start = time.perf_counter()
+    allowed = 0
+    for key in keys:
+        allowed += limiter.is_allowed(key)
+    elapsed = time.perf_counter() - start
+    
+    # Memory is measured on a separate run since tracing slows every allocation
+    tracemalloc.start()
+    limiter = limiter_class()
+    for key in keys:
+        limiter.is_allowed(key)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    print(f"{name:<18} {CHECKS / elapsed:>12,.0f} checks/s   "
+          f"peak memory {peak / 1024 / 1024:>7.1f} MiB   allowed {allowed:,}")
+
+if __name__ == '__main__':
+    random.seed(42)
+    clients = [f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}:bench-agent" for i in range(CLIENTS)]
+    # Skewed traffic: a few hot clients hit their limits, most send a handful of requests
+    keys = [clients[min(int(random.paretovariate(1.2)) - 1, CLIENTS - 1)] if random.random() < 0.3
+            else random.choice(clients) for _ in range(CHECKS)]
+    
+    measure('before (deques)', TimestampRateLimiter, keys)
+    measure('after (GCRA)', RateLimiter, keys)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark Transaction.get_transaction_stats against the previous five-query version
+Seeds a transactions table in SQL, prints each plan with EXPLAIN and times both.
+Uses a throwaway SQLite file unless DATABASE_URL points at Postgres.
+
+Usage: python benchmark_stats.py [rows]   (default 10,000,000)
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Add src to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from flask import Flask
+from sqlalchemy import text
+from src.database.connection import db
+from src.database.stats import status_breakdown_query
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+REPEAT = 3
+
+# Status mix: mostly completed, some pending and failed, a few refunded.
+# SQLite gives the UUID column numeric affinity, so ids start with a letter
+# to stay text and unique.
+SQLITE_SEED = """
+WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < :rows)
+INSERT INTO transactions (id, txn_id, amount, currency, payment_method, payment_rail, status, created_at)
+SELECT printf('beef%028x', n), 'BENCH_' || n, (n % 50000) / 100.0, 'MYR', 'qr', 'duitnow',
+       CASE n % 20 WHEN 0 THEN 'failed' WHEN 1 THEN 'pending' WHEN 2 THEN 'refunded' ELSE 'completed' END,
+       datetime('now', '-' || (n % 90) || ' days')
+FROM seq
+"""
+
+POSTGRES_SEED = """
+INSERT INTO transactions (id, txn_id, amount, currency, payment_method, payment_rail, status, created_at)
+SELECT gen_random_uuid(), 'BENCH_' || n, (n % 50000) / 100.0, 'MYR', 'qr', 'duitnow',
+       CASE n % 20 WHEN 0 THEN 'failed' WHEN 1 THEN 'pending' WHEN 2 THEN 'refunded' ELSE 'completed' END,
+       now() - (n % 90) * interval '1 day'
+FROM generate_series(1, :rows) AS n
+"""
+
+def create_benchmark_app(database_url):
+    """Minimal app bound to the benchmark database"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def legacy_queries(Transaction):
+    """The five queries the stats used to run"""
+    return [
+        db.session.query(db.func.count(Transaction.id)),
+        db.session.query(db.func.count(Transaction.id)).filter(Transaction.status == 'pending'),
+        db.session.query(db.func.count(Transaction.id)).filter(Transaction.status == 'completed'),
+        db.session.query(db.func.count(Transaction.id)).filter(Transaction.status == 'failed'),
+        db.session.query(db.func.sum(Transaction.amount)).filter(Transaction.status == 'completed')
+    ]
+
+def explain(query, postgres):
+    """Print the database's plan for a query"""
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN (ANALYZE, BUFFERS)' if postgres else 'EXPLAIN QUERY PLAN'
+    for row in db.session.execute(text(f"{prefix} {sql}")):
+        print(f"    {row[-1]}")
+
+def timed(queries):
+    """Best wall time of running all queries, in milliseconds"""
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for query in queries:
+            query.all()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+if __name__ == '__main__':
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark_stats.db')}"
+    postgres = database_url.startswith('postgres')
+    print(f"Database: {database_url.split('@')[-1]}")
+    
+    app = create_benchmark_app(database_url)
+    with app.app_context():
+        import src.models.user, src.models.qr_code, src.models.offline_token, src.models.plugin_log
+        from src.models.transaction import Transaction
+        db.create_all()
+        db.session.execute(text("DELETE FROM transactions WHERE txn_id LIKE 'BENCH_%'"))
+        
+        start = time.perf_counter()
+        db.session.execute(text(POSTGRES_SEED if postgres else SQLITE_SEED), {'rows': ROWS})
+        db.session.commit()
+        db.session.execute(text('ANALYZE transactions' if postgres else 'ANALYZE'))
+        print(f"Seeded {ROWS:,} transactions in {time.perf_counter() - start:.1f}s\n")
+        
+        legacy = legacy_queries(Transaction)
+        single = status_breakdown_query(Transaction, ['pending', 'completed', 'failed'],
+                                        sum_column=Transaction.amount, sum_status='completed')
+        
+        print("Previous: 5 queries")
+        for query in legacy:
+            explain(query, postgres)
+        print("\nCurrent: 1 conditional-aggregation query")
+        explain(single, postgres)
+        
+        legacy_ms = timed(legacy)
+        single_ms = timed([single])
+        print(f"\nprevious {legacy_ms:>10,.1f} ms")
+        print(f"current  {single_ms:>10,.1f} ms   ({legacy_ms / single_ms:.1f}x)")
+        print(Transaction.get_transaction_stats())
+        
+        db.session.execute(text("DELETE FROM transactions WHERE txn_id LIKE 'BENCH_%'"))
+        db.session.commit()
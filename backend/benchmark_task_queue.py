@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark TaskQueue enqueue/dequeue throughput with a large pending backlog
+Compares the previous linear-insert deque against the heap-based queue
+"""
+
+import sys
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Add src to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.task_queue.task_queue import TaskQueue
+
+PENDING = 100000
+MEASURED = 2000
+PRIORITIES = [1, 3, 5, 7]
+
+class LinearInsertQueue:
+    """Previous TaskQueue scheduling: scan the deque for the insertion point"""
+    
+    def __init__(self):
+        self.tasks = deque()
+        self.lock = threading.Lock()
+    
+    def add_task(self, task_type, task_data, priority=0):
+        task = {'id': f"{task_type}_{len(self.tasks)}", 'type': task_type,
+                'data': task_data, 'priority': priority}
+        with self.lock:
+            inserted = False
+            for i, existing_task in enumerate(self.tasks):
+                if priority > existing_task['priority']:
+                    self.tasks.insert(i, task)
+                    inserted = True
+                    break
+            if not inserted:
+                self.tasks.append(task)
+        return task['id']
+    
+    def get_next_task(self):
+        with self.lock:
+            if self.tasks:
+                return self.tasks.popleft()
+            return None
+
+def fill(queue, count):
+    """Pre-load the queue with pending tasks"""
+    # Insert in ascending priority so the linear queue stays cheap to fill
+    for priority in sorted(random.choice(PRIORITIES) for _ in range(count)):
+        if isinstance(queue, LinearInsertQueue):
+            queue.tasks.appendleft({'id': 'fill', 'type': 'fill', 'data': {}, 'priority': priority})
+        else:
+            queue.add_task('fill', {}, priority)
+
+def measure(name, queue):
+    """Time enqueues and dequeues against a full queue"""
+    fill(queue, PENDING)
+    priorities = [random.choice(PRIORITIES) for _ in range(MEASURED)]
+    
+    start = time.perf_counter()
+    for priority in priorities:
+        queue.add_task('notification', {}, priority)
+    enqueue_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for _ in range(MEASURED):
+        queue.get_next_task()
+    dequeue_seconds = time.perf_counter() - start
+    
+    print(f"{name:<14} enqueue {MEASURED / enqueue_seconds:>12,.0f} tasks/s   "
+          f"dequeue {MEASURED / dequeue_seconds:>12,.0f} tasks/s   ({PENDING:,} pending)")
+
+def check_aging():
+    """Show that aged low-priority tasks overtake fresh high-priority ones"""
+    queue = TaskQueue(aging_seconds=0.05)
+    queue.add_task('token_cleanup', {}, priority=1)
+    time.sleep(0.5)  # Ten priority levels of aging
+    queue.add_task('plugin_execution', {}, priority=7)
+    first = queue.get_next_task()
+    print(f"aging          first task after waiting: {first['type']}")
+
+if __name__ == '__main__':
+    random.seed(42)
+    # Silence per-task logging from TaskQueue.add_task
+    import logging
+    logging.disable(logging.INFO)
+    
+    measure('before (deque)', LinearInsertQueue())
+    measure('after (heap)', TaskQueue())
+    check_aging()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Consistency check for the incremental dashboard rollups in services/transaction_rollups
+Drives transactions through Transaction.update_status, including refunds of
+completed ones and failed payments that are retried, then compares the
+rollup table with a fresh backfill scan. Uses a throwaway SQLite file unless
+DATABASE_URL points at Postgres.
+"""
+
+import sys
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+# Add src to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from flask import Flask
+from src.database.connection import db
+from src.services.transaction_rollups import rollup_writer, verify_rollups
+
+TRANSACTIONS = 500
+SEED = 7
+
+def create_check_app(database_url):
+    """Minimal app bound to the check database"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def drive_transactions(Transaction):
+    """Finish, refund and re-open transactions in random order"""
+    rng = random.Random(SEED)
+    transactions = []
+    for i in range(TRANSACTIONS):
+        transaction = Transaction(txn_id=f'CHECK_{i}', amount=rng.choice([12, 75, 240, 640, 1800]),
+                                  payment_method='qr', payment_rail=rng.choice(['duitnow', 'tng', 'boost']),
+                                  status='pending')
+        db.session.add(transaction)
+        transactions.append(transaction)
+    db.session.commit()
+    
+    for transaction in transactions:
+        transaction.update_status(rng.choice(['completed', 'completed', 'failed', 'processing']))
+    
+    # Refund some completed ones after their completed buckets were written
+    rollup_writer.flush()
+    completed = [transaction for transaction in transactions if transaction.status == 'completed']
+    for transaction in rng.sample(completed, len(completed) // 3):
+        transaction.update_status('refunded')
+    
+    # A failed payment that is retried and completes
+    for transaction in [transaction for transaction in transactions if transaction.status == 'failed'][:20]:
+        transaction.update_status('processing')
+        transaction.update_status('completed')
+    
+    return sum(1 for transaction in transactions if transaction.status == 'refunded')
+
+if __name__ == '__main__':
+    import logging
+    logging.disable(logging.WARNING)
+    
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'check_rollups.db')}"
+    print(f"Database: {database_url.split('@')[-1]}")
+    
+    app = create_check_app(database_url)
+    with app.app_context():
+        import src.models.user, src.models.qr_code, src.models.offline_token, src.models.plugin_log
+        import src.models.transaction_rollup
+        from src.models.transaction import Transaction
+        db.create_all()
+        Transaction.query.filter(Transaction.txn_id.like('CHECK_%')).delete(synchronize_session=False)
+        db.session.commit()
+        
+        refunded = drive_transactions(Transaction)
+        mismatches = verify_rollups(datetime.utcnow() - timedelta(days=3))
+        print(f"{TRANSACTIONS} transactions, {refunded} refunded, {len(mismatches)} mismatched buckets"
+              f" -> {'OK' if not mismatches else 'INCONSISTENT'}")
+        for mismatch in mismatches[:10]:
+            print(f"    {mismatch}")
+        
+        Transaction.query.filter(Transaction.txn_id.like('CHECK_%')).delete(synchronize_session=False)
+        db.session.commit()
+        sys.exit(1 if mismatches else 0)
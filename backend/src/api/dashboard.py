@@ -7,16 +7,25 @@ from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, timedelta
 from src.models.transaction import Transaction
 from src.models.user import User
-from src.models.plugin_log import PluginLog
+from src.models.plugin_log import PluginLog, plugin_log_writer
 from src.models.offline_token import OfflineToken
 from src.models.qr_code import QRCode
 from src.middleware.rate_limiter import rate_limit
+from src.middleware.response_cache import cached_response
 from src.middleware.security import require_api_key
+from src.services.transaction_rollups import AMOUNT_BUCKETS, bucket_start, read_rollups
+from src.services.system_metrics import system_metrics
+from src.database.connection import db
+from src.utils.pagination import CountCache, InvalidCursor, decode_cursor, encode_cursor, estimate_row_count
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Total counts are optional on keyset pages and shared across requests briefly
+transaction_count_cache = CountCache()
+
 @dashboard_bp.route('/overview', methods=['GET'])
 @rate_limit(per_minute=60)
+@cached_response()
 def get_overview():
     """Get dashboard overview with key metrics"""
     try:
@@ -77,11 +86,13 @@ def get_overview():
 @dashboard_bp.route('/transactions', methods=['GET'])
 @rate_limit(per_minute=100)
 def get_transactions():
-    """Get transactions with filtering and pagination"""
+    """Get transactions with filtering and keyset pagination"""
     try:
         # Query parameters
-        page = int(request.args.get('page', 1))
+        cursor = request.args.get('cursor')
+        page = request.args.get('page')
         limit = min(int(request.args.get('limit', 50)), 100)  # Max 100 per page
+        include_total = request.args.get('include_total', '').lower()
         status = request.args.get('status')
         payment_rail = request.args.get('payment_rail')
         start_date = request.args.get('start_date')
@@ -104,32 +115,52 @@ def get_transactions():
             end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
             query = query.filter(Transaction.created_at <= end_dt)
         
-        # Order and paginate
-        query = query.order_by(Transaction.created_at.desc())
-        offset = (page - 1) * limit
-        transactions = query.offset(offset).limit(limit).all()
+        filters_applied = {
+            'status': status,
+            'payment_rail': payment_rail,
+            'start_date': start_date,
+            'end_date': end_date
+        }
         
-        # Get total count for pagination
-        total_count = query.count()
-        total_pages = (total_count + limit - 1) // limit
+        # Deprecated page numbers keep their OFFSET behaviour for old clients
+        if page and not cursor:
+            return get_transactions_page(query, int(page), limit, filters_applied)
+        
+        # Newest first; id breaks ties between rows created in the same instant
+        ordered = query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_cursor(cursor)
+            except InvalidCursor as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.utcnow().isoformat()
+                }), 400
+            ordered = ordered.filter(
+                db.tuple_(Transaction.created_at, Transaction.id) < db.tuple_(cursor_created_at, cursor_id)
+            )
+        
+        # One extra row tells whether another page follows
+        transactions = ordered.limit(limit + 1).all()
+        has_next = len(transactions) > limit
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1].created_at, transactions[-1].id) if has_next else None
+        
+        pagination = {
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'has_next': has_next,
+            'has_prev': bool(cursor)
+        }
+        if include_total in ('true', 'exact', 'estimate'):
+            pagination.update(count_transactions(query, filters_applied, include_total == 'estimate'))
         
         return jsonify({
             'success': True,
             'transactions': [txn.to_dict() for txn in transactions],
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total_count': total_count,
-                'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
-            },
-            'filters_applied': {
-                'status': status,
-                'payment_rail': payment_rail,
-                'start_date': start_date,
-                'end_date': end_date
-            },
+            'pagination': pagination,
+            'filters_applied': filters_applied,
             'timestamp': datetime.utcnow().isoformat()
         }), 200
         
@@ -142,6 +173,49 @@ def get_transactions():
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
+def get_transactions_page(query, page, limit, filters_applied):
+    """Page-number pagination with OFFSET, kept for clients that still send page"""
+    query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+    offset = (page - 1) * limit
+    transactions = query.offset(offset).limit(limit).all()
+    
+    # Get total count for pagination
+    total_count, _ = transaction_count_cache.get_or_compute(
+        tuple(sorted(filters_applied.items())), lambda: query.order_by(None).count()
+    )
+    total_pages = (total_count + limit - 1) // limit
+    
+    return jsonify({
+        'success': True,
+        'transactions': [txn.to_dict() for txn in transactions],
+        'pagination': {
+            'page': page,
+            'limit': limit,
+            'total_count': total_count,
+            'total_pages': total_pages,
+            'has_next': page < total_pages,
+            'has_prev': page > 1
+        },
+        'filters_applied': filters_applied,
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
+def count_transactions(query, filters_applied, allow_estimate=False):
+    """Total matching transactions: a planner estimate or a briefly cached exact count"""
+    if allow_estimate and not any(filters_applied.values()):
+        estimate = estimate_row_count(Transaction.__tablename__)
+        if estimate is not None:
+            return {'total_count': estimate, 'total_count_estimated': True}
+    
+    total_count, age = transaction_count_cache.get_or_compute(
+        tuple(sorted(filters_applied.items())), lambda: query.order_by(None).count()
+    )
+    return {
+        'total_count': total_count,
+        'total_count_estimated': False,
+        'total_count_age_seconds': round(age, 1)
+    }
+
 @dashboard_bp.route('/transactions/stats', methods=['GET'])
 @rate_limit(per_minute=30)
 def get_transaction_stats():
@@ -149,25 +223,30 @@ def get_transaction_stats():
     try:
         # Time range filter
         days = int(request.args.get('days', 7))
+        interval = 'hour' if request.args.get('interval') == 'hour' else 'day'
         start_date = datetime.utcnow() - timedelta(days=days)
         
         # Base statistics
         stats = Transaction.get_transaction_stats()
         
-        # Time-series data (daily breakdown)
-        daily_stats = get_daily_transaction_stats(start_date)
+        # Pre-aggregated buckets: reads scale with the window, not the table
+        rollups = read_rollups(interval, start_date)
+        
+        # Time-series data (daily or hourly breakdown)
+        bucket_stats = get_daily_transaction_stats(start_date, rollups, interval)
         
         # Payment rail breakdown
-        rail_stats = get_payment_rail_stats()
+        rail_stats = get_payment_rail_stats(rollups)
         
         # Amount distribution
-        amount_distribution = get_amount_distribution()
+        amount_distribution = get_amount_distribution(rollups)
         
         return jsonify({
             'success': True,
             'period_days': days,
+            'interval': interval,
             'overall_stats': stats,
-            'daily_breakdown': daily_stats,
+            f'{"hourly" if interval == "hour" else "daily"}_breakdown': bucket_stats,
             'payment_rails': rail_stats,
             'amount_distribution': amount_distribution,
             'timestamp': datetime.utcnow().isoformat()
@@ -182,6 +261,34 @@ def get_transaction_stats():
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
+@dashboard_bp.route('/rollups/backfill', methods=['POST'])
+@rate_limit(per_minute=5)
+def backfill_transaction_rollups():
+    """Queue a rebuild of the dashboard rollups from the transactions table"""
+    try:
+        from src.task_queue.task_queue import task_queue
+        
+        data = request.get_json(silent=True) or {}
+        days = int(data.get('days', request.args.get('days', 1)))
+        task_id = task_queue.add_task('rollup_backfill', {'days': days}, priority=1)
+        
+        return jsonify({
+            'success': True,
+            'task_id': task_id,
+            'days': days,
+            'message': f'Rollup backfill for the last {days} days queued',
+            'timestamp': datetime.utcnow().isoformat()
+        }), 202
+        
+    except Exception as e:
+        current_app.logger.error(f"Rollup backfill error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to queue rollup backfill',
+            'message': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 500
+
 @dashboard_bp.route('/logs', methods=['GET'])
 @rate_limit(per_minute=100)
 def get_plugin_logs():
@@ -243,12 +350,13 @@ def get_plugin_logs():
 def get_plugins_status():
     """Get plugins status and configuration"""
     try:
-        from src.plugins.plugin_manager import PluginManager
+        from src.plugins.plugin_manager import get_plugin_manager
         
-        plugin_manager = PluginManager()
+        plugin_manager = get_plugin_manager()
         
         # Get plugin information
         plugins_info = plugin_manager.get_all_plugins_info()
+        load_metrics = plugin_manager.get_load_metrics()
         
         # Get plugin statistics
         plugin_stats = plugin_manager.get_plugin_stats()
@@ -259,6 +367,8 @@ def get_plugins_status():
         return jsonify({
             'success': True,
             'plugins': plugins_info,
+            'load_metrics': load_metrics,
+            'log_writer': plugin_log_writer.get_stats(),
             'statistics': plugin_stats,
             'recent_errors': [log.to_dict() for log in error_logs],
             'timestamp': datetime.utcnow().isoformat()
@@ -278,12 +388,12 @@ def get_plugins_status():
 def toggle_plugin(plugin_name):
     """Enable or disable a plugin"""
     try:
-        from src.plugins.plugin_manager import PluginManager
+        from src.plugins.plugin_manager import get_plugin_manager
         
         data = request.get_json()
         enable = data.get('enable', True)
         
-        plugin_manager = PluginManager()
+        plugin_manager = get_plugin_manager()
         
         if enable:
             success = plugin_manager.enable_plugin(plugin_name)
@@ -316,6 +426,33 @@ def toggle_plugin(plugin_name):
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
+@dashboard_bp.route('/plugins/reload', methods=['POST'])
+@rate_limit(per_minute=5)
+def reload_plugins():
+    """Hot-reload all plugins without restarting the service"""
+    try:
+        from src.plugins.plugin_manager import get_plugin_manager
+        
+        plugin_manager = get_plugin_manager()
+        load_metrics = plugin_manager.reload_plugins()
+        
+        return jsonify({
+            'success': True,
+            'plugins': plugin_manager.get_all_plugins_info(),
+            'load_metrics': load_metrics,
+            'message': 'Plugins reloaded successfully',
+            'timestamp': datetime.utcnow().isoformat()
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"Plugin reload error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to reload plugins',
+            'message': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 500
+
 @dashboard_bp.route('/tokens', methods=['GET'])
 @rate_limit(per_minute=60)
 def get_tokens():
@@ -433,16 +570,17 @@ def get_users():
 def get_system_health():
     """Get system health metrics"""
     try:
-        import psutil
+        snapshot = system_metrics.latest()
         
         return {
             'status': 'healthy',
-            'cpu_percent': psutil.cpu_percent(),
-            'memory_percent': psutil.virtual_memory().percent,
-            'disk_percent': psutil.disk_usage('/').percent,
-            'uptime_hours': psutil.boot_time(),
-            'active_connections': len(psutil.net_connections()),
-            'database_status': 'connected'  # Simplified for demo
+            'cpu_percent': snapshot['cpu_percent'],
+            'memory_percent': snapshot['memory_percent'],
+            'disk_percent': snapshot['disk_percent'],
+            'uptime_hours': round(snapshot['uptime_seconds'] / 3600, 2),
+            'active_connections': snapshot['active_connections'],
+            'database_status': 'connected' if snapshot['database']['status'] == 'healthy' else 'error',
+            'database_latency_ms': snapshot['database'].get('latency_ms')
         }
     except:
         return {
@@ -450,49 +588,75 @@ def get_system_health():
             'error': 'Unable to fetch system metrics'
         }
 
-def get_daily_transaction_stats(start_date):
-    """Get daily transaction statistics"""
-    # This would typically use database aggregation
-    # For demo, return mock data
-    daily_stats = []
-    current_date = start_date
+def get_daily_transaction_stats(start_date, rollups, interval='day'):
+    """Get per-day (or per-hour) transaction statistics from rollup buckets"""
+    step = timedelta(hours=1) if interval == 'hour' else timedelta(days=1)
+    buckets = {}
+    for rollup in rollups:
+        bucket = buckets.setdefault(rollup.bucket_start, {'total': 0, 'completed': 0, 'failed': 0, 'volume': 0.0})
+        bucket['total'] += rollup.transaction_count
+        if rollup.status == 'completed':
+            bucket['completed'] += rollup.transaction_count
+            bucket['volume'] += float(rollup.total_amount)
+        elif rollup.status == 'failed':
+            bucket['failed'] += rollup.transaction_count
     
-    while current_date <= datetime.utcnow():
-        daily_stats.append({
-            'date': current_date.strftime('%Y-%m-%d'),
-            'total_transactions': 45,  # Mock data
-            'completed_transactions': 42,
-            'failed_transactions': 3,
-            'total_volume': 15420.50,
-            'average_amount': 342.68
+    # One entry per bucket in the window, including empty ones
+    bucket_stats = []
+    current = bucket_start(start_date, interval)
+    while current <= datetime.utcnow():
+        bucket = buckets.get(current, {'total': 0, 'completed': 0, 'failed': 0, 'volume': 0.0})
+        bucket_stats.append({
+            'date': current.strftime('%Y-%m-%d') if interval == 'day' else current.isoformat(),
+            'total_transactions': bucket['total'],
+            'completed_transactions': bucket['completed'],
+            'failed_transactions': bucket['failed'],
+            'total_volume': round(bucket['volume'], 2),
+            'average_amount': round(bucket['volume'] / bucket['completed'], 2) if bucket['completed'] else 0
         })
-        current_date += timedelta(days=1)
+        current += step
     
-    return daily_stats
+    return bucket_stats
 
-def get_payment_rail_stats():
-    """Get payment rail statistics"""
-    # Mock data for demo
-    return {
-        'duitnow': {'count': 245, 'volume': 45620.30, 'avg_time_ms': 2100},
-        'paynow': {'count': 156, 'volume': 28340.50, 'avg_time_ms': 2800},
-        'boost': {'count': 189, 'volume': 12450.75, 'avg_time_ms': 1200},
-        'tng': {'count': 203, 'volume': 18750.25, 'avg_time_ms': 1500},
-        'cross_wallet_routing': {'count': 45, 'volume': 8950.40, 'avg_time_ms': 3200}
-    }
+def get_payment_rail_stats(rollups):
+    """Get payment rail statistics from rollup buckets"""
+    rail_stats = {}
+    for rollup in rollups:
+        rail = rail_stats.setdefault(rollup.payment_rail, {'count': 0, 'completed': 0, 'volume': 0.0})
+        rail['count'] += rollup.transaction_count
+        if rollup.status == 'completed':
+            rail['completed'] += rollup.transaction_count
+            rail['volume'] += float(rollup.total_amount)
+    
+    for rail in rail_stats.values():
+        rail['volume'] = round(rail['volume'], 2)
+    return rail_stats
 
-def get_amount_distribution():
-    """Get transaction amount distribution"""
-    # Mock data for demo
+def get_amount_distribution(rollups):
+    """Get transaction amount distribution from rollup buckets"""
+    counts = {label: 0 for _, label in AMOUNT_BUCKETS}
+    total_volume = 0.0
+    for rollup in rollups:
+        counts[rollup.amount_bucket] = counts.get(rollup.amount_bucket, 0) + rollup.transaction_count
+        total_volume += float(rollup.total_amount)
+    
+    total = sum(counts.values())
+    ranges = []
+    median_range = None
+    cumulative = 0
+    for label, count in counts.items():
+        cumulative += count
+        if median_range is None and total and cumulative * 2 >= total:
+            median_range = label
+        ranges.append({
+            'range': label,
+            'count': count,
+            'percentage': round(count / total * 100, 1) if total else 0
+        })
+    
     return {
-        'ranges': [
-            {'range': '0-50', 'count': 456, 'percentage': 45.6},
-            {'range': '51-200', 'count': 289, 'percentage': 28.9},
-            {'range': '201-500', 'count': 145, 'percentage': 14.5},
-            {'range': '501-1000', 'count': 78, 'percentage': 7.8},
-            {'range': '1000+', 'count': 32, 'percentage': 3.2}
-        ],
-        'average_amount': 245.67,
-        'median_amount': 125.50,
-        'total_volume': 245670.89
-    } 
\ No newline at end of file
+        'ranges': ranges,
+        'average_amount': round(total_volume / total, 2) if total else 0,
+        'median_range': median_range,
+        'total_volume': round(total_volume, 2)
+    }
@@ -2,13 +2,14 @@
 Health check API for SatuPay Payment Switch
 """
 
-import psutil
 import time
 from datetime import datetime
-from flask import Blueprint, jsonify, current_app
-from sqlalchemy import text
-from src.database.connection import db, test_supabase_connection
-from src.middleware.rate_limiter import rate_limit
+from flask import Blueprint, request, jsonify, current_app
+from src.middleware.rate_limiter import rate_limit, get_rate_limit_stats
+from src.middleware.idempotency import idempotency_store
+from src.middleware.response_cache import response_cache
+from src.services.settlement_engine import settlement_engine
+from src.services.system_metrics import system_metrics
 
 health_bp = Blueprint('health', __name__)
 
@@ -28,23 +29,22 @@ def health_check():
             'version': '1.0.0'
         }
         
-        # Test database connection
-        try:
-            with db.engine.connect() as connection:
-                connection.execute(text('SELECT 1'))
+        # Database and Supabase state from the latest background sample
+        snapshot = system_metrics.latest()
+        database = snapshot['database']
+        if database['status'] == 'healthy':
             health_status['database'] = 'connected'
-        except Exception as e:
+        else:
             health_status['database'] = 'error'
-            health_status['database_error'] = str(e)
+            health_status['database_error'] = database.get('message')
             health_status['status'] = 'unhealthy'
         
-        # Test Supabase connection
-        try:
-            supabase_status = test_supabase_connection()
-            health_status['supabase'] = 'connected' if supabase_status else 'error'
-        except Exception as e:
-            health_status['supabase'] = 'error'
-            health_status['supabase_error'] = str(e)
+        supabase = snapshot['supabase']
+        health_status['supabase'] = 'connected' if supabase['status'] == 'healthy' else supabase['status']
+        if supabase.get('message'):
+            health_status['supabase_error'] = supabase['message']
+        health_status['sample_age_seconds'] = snapshot['age_seconds']
+        health_status['sample_stale'] = snapshot['stale']
         
         # Response time
         response_time = round((time.time() - start_time) * 1000, 2)
@@ -68,6 +68,10 @@ def detailed_health_check():
     """Detailed health check with system metrics"""
     try:
         start_time = time.time()
+        history_seconds = min(float(request.args.get('history', 0)), 3600)  # trend window, max 1 hour
+        
+        # Latest background sample; nothing here blocks on psutil or the network
+        snapshot = system_metrics.latest()
         
         # Basic health info
         health_data = {
@@ -75,62 +79,62 @@ def detailed_health_check():
             'timestamp': datetime.utcnow().isoformat(),
             'service': 'SatuPay Payment Switch',
             'version': '1.0.0',
-            'uptime_seconds': time.time() - psutil.boot_time(),
+            'uptime_seconds': snapshot['uptime_seconds'],
             'checks': {}
         }
         
         # Database connectivity
-        try:
-            with db.engine.connect() as connection:
-                connection.execute(text('SELECT 1'))
+        database = snapshot['database']
+        if database['status'] == 'healthy':
             health_data['checks']['database'] = {
                 'status': 'healthy',
-                'message': 'Database connection successful'
+                'message': 'Database connection successful',
+                'latency_ms': database['latency_ms']
             }
-        except Exception as e:
+        else:
             health_data['checks']['database'] = {
                 'status': 'error',
-                'message': str(e)
+                'message': database.get('message')
             }
             health_data['status'] = 'unhealthy'
         
         # Supabase connectivity
-        try:
-            supabase_healthy = test_supabase_connection()
-            health_data['checks']['supabase'] = {
-                'status': 'healthy' if supabase_healthy else 'error',
-                'message': 'Supabase connection successful' if supabase_healthy else 'Supabase connection failed'
-            }
-        except Exception as e:
-            health_data['checks']['supabase'] = {
-                'status': 'error',
-                'message': str(e)
-            }
+        supabase = snapshot['supabase']
+        supabase_healthy = supabase['status'] == 'healthy'
+        health_data['checks']['supabase'] = {
+            'status': supabase['status'],
+            'message': supabase.get('message') or ('Supabase connection successful' if supabase_healthy else 'Supabase connection failed'),
+            'checked_at': supabase.get('checked_at')
+        }
         
         # System metrics
         try:
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            
             health_data['system_metrics'] = {
-                'cpu_usage_percent': cpu_percent,
-                'memory_usage_percent': memory.percent,
-                'memory_available_mb': round(memory.available / 1024 / 1024, 2),
-                'disk_usage_percent': disk.percent,
-                'disk_free_gb': round(disk.free / 1024 / 1024 / 1024, 2)
+                'cpu_usage_percent': snapshot['cpu_percent'],
+                'memory_usage_percent': snapshot['memory_percent'],
+                'memory_available_mb': snapshot['memory_available_mb'],
+                'disk_usage_percent': snapshot['disk_percent'],
+                'disk_free_gb': snapshot['disk_free_gb'],
+                'active_connections': snapshot['active_connections'],
+                'sampled_at': snapshot['timestamp'],
+                'sample_age_seconds': snapshot['age_seconds'],
+                'stale': snapshot['stale']
             }
             
+            if snapshot['stale']:
+                health_data['warnings'] = health_data.get('warnings', [])
+                health_data['warnings'].append('System metrics sample is stale')
+            
             # Set warnings for high resource usage
-            if cpu_percent > 80:
+            if snapshot['cpu_percent'] > 80:
                 health_data['warnings'] = health_data.get('warnings', [])
                 health_data['warnings'].append('High CPU usage detected')
             
-            if memory.percent > 85:
+            if snapshot['memory_percent'] > 85:
                 health_data['warnings'] = health_data.get('warnings', [])
                 health_data['warnings'].append('High memory usage detected')
             
-            if disk.percent > 90:
+            if snapshot['disk_percent'] > 90:
                 health_data['warnings'] = health_data.get('warnings', [])
                 health_data['warnings'].append('Low disk space detected')
                 
@@ -165,6 +169,23 @@ def detailed_health_check():
             }
             health_data['status'] = 'unhealthy'
         
+        # Short trend windows for graphs, e.g. ?history=300
+        if history_seconds > 0:
+            health_data['history'] = system_metrics.history(history_seconds)
+        health_data['metrics_sampler'] = system_metrics.get_stats()
+        
+        # Per-endpoint rate limiter state
+        health_data['rate_limits'] = get_rate_limit_stats()
+        
+        # Idempotency key hits and waits
+        health_data['idempotency'] = idempotency_store.get_stats()
+        
+        # Dashboard response cache hits and coalesced requests
+        health_data['response_cache'] = response_cache.get_stats()
+        
+        # Settlement throughput and lock conflicts
+        health_data['settlement'] = settlement_engine.get_metrics()
+        
         # Response time
         health_data['response_time_ms'] = round((time.time() - start_time) * 1000, 2)
         
@@ -198,12 +219,8 @@ def readiness_check():
         checks = {}
         
         # Database readiness
-        try:
-            with db.engine.connect() as connection:
-                connection.execute(text('SELECT 1'))
-            checks['database'] = True
-        except:
-            checks['database'] = False
+        checks['database'] = system_metrics.latest()['database']['status'] == 'healthy'
+        if not checks['database']:
             ready = False
         
         # Check critical models can be imported
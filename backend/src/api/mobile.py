@@ -7,13 +7,19 @@ import secrets
 import hashlib
 import hmac
 import json
+import uuid
+from collections import defaultdict
 from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
 from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import case, func, insert, update
 from src.models.user import User
 from src.models.offline_token import OfflineToken
 from src.models.transaction import Transaction
-from src.utils.crypto import generate_signature, verify_signature
+from src.utils.crypto import generate_signature, verify_signature, verify_many
 from src.middleware.rate_limiter import rate_limit
+from src.middleware.idempotency import idempotent
+from src.services.settlement_engine import settlement_engine, SettlementError
 
 mobile_bp = Blueprint('mobile', __name__)
 
@@ -162,8 +168,11 @@ def get_user_tokens(user_id):
 
 @mobile_bp.route('/verify-payment', methods=['POST'])
 @rate_limit(per_minute=30)
+@idempotent
 def verify_offline_payment():
     """Verify offline payment token and process settlement"""
+    from src.database.connection import db
+
     try:
         data = request.get_json()
         payment_payload = data.get('payment_payload')
@@ -186,57 +195,49 @@ def verify_offline_payment():
         if token.is_expired():
             return jsonify({'success': False, 'message': 'Token has expired'}), 400
 
-        if float(amount) > float(token.remaining_amount):
-            return jsonify({'success': False, 'message': 'Amount exceeds token limit'}), 400
-
         # Verify cryptographic signature
-        if not verify_signature(payment_payload, token.signature):
+        if not verify_signature(_signed_payload_string(payment_payload), token.signature):
             return jsonify({'success': False, 'message': 'Invalid signature'}), 400
 
+        # The signed payload, not the request, says which token and device this is
+        amount, payee_id, error = _payment_terms(_parse_signed_payload(payment_payload), data, token)
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+
+        remaining = token.remaining_amount if token.remaining_amount is not None else token.amount
+        if amount > Decimal(str(remaining)):
+            return jsonify({'success': False, 'message': 'Amount exceeds token limit'}), 400
+
         # Check payer's current balance
         payer = User.query.get(token.user_id)
         if not payer:
             return jsonify({'success': False, 'message': 'Payer not found'}), 404
 
-        if float(amount) > float(payer.balance):
+        if amount > Decimal(str(payer.balance)):
             return jsonify({'success': False, 'message': 'Insufficient payer balance'}), 400
 
-        # Process settlement through PSP (simulated)
+        def record_payment():
+            """Spend the token and write the ledger row in the settlement's transaction"""
+            if not _spend_token(token.id, amount):
+                raise SettlementError('Amount exceeds token limit')
+            db.session.execute(insert(Transaction.__table__), [transaction_row])
+
+        # Process settlement through PSP (simulated); balances, token and
+        # transaction commit together or not at all
+        settlement_id = f"SETTLE_{secrets.token_hex(8).upper()}"
+        transaction_row = _offline_transaction_row(
+            token, amount, payee_id, payer_device_id, settlement_id, datetime.now(timezone.utc))
         settlement_result = process_psp_settlement(
-            token.user_id, payee_id, amount)
+            token.user_id, payee_id, amount, settlement_id, within=record_payment)
 
         if settlement_result['success']:
-            # Update token remaining amount
-            token.remaining_amount -= float(amount)
-            if token.remaining_amount <= 0:
-                token.status = 'used'
-
-            # Create transaction record
-            transaction = Transaction(
-                txn_id=f"OFFLINE_{secrets.token_hex(8).upper()}",
-                user_id=token.user_id,
-                amount=amount,
-                currency='MYR',
-                payment_method='offline_token',
-                payment_rail='p2p',
-                status='completed',
-                completed_at=datetime.now(timezone.utc),
-                transaction_metadata={
-                    'token_id': token_id,
-                    'payee_id': payee_id,
-                    'payer_device_id': payer_device_id,
-                    'settlement_id': settlement_result['settlement_id']
-                }
-            )
-
-            from src.database.connection import db
-            db.session.add(transaction)
-            db.session.commit()
+            db.session.refresh(token)
+            _record_settled([transaction_row])
 
             return jsonify({
                 'success': True,
                 'settlement_id': settlement_result['settlement_id'],
-                'transaction_id': transaction.txn_id,
+                'transaction_id': transaction_row['txn_id'],
                 'remaining_amount': float(token.remaining_amount),
                 'message': 'Payment verified and settled successfully'
             })
@@ -245,7 +246,7 @@ def verify_offline_payment():
                 'success': False,
                 'message': 'Settlement failed',
                 'error': settlement_result['error']
-            }), 500
+            }), 400 if settlement_result.get('rejected') else 500
 
     except Exception as e:
         current_app.logger.error(f"Error verifying payment: {str(e)}")
@@ -254,6 +255,7 @@ def verify_offline_payment():
 
 @mobile_bp.route('/sync-transactions', methods=['POST'])
 @rate_limit(per_minute=20)
+@idempotent
 def sync_offline_transactions():
     """Sync pending offline transactions"""
     try:
@@ -264,32 +266,21 @@ def sync_offline_transactions():
         if not user_id:
             return jsonify({'success': False, 'message': 'User ID required'}), 400
 
-        synced_count = 0
-        errors = []
+        # Validate and settle the whole batch with set-based queries
+        results = settle_offline_batch(pending_transactions)
 
-        for tx_data in pending_transactions:
-            try:
-                # Verify transaction with server
-                verification_result = verify_offline_payment_internal(tx_data)
-
-                if verification_result['success']:
-                    synced_count += 1
-                else:
-                    errors.append({
-                        'transaction_id': tx_data.get('transaction_id'),
-                        'error': verification_result['message']
-                    })
-            except Exception as e:
-                errors.append({
-                    'transaction_id': tx_data.get('transaction_id'),
-                    'error': str(e)
-                })
+        errors = [{
+            'transaction_id': result['transaction_id'],
+            'error': result['message']
+        } for result in results if not result['success']]
+        synced_count = len(results) - len(errors)
 
         return jsonify({
             'success': True,
             'synced_count': synced_count,
             'error_count': len(errors),
             'errors': errors,
+            'results': results,
             'message': f'Synced {synced_count} transactions'
         })
 
@@ -298,42 +289,314 @@ def sync_offline_transactions():
         return jsonify({'success': False, 'message': 'Failed to sync transactions'}), 500
 
 
-def process_psp_settlement(payer_id, payee_id, amount):
-    """Simulate PSP settlement process"""
+def _signed_payload_string(payment_payload):
+    """Canonical string form of a payment payload as it was signed"""
+    if isinstance(payment_payload, str):
+        return payment_payload
+    return json.dumps(payment_payload or {}, sort_keys=True)
+
+
+def _parse_signed_payload(payment_payload):
+    """Fields of a payment payload; empty when it is not a JSON object"""
+    if isinstance(payment_payload, str):
+        try:
+            payment_payload = json.loads(payment_payload)
+        except ValueError:
+            return {}
+    return payment_payload if isinstance(payment_payload, dict) else {}
+
+
+def _payment_terms(signed, item, token):
+    """Resolve (amount, payee_id, error) for a payment against a payload signed for token.
+
+    The signed payload decides the token, owner and device; request fields
+    may only repeat them. A payee and amount in the signed payload are used
+    as-is, otherwise the requested amount must fit within the signed amount.
+    """
+    if str(signed.get('token_id')) != token.token_id or _as_uuid(signed.get('user_id')) != token.user_id:
+        return None, None, 'Payload does not match token'
+    if item.get('token_id') and item.get('token_id') != token.token_id:
+        return None, None, 'Payload does not match token'
+    if signed.get('device_id') != token.device_id or item.get('payer_device_id') != token.device_id:
+        return None, None, 'Payer device does not match token'
+
+    signed_payee = signed.get('payee_id') or signed.get('recipient_id')
+    if signed_payee:
+        if item.get('payee_id') and _as_uuid(item.get('payee_id')) != _as_uuid(signed_payee):
+            return None, None, 'Payload does not match payee'
+        payee_id, amount = signed_payee, signed.get('amount')
+    else:
+        payee_id, amount = item.get('payee_id'), item.get('amount')
+
     try:
-        # In real implementation, this would call the actual PSP
-        # For demo, we'll simulate the settlement
+        amount = Decimal(str(amount))
+        limit = Decimal(str(signed.get('amount', token.amount)))
+    except (InvalidOperation, ValueError):
+        return None, None, 'Invalid amount'
+    if not amount.is_finite() or amount <= 0:
+        return None, None, 'Invalid amount'
+    if amount > limit:
+        return None, None, 'Amount exceeds token limit'
 
-        payer = User.query.get(payer_id)
-        payee = User.query.get(payee_id)
+    if not payee_id:
+        return None, None, 'Missing required fields'
+    if _as_uuid(payee_id) is None:
+        return None, None, 'Invalid payee'
 
-        if not payer or not payee:
-            return {'success': False, 'error': 'User not found'}
+    return amount, _as_uuid(payee_id), None
 
-        # Simulate PSP processing
-        settlement_id = f"SETTLE_{secrets.token_hex(8).upper()}"
 
-        # Update balances (in real implementation, PSP would handle this)
-        payer.balance -= float(amount)
-        payee.balance += float(amount)
+def process_psp_settlement(payer_id, payee_id, amount, settlement_id=None, within=None):
+    """Simulate PSP settlement process"""
+    try:
+        # In real implementation, this would call the actual PSP
+        # For demo, the settlement engine moves the balances atomically
+        balances = settlement_engine.settle(payer_id, payee_id, amount, within=within)
 
-        from src.database.connection import db
-        db.session.commit()
+        # Simulate PSP processing
+        settlement_id = settlement_id or f"SETTLE_{secrets.token_hex(8).upper()}"
 
         return {
             'success': True,
             'settlement_id': settlement_id,
-            'payer_new_balance': float(payer.balance),
-            'payee_new_balance': float(payee.balance)
+            'payer_new_balance': balances['payer_new_balance'],
+            'payee_new_balance': balances['payee_new_balance']
         }
 
+    except SettlementError as e:
+        return {'success': False, 'rejected': True, 'error': str(e)}
     except Exception as e:
         current_app.logger.error(f"PSP settlement error: {str(e)}")
         return {'success': False, 'error': str(e)}
 
 
+def _spend_token(token_pk, amount):
+    """Take amount off a token's remaining balance, only while it covers it; returns whether it did"""
+    from src.database.connection import db
+
+    tokens_table = OfflineToken.__table__
+    remaining = func.coalesce(tokens_table.c.remaining_amount, tokens_table.c.amount)
+    result = db.session.execute(
+        update(tokens_table)
+        .where(tokens_table.c.id == token_pk, remaining >= amount)
+        .values(
+            remaining_amount=remaining - amount,
+            status=case((remaining - amount <= 0, 'used'), else_=tokens_table.c.status)
+        )
+    )
+    return result.rowcount == 1
+
+
+def _settle_items(settled):
+    """Settle accepted batch items one savepoint each; returns the rows that were written.
+
+    Items whose balance or token update no longer matches are rolled back
+    on their own and reported with the reason, the rest commit together.
+    """
+    from src.database.connection import db
+
+    written = []
+    try:
+        for result, token_pk, payee_id, row in settled:
+            try:
+                with db.session.begin_nested():
+                    settlement_engine.apply_balance_deltas({row['user_id']: -row['amount'], payee_id: row['amount']})
+                    if not _spend_token(token_pk, row['amount']):
+                        raise SettlementError('Amount exceeds token limit')
+                    db.session.execute(insert(Transaction.__table__), [row])
+                written.append(row)
+            except SettlementError as e:
+                result.update({'success': False, 'message': str(e)})
+                for key in ('txn_id', 'settlement_id', 'remaining_amount'):
+                    result.pop(key, None)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Offline batch settlement failed: {str(e)}")
+        for result, _, _, _ in settled:
+            if result['success']:
+                result.update({'success': False, 'message': 'Settlement failed'})
+        return []
+
+    return written
+
+
+def _offline_transaction_row(token, amount, payee_id, payer_device_id, settlement_id, completed_at,
+                             client_transaction_id=None):
+    """Transaction row for a settled offline payment, ready for a Core insert"""
+    metadata = {
+        'token_id': token.token_id,
+        'payee_id': str(payee_id),
+        'payer_device_id': payer_device_id,
+        'settlement_id': settlement_id
+    }
+    if client_transaction_id is not None:
+        metadata['client_transaction_id'] = client_transaction_id
+
+    return {
+        'id': uuid.uuid4(),
+        'txn_id': f"OFFLINE_{secrets.token_hex(8).upper()}",
+        'user_id': token.user_id,
+        'amount': amount,
+        'currency': 'MYR',
+        'payment_method': 'offline_token',
+        'payment_rail': 'p2p',
+        'status': 'completed',
+        'completed_at': completed_at,
+        'transaction_metadata': metadata
+    }
+
+
+def _record_settled(rows):
+    """Feed committed offline payments, as inserted transaction rows, to the risk windows and rollups"""
+    from src.services.user_activity_store import user_activity_store
+    from src.services.transaction_rollups import rollup_writer
+    for row in rows:
+        user_activity_store.record(row['user_id'], float(row['amount']), row['completed_at'])
+        rollup_writer.record(row['status'], row['payment_rail'], row['amount'], row['completed_at'])
+
+
 def verify_offline_payment_internal(tx_data):
     """Internal function to verify offline payment"""
-    # This would contain the same logic as verify_offline_payment
-    # but without the HTTP response handling
-    pass
+    return settle_offline_batch([tx_data])[0]
+
+
+def _as_uuid(value):
+    """Parse a UUID, returning None for malformed values"""
+    try:
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def settle_offline_batch(items):
+    """Verify and settle a batch of offline payments; returns one result per item.
+
+    Each item's payload is verified against the stored signature of the
+    token it names, so token, owner and device come from what the server
+    signed. Tokens and users are fetched with one IN query each, signatures
+    are verified in one pass, and items are validated in order against running
+    token and balance totals. Balance deltas are then applied per user,
+    token spend per token, and transactions inserted, all in one database
+    transaction. Balance and token updates are conditional, so when a
+    concurrent sync spent the same money first the batch is settled again
+    item by item and only the items that no longer fit fail. Items that
+    fail validation are reported and skipped.
+    """
+    from src.database.connection import db
+
+    results = [{
+        'transaction_id': item.get('transaction_id'),
+        'success': False,
+        'message': None
+    } for item in items]
+
+    # Load the tokens the signed payloads name
+    signed_payloads = [_parse_signed_payload(item.get('payment_payload')) for item in items]
+    token_ids = {str(signed['token_id']) for signed in signed_payloads if signed.get('token_id')}
+    tokens = {token.token_id: token for token in OfflineToken.query.filter(
+        OfflineToken.token_id.in_(token_ids)).all()} if token_ids else {}
+    item_tokens = [tokens.get(str(signed.get('token_id'))) for signed in signed_payloads]
+
+    # Check every payload against its token's stored signature in one pass
+    signatures_valid = verify_many(
+        [_signed_payload_string(item.get('payment_payload')) for item in items],
+        [token.signature if token else '' for token in item_tokens]
+    )
+    terms = [_payment_terms(signed, item, token) if token and signature_valid else (None, None, None)
+             for signed, item, token, signature_valid in zip(signed_payloads, items, item_tokens, signatures_valid)]
+
+    user_ids = {token.user_id for token in tokens.values()}
+    user_ids.update(payee_id for _, payee_id, _ in terms if payee_id)
+    users = {user.id: user for user in User.query.filter(
+        User.id.in_(user_ids)).all()} if user_ids else {}
+
+    token_remaining = {token_id: Decimal(token.remaining_amount if token.remaining_amount is not None else token.amount)
+                       for token_id, token in tokens.items()}
+    balances = {user_id: Decimal(user.balance or 0) for user_id, user in users.items()}
+    balance_deltas = defaultdict(Decimal)
+    token_spend = defaultdict(Decimal)
+    transaction_rows = []
+    settled = []  # (result, token pk, payee id, transaction row) per accepted item
+    now = datetime.now(timezone.utc)
+
+    for item, result, token, signature_valid, (amount, payee_id, error) in zip(
+            items, results, item_tokens, signatures_valid, terms):
+        if not all([item.get('payment_payload'), item.get('payer_device_id')]):
+            result['message'] = 'Missing required fields'
+        elif not token:
+            result['message'] = 'Token not found'
+        elif not signature_valid:
+            result['message'] = 'Invalid signature'
+        elif error:
+            result['message'] = error
+        elif token.status != 'active':
+            result['message'] = 'Token is not active'
+        elif token.is_expired():
+            result['message'] = 'Token has expired'
+        elif amount > token_remaining[token.token_id]:
+            result['message'] = 'Amount exceeds token limit'
+        elif token.user_id not in users:
+            result['message'] = 'Payer not found'
+        elif payee_id not in users:
+            result['message'] = 'Payee not found'
+        elif payee_id == token.user_id:
+            result['message'] = 'Payer and payee must differ'
+        elif amount > balances[token.user_id]:
+            result['message'] = 'Insufficient payer balance'
+
+        if result['message']:
+            continue
+
+        # Apply to the running totals so later items see earlier ones
+        token_remaining[token.token_id] -= amount
+        token_spend[token.id] += amount
+        balances[token.user_id] -= amount
+        balances[payee_id] += amount
+        balance_deltas[token.user_id] -= amount
+        balance_deltas[payee_id] += amount
+
+        settlement_id = f"SETTLE_{secrets.token_hex(8).upper()}"
+        transaction_rows.append(_offline_transaction_row(
+            token, amount, payee_id, item.get('payer_device_id'), settlement_id, now,
+            client_transaction_id=item.get('transaction_id')))
+        settled.append((result, token.id, payee_id, transaction_rows[-1]))
+        result.update({
+            'success': True,
+            'message': 'Payment verified and settled successfully',
+            'transaction_id': item.get('transaction_id'),
+            'txn_id': transaction_rows[-1]['txn_id'],
+            'settlement_id': settlement_id,
+            'remaining_amount': float(token_remaining[token.token_id])
+        })
+
+    if not transaction_rows:
+        return results
+
+    try:
+        # All changes commit together
+        # Conditional per-user updates in id order, so concurrent syncs cannot overdraw
+        settlement_engine.apply_balance_deltas(balance_deltas)
+        # Token spends are conditional too; the remaining amounts above are only a snapshot
+        for token_pk, spent in token_spend.items():
+            if not _spend_token(token_pk, spent):
+                raise SettlementError('Amount exceeds token limit')
+        db.session.execute(insert(Transaction.__table__), transaction_rows)
+        db.session.commit()
+    except SettlementError as e:
+        # A concurrent sync got there first; settle item by item so only the losers fail
+        db.session.rollback()
+        current_app.logger.warning(f"Offline batch conflict, settling items individually: {str(e)}")
+        transaction_rows = _settle_items(settled)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Offline batch settlement failed: {str(e)}")
+        for result in results:
+            if result['success']:
+                result.update({'success': False, 'message': 'Settlement failed'})
+        return results
+
+    # The bulk insert bypasses Transaction.update_status, so feed the risk windows and rollups here
+    _record_settled(transaction_rows)
+
+    return results
@@ -10,6 +10,8 @@ from src.models.user import User
 from src.models.offline_token import OfflineToken
 from src.models.transaction import Transaction
 from src.database.connection import db
+from src.middleware.idempotency import idempotent
+from src.services.transaction_rollups import rollup_writer
 
 offline_demo_bp = Blueprint(
     'offline_demo', __name__, url_prefix='/api/offline-demo')
@@ -409,6 +411,7 @@ def get_offline_transactions(user_id):
 
 
 @offline_demo_bp.route('/sync-offline-transaction', methods=['POST'])
+@idempotent
 def sync_offline_transaction():
     """Sync offline transaction with payment system"""
     data = request.get_json()
@@ -424,9 +427,12 @@ def sync_offline_transaction():
             return jsonify({'success': False, 'message': 'Not an offline transaction'}), 400
 
         # Simulate payment system sync
+        previous_status = tx.status
         tx.status = 'completed'
         tx.completed_at = datetime.now(timezone.utc)
         db.session.commit()
+        if previous_status != 'completed':
+            rollup_writer.record(tx.status, tx.payment_rail, tx.amount, tx.completed_at)
 
         # Update user balances (in real implementation, this would be done by PSP)
         sender = User.query.get(tx.user_id)
@@ -666,6 +672,7 @@ def sync_received_payments_mobile():
             return jsonify({'success': False, 'message': 'Transaction not found'}), 404
 
         # Update transaction status
+        previous_status = tx.status
         tx.status = 'completed'
         tx.completed_at = datetime.now(timezone.utc)
 
@@ -678,6 +685,8 @@ def sync_received_payments_mobile():
             recipient.balance += float(amount)
 
         db.session.commit()
+        if previous_status != 'completed':
+            rollup_writer.record(tx.status, tx.payment_rail, tx.amount, tx.completed_at)
 
         return jsonify({
             'success': True,
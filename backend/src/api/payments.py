@@ -11,12 +11,14 @@ from src.models.transaction import Transaction
 from src.models.user import User
 from src.models.offline_token import OfflineToken
 from src.middleware.rate_limiter import rate_limit
+from src.middleware.idempotency import idempotent
 from src.middleware.security import require_api_key
 
 payments_bp = Blueprint('payments', __name__)
 
 @payments_bp.route('/pay', methods=['POST'])
 @rate_limit(per_minute=30)
+@idempotent
 def process_payment():
     """Process a payment transaction"""
     try:
@@ -71,6 +73,7 @@ def process_payment():
 
 @payments_bp.route('/payoffline', methods=['POST'])
 @rate_limit(per_minute=20)
+@idempotent
 def process_offline_payment():
     """Process offline payment with token"""
     try:
@@ -306,7 +309,7 @@ def process_refund():
 async def process_transaction_async(transaction_id, data):
     """Process transaction asynchronously with plugins"""
     try:
-        from src.plugins.plugin_manager import PluginManager
+        from src.plugins.plugin_manager import get_plugin_manager
         
         transaction = Transaction.query.get(transaction_id)
         if not transaction:
@@ -328,7 +331,7 @@ async def process_transaction_async(transaction_id, data):
         }
         
         # Execute plugins
-        plugin_manager = PluginManager()
+        plugin_manager = get_plugin_manager()
         plugin_result = await plugin_manager.execute_plugins(plugin_data, str(transaction.id))
         
         # Determine final status based on plugin results
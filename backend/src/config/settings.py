@@ -46,9 +46,34 @@ class Config:
     
     # Redis Configuration (for queue system)
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    TASK_QUEUE_AGING_SECONDS = float(os.getenv('TASK_QUEUE_AGING_SECONDS', 60))  # per priority level, 0 disables
+    TASK_QUEUE_WORKERS = int(os.getenv('TASK_QUEUE_WORKERS', 4))
+    TASK_QUEUE_TYPE_LIMITS = os.getenv(
+        'TASK_QUEUE_TYPE_LIMITS',
+        'transaction_processing:2,plugin_execution:2,token_cleanup:1,qr_cleanup:1'
+    )  # task_type:max concurrent, comma separated
+    TASK_QUEUE_WAL_PATH = os.getenv('TASK_QUEUE_WAL_PATH', '')  # e.g. instance/task_queue.wal; empty keeps tasks in memory only
+    TASK_QUEUE_WAL_COMMIT_MS = float(os.getenv('TASK_QUEUE_WAL_COMMIT_MS', 0))  # extra group commit window
+    TASK_QUEUE_WAL_COMPACT_EVERY = int(os.getenv('TASK_QUEUE_WAL_COMPACT_EVERY', 10000))  # records
     
     # Plugin Configuration
     PLUGINS_ENABLED = os.getenv('PLUGINS_ENABLED', 'fx_converter,risk_checker,token_handler').split(',')
+    PLUGIN_LOG_BATCH_SIZE = int(os.getenv('PLUGIN_LOG_BATCH_SIZE', 200))
+    PLUGIN_LOG_FLUSH_INTERVAL = float(os.getenv('PLUGIN_LOG_FLUSH_INTERVAL', 0.5))  # seconds
+    PLUGIN_LOG_QUEUE_SIZE = int(os.getenv('PLUGIN_LOG_QUEUE_SIZE', 10000))
+    
+    # Dashboard Rollup Configuration
+    ROLLUP_FLUSH_INTERVAL = float(os.getenv('ROLLUP_FLUSH_INTERVAL', 5))  # seconds between rollup upserts
+    
+    # System Metrics Sampler Configuration
+    SYSTEM_METRICS_INTERVAL = float(os.getenv('SYSTEM_METRICS_INTERVAL', 5))  # seconds between host and database samples
+    SYSTEM_METRICS_SUPABASE_INTERVAL = float(os.getenv('SYSTEM_METRICS_SUPABASE_INTERVAL', 30))
+    SYSTEM_METRICS_HISTORY_SIZE = int(os.getenv('SYSTEM_METRICS_HISTORY_SIZE', 720))  # samples kept; 1 hour at 5s
+    
+    # FX Rate Feed Configuration
+    FX_RATES_FILE = os.getenv('FX_RATES_FILE', '')  # JSON rates file; built-in rates when empty
+    FX_RATES_TTL_SECONDS = int(os.getenv('FX_RATES_TTL_SECONDS', 300))
+    FX_RATES_REFRESH_SECONDS = int(os.getenv('FX_RATES_REFRESH_SECONDS', 60))
     
     # Payment Rails Configuration
     PAYMENT_RAILS = {
@@ -77,6 +102,20 @@ class Config:
     # Security Configuration
     RATE_LIMIT_PER_MINUTE = int(os.getenv('RATE_LIMIT_PER_MINUTE', 60))
     RATE_LIMIT_PER_HOUR = int(os.getenv('RATE_LIMIT_PER_HOUR', 1000))
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))  # clients tracked before LRU eviction
+    RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'memory')  # 'redis' shares limits across workers
+    RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', '')  # defaults to REDIS_URL
+    IDEMPOTENCY_STORAGE = os.getenv('IDEMPOTENCY_STORAGE', 'memory')  # 'database' shares keys across workers and restarts
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400))
+    IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', 10000))  # in-memory LRU size
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 30))  # how long duplicates wait for the first request
+    RESPONSE_CACHE_TTL_SECONDS = float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', 5))  # 0 disables dashboard response caching
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    SIGNING_KEY_FILE = os.getenv('SIGNING_KEY_FILE', 'instance/signing_key.pem')  # created on first use if missing
+    SIGNING_PRIVATE_KEY = os.getenv('SIGNING_PRIVATE_KEY', '')  # PEM text; takes precedence over the file
+    SIGNING_KEY_PASSWORD = os.getenv('SIGNING_KEY_PASSWORD', '')
+    SIGNING_SCHEME = os.getenv('SIGNING_SCHEME', 'ed25519')  # 'ed25519' or 'rsa'; used when generating a key
+    SIGNING_RETIRED_KEY_FILES = [path for path in os.getenv('SIGNING_RETIRED_KEY_FILES', '').split(',') if path]  # verify-only keys
     
     # Logging Configuration
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -55,6 +55,8 @@ def init_db():
         from src.models.plugin_log import PluginLog
         from src.models.offline_token import OfflineToken
         from src.models.qr_code import QRCode
+        from src.models.idempotency_key import IdempotencyKey
+        from src.models.transaction_rollup import TransactionRollup
         
         # Create all tables
         db.create_all()
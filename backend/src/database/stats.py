@@ -0,0 +1,51 @@
+"""
+Aggregate statistics helpers for SatuPay Payment Switch
+Single-pass status breakdowns with conditional aggregation
+"""
+
+from typing import Any, Dict, Iterable, Optional
+from src.database.connection import db
+
+def status_breakdown_query(model, statuses: Iterable[str], sum_column=None,
+                           sum_status: Optional[str] = None, group_column=None):
+    """Build the conditional-aggregation query behind status_breakdown"""
+    columns = [db.func.count().label('total')]
+    columns += [
+        db.func.sum(db.case((model.status == status, 1), else_=0)).label(f'status_{index}')
+        for index, status in enumerate(statuses)
+    ]
+    if sum_column is not None:
+        condition = model.status == sum_status if sum_status else db.true()
+        columns.append(db.func.sum(db.case((condition, sum_column), else_=0)).label('amount'))
+
+    if group_column is None:
+        return db.session.query(*columns)
+    return db.session.query(group_column.label('group'), *columns).group_by(group_column)
+
+def status_breakdown(model, statuses: Iterable[str], sum_column=None,
+                     sum_status: Optional[str] = None, group_column=None) -> Dict[str, Any]:
+    """Count rows per status, and optionally sum a column, in one table scan.
+
+    Returns the total row count, a count per requested status, the sum of
+    sum_column over rows in sum_status (all rows when None) and, when
+    group_column is given, the row count per value of that column.
+    """
+    statuses = list(statuses)
+    rows = status_breakdown_query(model, statuses, sum_column, sum_status, group_column).all()
+
+    result = {
+        'total': 0,
+        'counts': {status: 0 for status in statuses},
+        'sum': 0.0,
+        'groups': {}
+    }
+    for row in rows:
+        result['total'] += row.total
+        for index, status in enumerate(statuses):
+            result['counts'][status] += int(getattr(row, f'status_{index}') or 0)
+        if sum_column is not None:
+            result['sum'] += float(row.amount or 0)
+        if group_column is not None:
+            result['groups'][row.group] = row.total
+
+    return result
@@ -0,0 +1,310 @@
+"""
+Idempotency middleware for SatuPay Payment Switch
+Replays the stored response when a client retries a request with the same Idempotency-Key
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from flask import Flask, request, jsonify, make_response, current_app
+from functools import wraps
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+class IdempotencyEntry:
+    """One idempotency key: in flight until done is set, then holds the response"""
+    
+    __slots__ = ('fingerprint', 'expires_at', 'done', 'response')
+    
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.done = threading.Event()
+        self.response: Optional[Tuple[int, bytes, str]] = None  # status, body, content type
+
+class IdempotencyStore:
+    """Responses by idempotency key in an LRU with TTL, optionally backed by the database.
+    
+    The first request with a key owns it and executes; duplicates arriving
+    while it runs wait on its entry and replay its response, so a retried
+    payment never executes twice. Server errors are not stored, which lets
+    the client retry them. With the database enabled, a placeholder row
+    claims the key across workers and completed responses survive restarts.
+    """
+    
+    def __init__(self, max_entries: int = 10000, ttl_seconds: int = 86400,
+                 wait_timeout: float = 30.0, sweep_batch: int = 8):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.wait_timeout = wait_timeout
+        self.sweep_batch = sweep_batch
+        self.use_database = False
+        self.poll_interval = 0.05
+        self.entries: OrderedDict = OrderedDict()  # scoped key -> IdempotencyEntry
+        self.lock = threading.Lock()
+        self.stats = {'executed': 0, 'replayed': 0, 'waited': 0, 'mismatched': 0, 'in_progress': 0, 'evicted': 0}
+    
+    def begin(self, key: str, fingerprint: str) -> Tuple[str, IdempotencyEntry]:
+        """Claim a key or resolve it to a stored response.
+        
+        Returns ('execute', entry) when the caller owns the key and must call
+        complete() or abandon(); otherwise 'replay', 'mismatch' (key reused
+        for a different request) or 'in_progress' (still running elsewhere).
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            owner, entry = self._get_or_create(key, fingerprint)
+            
+            if owner:
+                try:
+                    claimed = not self.use_database or self._claim_row(key, entry, deadline)
+                except Exception:
+                    self.abandon(key, entry)
+                    raise
+                if claimed:
+                    self._count('executed')
+                    return 'execute', entry
+                
+                # Resolved from the database, or still running in another worker
+                with self.lock:
+                    if entry.response is None and self.entries.get(key) is entry:
+                        del self.entries[key]
+                entry.done.set()
+                if entry.response is None:
+                    self._count('in_progress')
+                    return 'in_progress', entry
+            else:
+                if entry.fingerprint != fingerprint:
+                    self._count('mismatched')
+                    return 'mismatch', entry
+                if not entry.done.is_set():
+                    self._count('waited')
+                    if not entry.done.wait(max(0.0, deadline - time.monotonic())):
+                        self._count('in_progress')
+                        return 'in_progress', entry
+                if entry.response is None:
+                    # The owner failed without a response; try to take over
+                    continue
+            
+            if entry.fingerprint != fingerprint:
+                self._count('mismatched')
+                return 'mismatch', entry
+            self._count('replayed')
+            return 'replay', entry
+    
+    def complete(self, key: str, entry: IdempotencyEntry, status_code: int, body: bytes, content_type: str):
+        """Store the owner's response and release waiting duplicates"""
+        entry.response = (status_code, body, content_type)
+        if self.use_database:
+            try:
+                self._update_row(key, entry)
+            except Exception as e:
+                logger.error(f"Idempotency key persistence failed: {str(e)}")
+        entry.done.set()
+    
+    def abandon(self, key: str, entry: IdempotencyEntry):
+        """Forget a key whose request failed so a retry executes again"""
+        with self.lock:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+        if self.use_database:
+            try:
+                self._delete_row(key)
+            except Exception as e:
+                logger.error(f"Idempotency key release failed: {str(e)}")
+        entry.done.set()
+    
+    def _get_or_create(self, key: str, fingerprint: str) -> Tuple[bool, IdempotencyEntry]:
+        """Find the live entry for a key or create an owned one"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self.entries.move_to_end(key)
+                return False, entry
+            
+            entry = IdempotencyEntry(fingerprint, now + self.ttl_seconds)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self._sweep(now)
+            return True, entry
+    
+    def _sweep(self, now: float):
+        """Drop expired keys from the LRU end and enforce the size cap; caller holds the lock"""
+        for _ in range(self.sweep_batch):
+            key, entry = next(iter(self.entries.items()))
+            if entry.expires_at > now or not entry.done.is_set():
+                break
+            del self.entries[key]
+        
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats['evicted'] += 1
+    
+    def _count(self, stat: str):
+        """Bump a statistics counter"""
+        with self.lock:
+            self.stats[stat] += 1
+    
+    def _table(self):
+        """The idempotency_keys table"""
+        from src.models.idempotency_key import IdempotencyKey
+        return IdempotencyKey.__table__
+    
+    def _claim_row(self, key: str, entry: IdempotencyEntry, deadline: float) -> bool:
+        """Claim the key with a placeholder row; False if another request already holds it.
+        
+        On False the entry carries the stored response if there is one, and
+        otherwise the other request was still running at the deadline.
+        """
+        from src.database.connection import db
+        table = self._table()
+        
+        while True:
+            now = datetime.utcnow()
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(table).values(
+                        key=key, request_hash=entry.fingerprint, created_at=now,
+                        expires_at=now + timedelta(seconds=self.ttl_seconds)
+                    ))
+                return True
+            except IntegrityError:
+                pass
+            
+            with db.engine.begin() as conn:
+                row = conn.execute(select(table).where(table.c.key == key)).first()
+                if row is not None and row.expires_at <= now:
+                    conn.execute(delete(table).where(table.c.key == key, table.c.expires_at <= now))
+                    continue
+            
+            if row is None:
+                continue
+            if row.status_code is not None:
+                entry.fingerprint = row.request_hash
+                entry.response = (row.status_code, bytes(row.response_body or b''), row.content_type)
+                return False
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+    
+    def _update_row(self, key: str, entry: IdempotencyEntry):
+        """Record the response on the claimed row"""
+        from src.database.connection import db
+        table = self._table()
+        status_code, body, content_type = entry.response
+        with db.engine.begin() as conn:
+            conn.execute(update(table).where(table.c.key == key).values(
+                status_code=status_code, response_body=body, content_type=content_type
+            ))
+    
+    def _delete_row(self, key: str):
+        """Release a claimed row"""
+        from src.database.connection import db
+        table = self._table()
+        with db.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == key))
+    
+    def purge_expired(self) -> int:
+        """Delete expired rows from the database; returns the number removed"""
+        if not self.use_database:
+            return 0
+        from src.database.connection import db
+        table = self._table()
+        with db.engine.begin() as conn:
+            return conn.execute(delete(table).where(table.c.expires_at <= datetime.utcnow())).rowcount
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get store statistics"""
+        with self.lock:
+            return {
+                'storage': 'database' if self.use_database else 'memory',
+                'tracked_keys': len(self.entries),
+                'max_keys': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                **self.stats
+            }
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore()
+
+def setup_idempotency(app: Flask):
+    """Setup the idempotency store for the application"""
+    idempotency_store.max_entries = app.config.get('IDEMPOTENCY_MAX_KEYS', 10000)
+    idempotency_store.ttl_seconds = app.config.get('IDEMPOTENCY_TTL_SECONDS', 86400)
+    idempotency_store.wait_timeout = app.config.get('IDEMPOTENCY_WAIT_SECONDS', 30.0)
+    idempotency_store.use_database = app.config.get('IDEMPOTENCY_STORAGE', 'memory') == 'database'
+    
+    app.logger.info(f"Idempotency keys kept for {idempotency_store.ttl_seconds}s in "
+                    f"{'the database' if idempotency_store.use_database else 'memory'}")
+
+def request_fingerprint() -> str:
+    """Hash of the request a key was first used with"""
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode('utf-8'))
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+def idempotent(f):
+    """Idempotency-Key decorator; requests without the header run as usual"""
+    endpoint = f"{f.__module__}.{f.__qualname__}"
+    
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key:
+            return f(*args, **kwargs)
+        
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return jsonify({
+                'success': False,
+                'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters',
+                'timestamp': datetime.utcnow().isoformat()
+            }), 400
+        
+        key = f"{endpoint}:{idempotency_key}"
+        state, entry = idempotency_store.begin(key, request_fingerprint())
+        
+        if state == 'mismatch':
+            return jsonify({
+                'success': False,
+                'error': f'{IDEMPOTENCY_HEADER} was already used for a different request',
+                'timestamp': datetime.utcnow().isoformat()
+            }), 422
+        if state == 'in_progress':
+            response = jsonify({
+                'success': False,
+                'error': f'A request with this {IDEMPOTENCY_HEADER} is still being processed',
+                'timestamp': datetime.utcnow().isoformat()
+            })
+            response.status_code = 409
+            response.headers['Retry-After'] = '1'
+            return response
+        if state == 'replay':
+            status_code, body, content_type = entry.response
+            response = current_app.response_class(body, status=status_code, content_type=content_type)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency_store.abandon(key, entry)
+            raise
+        
+        if response.status_code >= 500 or response.is_streamed:
+            idempotency_store.abandon(key, entry)
+        else:
+            idempotency_store.complete(key, entry, response.status_code,
+                                       response.get_data(), response.content_type)
+        return response
+    
+    return decorated_function
@@ -0,0 +1,200 @@
+"""
+Rate limit storage for SatuPay Payment Switch
+GCRA bucket state kept in process memory or shared across workers in Redis
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+# Absorbs float rounding when a bucket is exactly full
+EPSILON = 1e-9
+
+class RateLimitStore:
+    """Base storage for rate limit buckets.
+    
+    check() runs one generic cell rate algorithm (GCRA) step for a per-minute
+    and a per-hour limit atomically and returns (allowed, remaining,
+    retry_after seconds).
+    """
+    
+    name = 'store'
+    
+    def check(self, key: str, per_minute_limit: int, per_hour_limit: int) -> Tuple[bool, int, float]:
+        """Check and count a request against both limits"""
+        raise NotImplementedError("Rate limit store must implement check method")
+    
+    def get_stats(self) -> dict:
+        """Get storage statistics"""
+        return {'storage': self.name}
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Per-process bucket storage.
+    
+    Each limit is a token bucket represented by its theoretical arrival
+    time (TAT), so a key stores only two floats: one per limit. A key whose
+    TATs are both in the past is indistinguishable from a new client and is
+    swept; keys are kept in LRU order so idle ones are found at the front,
+    and a hard cap evicts the least recently seen keys under pressure.
+    
+    Keys are spread over lock stripes, each with its own lock and LRU, so
+    threads checking different clients rarely contend.
+    """
+    
+    name = 'memory'
+    
+    def __init__(self, max_keys: int = 100000, stripes: int = 16, sweep_batch: int = 8):
+        self.sweep_batch = sweep_batch
+        self.stripes = [(threading.Lock(), OrderedDict()) for _ in range(stripes)]  # key -> (minute TAT, hour TAT)
+        self.evicted_keys = 0
+        self.max_keys = max_keys
+    
+    @property
+    def max_keys(self) -> int:
+        """Hard cap on tracked keys across all stripes"""
+        return self.stripe_max_keys * len(self.stripes)
+    
+    @max_keys.setter
+    def max_keys(self, value: int):
+        self.stripe_max_keys = max(1, math.ceil(value / len(self.stripes)))
+    
+    def check(self, key: str, per_minute_limit: int, per_hour_limit: int) -> Tuple[bool, int, float]:
+        """Check and count a request against both limits"""
+        minute_interval = 60.0 / per_minute_limit
+        hour_interval = 3600.0 / per_hour_limit
+        lock, buckets = self.stripes[hash(key) % len(self.stripes)]
+        
+        with lock:
+            now = time.monotonic()
+            state = buckets.get(key)
+            if state is None:
+                minute_tat = hour_tat = now
+            else:
+                buckets.move_to_end(key)
+                minute_tat = max(state[0], now)
+                hour_tat = max(state[1], now)
+            
+            # A request fits while the bucket's TAT is within one period of now
+            minute_wait = minute_tat + minute_interval - now - 60.0
+            hour_wait = hour_tat + hour_interval - now - 3600.0
+            if minute_wait > EPSILON or hour_wait > EPSILON:
+                return False, 0, max(minute_wait, hour_wait)
+            
+            minute_tat += minute_interval
+            hour_tat += hour_interval
+            buckets[key] = (minute_tat, hour_tat)
+            if state is None:
+                self._sweep(buckets, now)
+        
+        remaining = int(min((now + 60.0 - minute_tat) / minute_interval,
+                            (now + 3600.0 - hour_tat) / hour_interval) + EPSILON)
+        return True, remaining, 0.0
+    
+    def _sweep(self, buckets: OrderedDict, now: float):
+        """Drop idle keys from the LRU end and enforce the key cap; caller holds the stripe lock"""
+        for _ in range(self.sweep_batch):
+            key, (minute_tat, hour_tat) = next(iter(buckets.items()))
+            if max(minute_tat, hour_tat) > now:
+                break
+            del buckets[key]
+        
+        while len(buckets) > self.stripe_max_keys:
+            buckets.popitem(last=False)
+            self.evicted_keys += 1
+    
+    def get_stats(self) -> dict:
+        """Get storage statistics"""
+        return {
+            'storage': self.name,
+            'tracked_keys': sum(len(buckets) for _, buckets in self.stripes),
+            'max_keys': self.max_keys,
+            'evicted_keys': self.evicted_keys
+        }
+
+# GCRA step for both limits in one atomic script, timed by the Redis server
+# clock so every worker agrees on "now". Times are integer microseconds.
+GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local minute_interval = tonumber(ARGV[1])
+local hour_interval = tonumber(ARGV[2])
+
+local state = redis.call('HMGET', KEYS[1], 'm', 'h')
+local minute_tat = math.max(tonumber(state[1]) or now, now)
+local hour_tat = math.max(tonumber(state[2]) or now, now)
+
+local minute_wait = minute_tat + minute_interval - now - 60000000
+local hour_wait = hour_tat + hour_interval - now - 3600000000
+if minute_wait > 0 or hour_wait > 0 then
+    return {0, 0, math.max(minute_wait, hour_wait)}
+end
+
+minute_tat = minute_tat + minute_interval
+hour_tat = hour_tat + hour_interval
+redis.call('HSET', KEYS[1], 'm', string.format('%.0f', minute_tat), 'h', string.format('%.0f', hour_tat))
+-- A fully replenished bucket equals a missing one, so let Redis drop it then
+redis.call('PEXPIRE', KEYS[1], math.ceil((math.max(minute_tat, hour_tat) - now) / 1000))
+
+local remaining = math.min(
+    math.floor((now + 60000000 - minute_tat) / minute_interval),
+    math.floor((now + 3600000000 - hour_tat) / hour_interval)
+)
+return {1, remaining, 0}
+"""
+
+class RedisRateLimitStore(RateLimitStore):
+    """Bucket storage shared by all workers through Redis.
+    
+    Each check is a single EVALSHA round trip running the GCRA step as a
+    server-side script, so concurrent workers cannot interleave between
+    the read and the write. Works with any redis-py compatible client,
+    including fakeredis for local runs.
+    """
+    
+    name = 'redis'
+    
+    def __init__(self, client, prefix: str = 'satupay:ratelimit:', fail_open: bool = True):
+        self.client = client
+        self.prefix = prefix
+        self.fail_open = fail_open
+        self.errors = 0
+        self.script = client.register_script(GCRA_SCRIPT)
+    
+    def check(self, key: str, per_minute_limit: int, per_hour_limit: int) -> Tuple[bool, int, float]:
+        """Check and count a request against both limits"""
+        minute_interval = round(60000000 / per_minute_limit)
+        hour_interval = round(3600000000 / per_hour_limit)
+        
+        try:
+            allowed, remaining, retry_after_us = self.script(
+                keys=[self.prefix + key], args=[minute_interval, hour_interval]
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Rate limit store unavailable: {str(e)}")
+            if self.fail_open:
+                return True, 0, 0.0
+            return False, 0, 1.0
+        
+        return bool(allowed), int(remaining), int(retry_after_us) / 1000000
+    
+    def get_stats(self) -> dict:
+        """Get storage statistics"""
+        return {
+            'storage': self.name,
+            'prefix': self.prefix,
+            'errors': self.errors
+        }
+
+def create_redis_store(redis_url: str, **kwargs) -> RedisRateLimitStore:
+    """Connect to Redis and build a shared rate limit store"""
+    import redis
+    
+    client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    client.ping()
+    return RedisRateLimitStore(client, **kwargs)
@@ -2,61 +2,94 @@
 Rate limiting middleware for SatuPay Payment Switch
 """
 
+import math
 import time
-from collections import defaultdict, deque
-from flask import Flask, request, jsonify
+from typing import Dict, Tuple
+from flask import Flask, request, jsonify, make_response
 from functools import wraps
+from .rate_limit_store import RateLimitStore, MemoryRateLimitStore, create_redis_store
 
 class RateLimiter:
-    """Simple in-memory rate limiter"""
+    """Rate limiter with per-minute and per-hour limits over a bucket store.
     
-    def __init__(self):
-        self.requests = defaultdict(deque)
-        self.per_minute_limit = 60
-        self.per_hour_limit = 1000
+    Buckets live in process memory unless a shared store (e.g. Redis) is
+    configured, in which case every worker enforces the same budget.
+    """
+    
+    def __init__(self, per_minute_limit: int = 60, per_hour_limit: int = 1000,
+                 store: RateLimitStore = None, namespace: str = ''):
+        self.per_minute_limit = per_minute_limit
+        self.per_hour_limit = per_hour_limit
+        self.store = store or MemoryRateLimitStore()
+        self.namespace = namespace
     
     def is_allowed(self, key: str) -> bool:
         """Check if request is allowed based on rate limits"""
-        now = time.time()
-        
-        # Clean old requests
-        self._cleanup_old_requests(key, now)
-        
-        # Check per-minute limit
-        minute_requests = len([t for t in self.requests[key] if now - t < 60])
-        if minute_requests >= self.per_minute_limit:
-            return False
-        
-        # Check per-hour limit
-        hour_requests = len([t for t in self.requests[key] if now - t < 3600])
-        if hour_requests >= self.per_hour_limit:
-            return False
-        
-        # Add current request
-        self.requests[key].append(now)
-        
-        return True
+        return self.check(key)[0]
+    
+    def check(self, key: str) -> Tuple[bool, int, float]:
+        """Check and count a request; returns (allowed, remaining, retry_after seconds)"""
+        if self.namespace:
+            key = f"{self.namespace}:{key}"
+        return self.store.check(key, self.per_minute_limit, self.per_hour_limit)
     
-    def _cleanup_old_requests(self, key: str, now: float):
-        """Remove requests older than 1 hour"""
-        while self.requests[key] and now - self.requests[key][0] > 3600:
-            self.requests[key].popleft()
+    def get_stats(self) -> dict:
+        """Get limiter statistics"""
+        return {
+            'per_minute_limit': self.per_minute_limit,
+            'per_hour_limit': self.per_hour_limit,
+            **self.store.get_stats()
+        }
 
-# Global rate limiter instance
+# Global rate limiter instance; holds the default limits
 rate_limiter = RateLimiter()
 
+# Per-endpoint limiters created by the rate_limit decorator
+route_limiters: Dict[str, Tuple[RateLimiter, int, int]] = {}
+
 def setup_rate_limiting(app: Flask):
     """Setup rate limiting for the application"""
     
     # Configure limits from config
     rate_limiter.per_minute_limit = app.config.get('RATE_LIMIT_PER_MINUTE', 60)
     rate_limiter.per_hour_limit = app.config.get('RATE_LIMIT_PER_HOUR', 1000)
+    max_keys = app.config.get('RATE_LIMIT_MAX_KEYS', 100000)
+    
+    # A shared store keeps limits global across gunicorn workers
+    shared_store = None
+    if app.config.get('RATE_LIMIT_STORAGE', 'memory') == 'redis':
+        redis_url = app.config.get('RATE_LIMIT_REDIS_URL') or app.config.get('REDIS_URL')
+        try:
+            shared_store = create_redis_store(redis_url)
+            app.logger.info("Rate limiting state shared through Redis")
+        except Exception as e:
+            app.logger.warning(f"Redis rate limit storage unavailable, using per-process memory: {str(e)}")
+    
+    rate_limiter.store = shared_store or MemoryRateLimitStore(max_keys=max_keys)
+    
+    # Endpoints without explicit limits follow the configured defaults
+    for limiter, per_minute, per_hour in route_limiters.values():
+        limiter.per_minute_limit = per_minute or rate_limiter.per_minute_limit
+        limiter.per_hour_limit = per_hour or rate_limiter.per_hour_limit
+        limiter.store = shared_store or MemoryRateLimitStore(max_keys=max_keys)
     
     app.logger.info(f"Rate limiting configured - {rate_limiter.per_minute_limit}/min, {rate_limiter.per_hour_limit}/hour")
 
+def get_rate_limit_stats() -> Dict[str, dict]:
+    """Get limiter statistics per endpoint"""
+    return {endpoint: limiter.get_stats() for endpoint, (limiter, _, _) in route_limiters.items()}
+
 def rate_limit(per_minute: int = None, per_hour: int = None):
-    """Rate limiting decorator"""
+    """Rate limiting decorator with its own budget per endpoint"""
     def decorator(f):
+        endpoint = f"{f.__module__}.{f.__qualname__}"
+        limiter = RateLimiter(
+            per_minute_limit=per_minute or rate_limiter.per_minute_limit,
+            per_hour_limit=per_hour or rate_limiter.per_hour_limit,
+            namespace=endpoint
+        )
+        route_limiters[endpoint] = (limiter, per_minute, per_hour)
+        
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Get client identifier
@@ -65,15 +98,22 @@ def rate_limit(per_minute: int = None, per_hour: int = None):
             key = f"{client_ip}:{user_agent[:50]}"
             
             # Check rate limits
-            if not rate_limiter.is_allowed(key):
-                return jsonify({
+            allowed, remaining, retry_after = limiter.check(key)
+            if not allowed:
+                response = jsonify({
                     'success': False,
                     'error': 'Rate limit exceeded',
-                    'message': f'Maximum {rate_limiter.per_minute_limit} requests per minute allowed',
+                    'message': f'Maximum {limiter.per_minute_limit} requests per minute allowed',
                     'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
-                }), 429
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            else:
+                response = make_response(f(*args, **kwargs))
             
-            return f(*args, **kwargs)
+            response.headers['X-RateLimit-Limit'] = str(limiter.per_minute_limit)
+            response.headers['X-RateLimit-Remaining'] = str(remaining)
+            return response
         
         return decorated_function
-    return decorator 
\ No newline at end of file
+    return decorator
@@ -0,0 +1,162 @@
+"""
+Response caching middleware for SatuPay Payment Switch
+Short-lived in-process cache with request coalescing and ETag revalidation
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from flask import Flask, request, make_response, current_app
+from functools import wraps
+
+class CachedResponse:
+    """A rendered response body kept until expires_at"""
+    
+    __slots__ = ('status_code', 'body', 'content_type', 'etag', 'expires_at')
+    
+    def __init__(self, status_code: int, body: bytes, content_type: str, expires_at: float):
+        self.status_code = status_code
+        self.body = body
+        self.content_type = content_type
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.expires_at = expires_at
+
+class Flight:
+    """One in-progress computation that concurrent requests for the same key wait on"""
+    
+    __slots__ = ('done', 'result')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[CachedResponse] = None
+
+class ResponseCache:
+    """In-process cache of rendered responses keyed by endpoint and query args.
+    
+    Successful responses are reused for ttl_seconds. Requests that miss
+    while another request is already computing the same key wait for that
+    result instead of recomputing it (single-flight), so a burst of
+    identical dashboard refreshes costs one computation.
+    """
+    
+    def __init__(self, ttl_seconds: float = 5.0, max_entries: int = 256, wait_timeout: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self.enabled = True
+        self.entries: OrderedDict = OrderedDict()  # key -> CachedResponse
+        self.flights: Dict[str, Flight] = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'not_modified': 0}
+    
+    def get_or_compute(self, key: str, compute, ttl_seconds: float = None) -> Tuple[CachedResponse, str]:
+        """Return (response, source) with source one of 'hit', 'miss' or 'coalesced'"""
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached.expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached, 'hit'
+            
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        
+        if not leader:
+            if flight.done.wait(self.wait_timeout) and flight.result is not None:
+                self._count('coalesced')
+                return flight.result, 'coalesced'
+            # The leader failed or is stuck; compute without sharing
+            self._count('misses')
+            return compute(), 'miss'
+        
+        try:
+            result = compute()
+            flight.result = result
+            if result.status_code == 200 and ttl_seconds > 0:
+                result.expires_at = time.monotonic() + ttl_seconds
+                with self.lock:
+                    self.entries[key] = result
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            self._count('misses')
+            return result, 'miss'
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+    
+    def invalidate(self, prefix: str = ''):
+        """Drop cached responses whose key starts with prefix"""
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+    
+    def _count(self, stat: str):
+        """Bump a statistics counter"""
+        with self.lock:
+            self.stats[stat] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'in_flight': len(self.flights),
+                **self.stats
+            }
+
+# Global response cache instance
+response_cache = ResponseCache()
+
+def setup_response_cache(app: Flask):
+    """Setup the response cache for the application"""
+    response_cache.ttl_seconds = app.config.get('RESPONSE_CACHE_TTL_SECONDS', 5.0)
+    response_cache.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 256)
+    response_cache.enabled = response_cache.ttl_seconds > 0
+    
+    app.logger.info(f"Response cache configured - {response_cache.ttl_seconds}s TTL")
+
+def cached_response(ttl_seconds: float = None):
+    """Cache a GET endpoint's response per query string, with ETag revalidation"""
+    def decorator(f):
+        endpoint = f"{f.__module__}.{f.__qualname__}"
+        
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not response_cache.enabled:
+                return f(*args, **kwargs)
+            
+            key = f"{endpoint}?{'&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))}"
+            
+            def compute():
+                response = make_response(f(*args, **kwargs))
+                return CachedResponse(response.status_code, response.get_data(), response.content_type, 0.0)
+            
+            cached, source = response_cache.get_or_compute(key, compute, ttl_seconds)
+            response = current_app.response_class(cached.body, status=cached.status_code,
+                                                  content_type=cached.content_type)
+            if cached.status_code != 200:
+                return response
+            
+            ttl = response_cache.ttl_seconds if ttl_seconds is None else ttl_seconds
+            response.set_etag(cached.etag)
+            response.headers['Cache-Control'] = f'private, max-age={int(ttl)}'
+            response.headers['X-Cache'] = source.upper()
+            
+            # Answers If-None-Match with an empty 304 when the ETag still matches
+            response.make_conditional(request)
+            if response.status_code == 304:
+                response_cache._count('not_modified')
+            return response
+        
+        return decorated_function
+    return decorator
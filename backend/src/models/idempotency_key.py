@@ -0,0 +1,22 @@
+"""
+Idempotency Key model for SatuPay Payment Switch
+"""
+
+from datetime import datetime
+from src.database.connection import db
+
+class IdempotencyKey(db.Model):
+    """Stored response for a request made with an Idempotency-Key header"""
+    
+    __tablename__ = 'idempotency_keys'
+    
+    key = db.Column(db.String(300), primary_key=True)  # endpoint:Idempotency-Key header
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)  # None while the first request is in flight
+    response_body = db.Column(db.LargeBinary, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key} - {self.status_code}>'
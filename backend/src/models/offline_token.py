@@ -7,6 +7,7 @@ import secrets
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.dialects.postgresql import UUID
 from src.database.connection import db
+from src.database.stats import status_breakdown
 
 
 class OfflineToken(db.Model):
@@ -20,7 +21,12 @@ class OfflineToken(db.Model):
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey(
         'users.id'), nullable=False)
     amount = db.Column(db.Numeric(15, 2), nullable=False)
+    # Unspent part of amount for partial offline payments; NULL means unspent
+    remaining_amount = db.Column(db.Numeric(15, 2), nullable=True)
     currency = db.Column(db.String(3), default='MYR')
+    device_id = db.Column(db.String(255), nullable=True)
+    signature = db.Column(db.Text, nullable=True)
+    payload_hash = db.Column(db.String(64), nullable=True)
     # active, redeemed, expired, cancelled
     status = db.Column(db.String(20), default='active')
     redeemed_at = db.Column(db.DateTime, nullable=True)
@@ -43,7 +49,9 @@ class OfflineToken(db.Model):
             'token_id': self.token_id,
             'user_id': str(self.user_id),
             'amount': float(self.amount),
+            'remaining_amount': float(self.remaining_amount if self.remaining_amount is not None else self.amount),
             'currency': self.currency,
+            'device_id': self.device_id,
             'status': self.status,
             'redeemed_at': self.redeemed_at.isoformat() if self.redeemed_at else None,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
@@ -164,19 +172,16 @@ class OfflineToken(db.Model):
     @classmethod
     def get_token_stats(cls):
         """Get token statistics"""
-        total = cls.query.count()
-        active = cls.query.filter_by(status='active').count()
-        redeemed = cls.query.filter_by(status='redeemed').count()
-        expired = cls.query.filter_by(status='expired').count()
-        cancelled = cls.query.filter_by(status='cancelled').count()
-
-        # Calculate total value of active tokens
-        active_value_result = db.session.query(
-            db.func.sum(cls.amount)
-        ).filter(cls.status == 'active').scalar()
-
-        active_value = float(
-            active_value_result) if active_value_result else 0.0
+        stats = status_breakdown(cls, ['active', 'redeemed', 'expired', 'cancelled'],
+                                 sum_column=cls.amount, sum_status='active')
+        total = stats['total']
+        active = stats['counts']['active']
+        redeemed = stats['counts']['redeemed']
+        expired = stats['counts']['expired']
+        cancelled = stats['counts']['cancelled']
+
+        # Total value of active tokens
+        active_value = stats['sum']
 
         # Calculate redemption rate
         redemption_rate = (redeemed / total * 100) if total > 0 else 0
@@ -2,12 +2,20 @@
 Plugin Log model for SatuPay Payment Switch
 """
 
+import atexit
+import logging
+import queue
+import threading
+import time
 import uuid
 from datetime import datetime
+from typing import Dict, Any, List
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy import JSON
 from src.database.connection import db
 
+logger = logging.getLogger(__name__)
+
 class PluginLog(db.Model):
     """Plugin Log model for tracking plugin execution"""
     
@@ -74,6 +82,35 @@ class PluginLog(db.Model):
             error_message=error_message
         )
     
+    @classmethod
+    def queue_plugin_execution(cls, transaction_id, plugin_name, plugin_version,
+                               input_data=None, output_data=None, execution_time_ms=None,
+                               error_message=None):
+        """Queue plugin execution results for a batched write, or write now if no writer runs"""
+        if not plugin_log_writer.running:
+            return cls.log_plugin_execution(
+                transaction_id=transaction_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_version,
+                input_data=input_data,
+                output_data=output_data,
+                execution_time_ms=execution_time_ms,
+                error_message=error_message
+            )
+        
+        return plugin_log_writer.enqueue({
+            'id': uuid.uuid4(),
+            'transaction_id': _as_uuid(transaction_id),
+            'plugin_name': plugin_name,
+            'plugin_version': plugin_version,
+            'status': 'error' if error_message else 'success',
+            'input_data': input_data,
+            'output_data': output_data,
+            'error_message': error_message,
+            'execution_time_ms': execution_time_ms,
+            'created_at': datetime.utcnow()
+        })
+    
     @classmethod
     def get_logs_by_transaction(cls, transaction_id):
         """Get all logs for a transaction"""
@@ -118,4 +155,159 @@ class PluginLog(db.Model):
     @classmethod
     def get_error_logs(cls, limit=50):
         """Get recent error logs"""
-        return cls.query.filter_by(status='error').order_by(cls.created_at.desc()).limit(limit).all() 
\ No newline at end of file
+        return cls.query.filter_by(status='error').order_by(cls.created_at.desc()).limit(limit).all()
+
+
+def _as_uuid(value):
+    """Coerce string IDs so bulk inserts bind them like the ORM does"""
+    if isinstance(value, str):
+        return uuid.UUID(value)
+    return value
+
+
+class PluginLogWriter:
+    """Buffered plugin log sink that writes records with multi-row INSERTs"""
+    
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_queue_size: int = 10000, enqueue_timeout: float = 0.05):
+        self.app = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.records = queue.Queue(maxsize=max_queue_size)
+        self.running = False
+        self.worker_thread = None
+        self.flush_lock = threading.Lock()
+        self.stats = {
+            'queued': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,
+            'failed': 0,
+            'last_flush_ms': 0
+        }
+    
+    def start(self):
+        """Start background flush thread"""
+        if not self.running:
+            self.running = True
+            self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self.worker_thread.start()
+            logger.info("Plugin log writer started")
+    
+    def stop(self):
+        """Stop the flush thread and write out everything still buffered"""
+        if not self.running:
+            return
+        
+        self.running = False
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=5)
+        self.flush()
+        logger.info("Plugin log writer stopped")
+    
+    def enqueue(self, record: Dict[str, Any]) -> bool:
+        """Buffer a log record, blocking briefly when the queue is full"""
+        try:
+            # Backpressure: slow producers down before shedding load
+            self.records.put(record, timeout=self.enqueue_timeout)
+            self.stats['queued'] += 1
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            logger.warning(f"Plugin log queue full, dropped log for {record.get('plugin_name')}")
+            return False
+    
+    def flush(self) -> int:
+        """Write all buffered records, batch by batch"""
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return written
+            written += self._write_batch(batch)
+    
+    def _worker_loop(self):
+        """Flush whenever a batch fills up or the flush interval passes"""
+        while self.running:
+            try:
+                first = self.records.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            
+            batch = [first]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.records.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._write_batch(batch)
+    
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        """Pull up to limit records off the queue without waiting"""
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> int:
+        """Insert a batch with a single INSERT ... VALUES statement"""
+        start_time = time.time()
+        try:
+            with self.flush_lock:
+                if self.app:
+                    with self.app.app_context():
+                        self._insert(batch)
+                else:
+                    self._insert(batch)
+            
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['last_flush_ms'] = round((time.time() - start_time) * 1000, 2)
+            return len(batch)
+        except Exception as e:
+            self.stats['failed'] += len(batch)
+            logger.error(f"Failed to write {len(batch)} plugin logs: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def _insert(batch: List[Dict[str, Any]]):
+        """Run the bulk insert in its own transaction"""
+        with db.engine.begin() as connection:
+            connection.execute(PluginLog.__table__.insert().values(batch))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get writer statistics"""
+        return {
+            **self.stats,
+            'pending': self.records.qsize(),
+            'running': self.running,
+            'batch_size': self.batch_size,
+            'flush_interval_seconds': self.flush_interval
+        }
+
+# Global plugin log writer instance
+plugin_log_writer = PluginLogWriter()
+
+def init_plugin_log_writer(app):
+    """Configure and start the buffered plugin log writer"""
+    plugin_log_writer.app = app
+    plugin_log_writer.batch_size = app.config.get('PLUGIN_LOG_BATCH_SIZE', 200)
+    plugin_log_writer.flush_interval = app.config.get('PLUGIN_LOG_FLUSH_INTERVAL', 0.5)
+    plugin_log_writer.records = queue.Queue(maxsize=app.config.get('PLUGIN_LOG_QUEUE_SIZE', 10000))
+    plugin_log_writer.start()
+    
+    # Make sure buffered logs reach the database on shutdown
+    atexit.register(plugin_log_writer.stop)
+    
+    app.plugin_log_writer = plugin_log_writer
+    app.logger.info(f"Plugin log writer configured - batch {plugin_log_writer.batch_size}, "
+                    f"flush every {plugin_log_writer.flush_interval}s")
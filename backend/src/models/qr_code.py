@@ -10,6 +10,7 @@ from datetime import datetime, timedelta, timezone
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy import JSON
 from src.database.connection import db
+from src.database.stats import status_breakdown
 
 class QRCode(db.Model):
     """QR Code model for QR code management"""
@@ -252,18 +253,14 @@ class QRCode(db.Model):
     @classmethod
     def get_qr_stats(cls):
         """Get QR code statistics"""
-        total = cls.query.count()
-        active = cls.query.filter_by(status='active').count()
-        scanned = cls.query.filter_by(status='scanned').count()
-        expired = cls.query.filter_by(status='expired').count()
+        # Status counts and the per-type breakdown come from one grouped scan
+        stats = status_breakdown(cls, ['active', 'scanned', 'expired'], group_column=cls.qr_type)
+        total = stats['total']
+        active = stats['counts']['active']
+        scanned = stats['counts']['scanned']
+        expired = stats['counts']['expired']
         
-        # Get stats by type
-        type_stats = db.session.query(
-            cls.qr_type,
-            db.func.count(cls.id).label('count')
-        ).group_by(cls.qr_type).all()
-        
-        type_breakdown = {stat.qr_type: stat.count for stat in type_stats}
+        type_breakdown = stats['groups']
         
         # Calculate scan rate
         scan_rate = (scanned / total * 100) if total > 0 else 0
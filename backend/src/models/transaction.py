@@ -7,12 +7,19 @@ from datetime import datetime, timezone
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy import JSON
 from src.database.connection import db
+from src.database.stats import status_breakdown
 
 
 class Transaction(db.Model):
     """Transaction model for payment transactions"""
 
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Keyset pagination: newest first, optionally narrowed by status or rail
+        db.Index('idx_transactions_created_at_id', 'created_at', 'id'),
+        db.Index('idx_transactions_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('idx_transactions_payment_rail_created_at_id', 'payment_rail', 'created_at', 'id'),
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     txn_id = db.Column(db.String(100), unique=True, nullable=False, index=True)
@@ -91,6 +98,8 @@ class Transaction(db.Model):
 
     def update_status(self, status, **kwargs):
         """Update transaction status with timestamp"""
+        previous_status = self.status
+        previous_completed_at = self.completed_at
         self.status = status
         self.updated_at = self.utc_now()
 
@@ -106,6 +115,18 @@ class Transaction(db.Model):
 
         db.session.commit()
 
+        # Feed the in-memory activity windows used by the risk checks
+        if status == 'completed' and self.user_id:
+            from src.services.user_activity_store import user_activity_store
+            user_activity_store.record(self.user_id, float(self.amount), self.completed_at)
+
+        # Count the transaction in the dashboard rollups once, under its latest finished status;
+        # a completed transaction that is refunded moves out of its completed bucket
+        if status != previous_status:
+            from src.services.transaction_rollups import rollup_writer
+            rollup_writer.move(previous_status, previous_completed_at, status,
+                               self.payment_rail, self.amount, self.completed_at)
+
     def add_metadata(self, key, value):
         """Add metadata to transaction"""
         if not self.transaction_metadata:
@@ -143,20 +164,18 @@ class Transaction(db.Model):
     @classmethod
     def get_transaction_stats(cls):
         """Get transaction statistics"""
-        total = cls.query.count()
-        pending = cls.query.filter_by(status='pending').count()
-        completed = cls.query.filter_by(status='completed').count()
-        failed = cls.query.filter_by(status='failed').count()
+        stats = status_breakdown(cls, ['pending', 'completed', 'failed'],
+                                 sum_column=cls.amount, sum_status='completed')
+        total = stats['total']
+        pending = stats['counts']['pending']
+        completed = stats['counts']['completed']
+        failed = stats['counts']['failed']
 
         # Calculate success rate
         success_rate = (completed / total * 100) if total > 0 else 0
 
-        # Calculate total volume
-        volume_result = db.session.query(
-            db.func.sum(cls.amount)
-        ).filter(cls.status == 'completed').scalar()
-
-        total_volume = float(volume_result) if volume_result else 0.0
+        # Volume of completed transactions
+        total_volume = stats['sum']
 
         return {
             'total_transactions': total,
@@ -0,0 +1,36 @@
+"""
+Transaction Rollup model for SatuPay Payment Switch
+"""
+
+from datetime import datetime, timezone
+from src.database.connection import db
+
+
+class TransactionRollup(db.Model):
+    """Finished transaction count and volume per time bucket"""
+
+    __tablename__ = 'transaction_rollups'
+
+    granularity = db.Column(db.String(8), primary_key=True)  # hour, day
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # UTC, by completion time
+    status = db.Column(db.String(20), primary_key=True)  # completed, failed, refunded
+    payment_rail = db.Column(db.String(50), primary_key=True)
+    amount_bucket = db.Column(db.String(20), primary_key=True)  # 0-50, 51-200, ...
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<TransactionRollup {self.granularity} {self.bucket_start} {self.status}>'
+
+    def to_dict(self):
+        """Convert rollup bucket to dictionary"""
+        return {
+            'granularity': self.granularity,
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'status': self.status,
+            'payment_rail': self.payment_rail,
+            'amount_bucket': self.amount_bucket,
+            'transaction_count': self.transaction_count,
+            'total_amount': float(self.total_amount) if self.total_amount else 0.0
+        }
@@ -3,24 +3,19 @@ FX Converter Plugin for SatuPay Payment Switch
 Handles foreign exchange conversion between different currencies
 """
 
-import asyncio
+import numpy as np
 from datetime import datetime
-from typing import Dict, Any, Optional
-
-class BasePlugin:
-    """Base plugin class"""
-    
-    def __init__(self):
-        self.name = self.__class__.__name__
-        self.version = "1.0.0"
-    
-    async def execute(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute plugin logic"""
-        raise NotImplementedError("Plugin must implement execute method")
+from typing import Dict, Any, List, Optional, Sequence
+from .plugin_manager import BasePlugin
+from .fx_rates import RateFeed, RateTable, StaticRateProvider, JSONFileRateProvider
+from src.config.settings import Config
 
 class FXConverterPlugin(BasePlugin):
     """Foreign Exchange Converter Plugin"""
     
+    input_keys = ('amount', 'from_currency', 'to_currency')
+    output_keys = ('fx_conversion',)
+    
     def __init__(self):
         super().__init__()
         self.name = "fx_converter"
@@ -49,125 +44,44 @@ class FXConverterPlugin(BasePlugin):
         }
         
         self.markup_percentage = 2.5  # 2.5% markup for FX conversion
+        
+        # Rates come from a cached feed; the rates above are the fallback
+        if Config.FX_RATES_FILE:
+            provider = JSONFileRateProvider(Config.FX_RATES_FILE)
+        else:
+            provider = StaticRateProvider(self.exchange_rates)
+        
+        self.rate_feed = RateFeed(
+            provider,
+            self.markup_percentage,
+            ttl_seconds=Config.FX_RATES_TTL_SECONDS,
+            refresh_interval=Config.FX_RATES_REFRESH_SECONDS,
+            fallback_rates=self.exchange_rates
+        )
+        self.rate_feed.start()
     
-    async def execute(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute FX conversion"""
-        try:
-            amount = data.get('amount', 0)
-            from_currency = data.get('from_currency', 'MYR')
-            to_currency = data.get('to_currency', 'MYR')
-            
-            if from_currency == to_currency:
-                return {
-                    'success': True,
-                    'original_amount': amount,
-                    'converted_amount': amount,
-                    'from_currency': from_currency,
-                    'to_currency': to_currency,
-                    'exchange_rate': 1.0,
-                    'markup_applied': 0.0,
-                    'conversion_needed': False
-                }
-            
-            # Get exchange rate
-            if from_currency in self.exchange_rates:
-                rate = self.exchange_rates[from_currency].get(to_currency)
-                if rate:
-                    # Apply markup
-                    marked_up_rate = rate * (1 + self.markup_percentage / 100)
-                    converted_amount = amount * marked_up_rate
-                    markup_applied = converted_amount - (amount * rate)
-                    
-                    return {
-                        'success': True,
-                        'original_amount': amount,
-                        'converted_amount': round(converted_amount, 2),
-                        'from_currency': from_currency,
-                        'to_currency': to_currency,
-                        'exchange_rate': rate,
-                        'marked_up_rate': marked_up_rate,
-                        'markup_applied': round(markup_applied, 2),
-                        'markup_percentage': self.markup_percentage,
-                        'conversion_needed': True,
-                        'timestamp': datetime.utcnow().isoformat()
-                    }
-            
-            return {
-                'success': False,
-                'error': f'Exchange rate not available for {from_currency} to {to_currency}',
-                'original_amount': amount,
-                'from_currency': from_currency,
-                'to_currency': to_currency
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f'FX conversion failed: {str(e)}',
-                'original_amount': data.get('amount', 0),
-                'from_currency': data.get('from_currency', 'MYR'),
-                'to_currency': data.get('to_currency', 'MYR')
-            }
-    
-    def get_supported_currencies(self):
-        """Get list of supported currencies"""
-        return list(self.exchange_rates.keys())
-    
-    def get_exchange_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
-        """Get exchange rate between two currencies"""
-        if from_currency in self.exchange_rates:
-            return self.exchange_rates[from_currency].get(to_currency)
-        return None 
-FX Converter Plugin for SatuPay Payment Switch
-Handles foreign exchange conversion between different currencies
-"""
-
-import asyncio
-from datetime import datetime
-from typing import Dict, Any, Optional
-
-class BasePlugin:
-    """Base plugin class"""
-    
-    def __init__(self):
-        self.name = self.__class__.__name__
-        self.version = "1.0.0"
-    
-    async def execute(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute plugin logic"""
-        raise NotImplementedError("Plugin must implement execute method")
-
-class FXConverterPlugin(BasePlugin):
-    """Foreign Exchange Converter Plugin"""
+    @property
+    def rate_table(self) -> RateTable:
+        """Current rate snapshot"""
+        return self.rate_feed.get_table()
     
-    def __init__(self):
-        super().__init__()
-        self.name = "fx_converter"
-        self.version = "1.0.0"
+    def update_rates(self, exchange_rates: Optional[Dict[str, Dict[str, float]]] = None,
+                     markup_percentage: Optional[float] = None):
+        """Replace rates and/or markup and publish a freshly built rate table"""
+        if exchange_rates is not None:
+            # Explicit rates replace the provider until the next reload
+            self.rate_feed.stop()
+            self.rate_feed.provider = StaticRateProvider(exchange_rates)
+            self.exchange_rates = exchange_rates
         
-        # Mock exchange rates (in production, fetch from real API)
-        self.exchange_rates = {
-            'MYR': {
-                'USD': 0.21,
-                'SGD': 0.29,
-                'EUR': 0.20,
-                'GBP': 0.17,
-                'THB': 7.50,
-                'IDR': 3200.0,
-                'MYR': 1.0
-            },
-            'USD': {
-                'MYR': 4.75,
-                'SGD': 1.35,
-                'EUR': 0.92,
-                'GBP': 0.79,
-                'THB': 35.0,
-                'IDR': 15000.0,
-                'USD': 1.0
-            }
-        }
+        if markup_percentage is not None:
+            self.markup_percentage = markup_percentage
         
-        self.markup_percentage = 2.5  # 2.5% markup for FX conversion
+        self.rate_feed.publish(exchange_rates or self.rate_feed.exchange_rates, markup_percentage)
+    
+    def shutdown(self):
+        """Stop background rate refreshes"""
+        self.rate_feed.stop()
     
     async def execute(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute FX conversion"""
@@ -179,37 +93,47 @@ class FXConverterPlugin(BasePlugin):
             if from_currency == to_currency:
                 return {
                     'success': True,
-                    'original_amount': amount,
-                    'converted_amount': amount,
-                    'from_currency': from_currency,
-                    'to_currency': to_currency,
-                    'exchange_rate': 1.0,
-                    'markup_applied': 0.0,
-                    'conversion_needed': False
+                    'data': {
+                        'fx_conversion': {
+                            'original_amount': amount,
+                            'converted_amount': amount,
+                            'from_currency': from_currency,
+                            'to_currency': to_currency,
+                            'exchange_rate': 1.0,
+                            'markup_applied': 0.0,
+                            'conversion_needed': False
+                        }
+                    }
                 }
             
-            # Get exchange rate
-            if from_currency in self.exchange_rates:
-                rate = self.exchange_rates[from_currency].get(to_currency)
-                if rate:
-                    # Apply markup
-                    marked_up_rate = rate * (1 + self.markup_percentage / 100)
-                    converted_amount = amount * marked_up_rate
-                    markup_applied = converted_amount - (amount * rate)
-                    
-                    return {
-                        'success': True,
-                        'original_amount': amount,
-                        'converted_amount': round(converted_amount, 2),
-                        'from_currency': from_currency,
-                        'to_currency': to_currency,
-                        'exchange_rate': rate,
-                        'marked_up_rate': marked_up_rate,
-                        'markup_applied': round(markup_applied, 2),
-                        'markup_percentage': self.markup_percentage,
-                        'conversion_needed': True,
-                        'timestamp': datetime.utcnow().isoformat()
+            # Get exchange rate (direct or triangulated, markup pre-applied)
+            rate_table = self.rate_table
+            rates = rate_table.lookup(from_currency, to_currency)
+            if rates:
+                rate, marked_up_rate = rates
+                converted_amount = amount * marked_up_rate
+                markup_applied = converted_amount - (amount * rate)
+                
+                return {
+                    'success': True,
+                    'data': {
+                        'fx_conversion': {
+                            'original_amount': amount,
+                            'converted_amount': round(converted_amount, 2),
+                            'from_currency': from_currency,
+                            'to_currency': to_currency,
+                            'exchange_rate': rate,
+                            'marked_up_rate': marked_up_rate,
+                            'markup_applied': round(markup_applied, 2),
+                            'markup_percentage': rate_table.markup_percentage,
+                            'conversion_needed': True,
+                            'rates_version': rate_table.version,
+                            'rates_source': rate_table.source,
+                            'rates_as_of': rate_table.fetched_at.isoformat(),
+                            'timestamp': datetime.utcnow().isoformat()
+                        }
                     }
+                }
             
             return {
                 'success': False,
@@ -228,12 +152,25 @@ class FXConverterPlugin(BasePlugin):
                 'to_currency': data.get('to_currency', 'MYR')
             }
     
-    def get_supported_currencies(self):
+    def convert_many(self, amounts: Sequence[float], from_codes: Sequence[str],
+                     to_codes: Sequence[str]) -> np.ndarray:
+        """Convert many amounts at once using marked-up rates (unrounded)"""
+        rate_table = self.rate_table
+        amounts = np.asarray(amounts, dtype=float)
+        if not (len(amounts) == len(from_codes) == len(to_codes)):
+            raise ValueError("amounts, from_codes and to_codes must have the same length")
+        if len(amounts) == 0:
+            return np.zeros(0)
+        
+        rows = rate_table.indexes_for(from_codes)
+        columns = rate_table.indexes_for(to_codes)
+        return amounts * rate_table.marked_up_rates[rows, columns]
+    
+    def get_supported_currencies(self) -> List[str]:
         """Get list of supported currencies"""
-        return list(self.exchange_rates.keys())
+        return list(self.rate_table.currencies)
     
     def get_exchange_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
         """Get exchange rate between two currencies"""
-        if from_currency in self.exchange_rates:
-            return self.exchange_rates[from_currency].get(to_currency)
-        return None 
\ No newline at end of file
+        rates = self.rate_table.lookup(from_currency, to_currency)
+        return rates[0] if rates else None
@@ -0,0 +1,260 @@
+"""
+FX rate feed for SatuPay Payment Switch
+Rate providers, cross-rate snapshots and a cached, self-refreshing feed
+"""
+
+import json
+import logging
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import Dict, Any, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+class RateTable:
+    """Immutable snapshot of all cross rates, indexed by currency"""
+    
+    # Currencies used to triangulate pairs without a quoted rate, in order of preference
+    PIVOT_CURRENCIES = ('MYR', 'USD')
+    
+    def __init__(self, exchange_rates: Dict[str, Dict[str, float]], markup_percentage: float,
+                 version: int = 0, source: str = 'static'):
+        currencies = sorted(set(exchange_rates) | {
+            to_currency for quotes in exchange_rates.values() for to_currency in quotes
+        })
+        self.currencies = currencies
+        self.index = {currency: i for i, currency in enumerate(currencies)}
+        self.markup_percentage = markup_percentage
+        self.version = version
+        self.source = source
+        self.fetched_at = datetime.utcnow()
+        self.fetched_at_epoch = time.time()
+        
+        size = len(currencies)
+        rates = np.full((size, size), np.nan)
+        np.fill_diagonal(rates, 1.0)
+        
+        # Quoted rates first, then inverses of quotes for the missing direction
+        for from_currency, quotes in exchange_rates.items():
+            for to_currency, rate in quotes.items():
+                if rate:
+                    rates[self.index[from_currency], self.index[to_currency]] = rate
+        for from_currency, quotes in exchange_rates.items():
+            for to_currency, rate in quotes.items():
+                reverse = (self.index[to_currency], self.index[from_currency])
+                if rate and np.isnan(rates[reverse]):
+                    rates[reverse] = 1.0 / rate
+        
+        # Triangulate remaining pairs through each pivot: from -> pivot -> to
+        for pivot in self.PIVOT_CURRENCIES:
+            if pivot not in self.index:
+                continue
+            p = self.index[pivot]
+            triangulated = np.outer(rates[:, p], rates[p, :])
+            missing = np.isnan(rates)
+            rates[missing] = triangulated[missing]
+        
+        # Markup is charged on every real conversion, never on same-currency pairs
+        marked_up = rates * (1 + markup_percentage / 100)
+        np.fill_diagonal(marked_up, 1.0)
+        
+        rates.setflags(write=False)
+        marked_up.setflags(write=False)
+        self.rates = rates
+        self.marked_up_rates = marked_up
+    
+    def age_seconds(self) -> float:
+        """Seconds since these rates were fetched"""
+        return time.time() - self.fetched_at_epoch
+    
+    def lookup(self, from_currency: str, to_currency: str):
+        """Get (rate, marked up rate) for a pair, or None if unsupported"""
+        i = self.index.get(from_currency)
+        j = self.index.get(to_currency)
+        if i is None or j is None or np.isnan(self.rates[i, j]):
+            return None
+        return float(self.rates[i, j]), float(self.marked_up_rates[i, j])
+    
+    def indexes_for(self, codes: Sequence[str]) -> np.ndarray:
+        """Map currency codes to matrix indexes, raising on unsupported codes"""
+        index = self.index
+        if isinstance(codes, np.ndarray):
+            codes = codes.tolist()  # Hashing Python strings beats NumPy string scalars
+        try:
+            return np.fromiter((index[code] for code in codes), dtype=np.intp, count=len(codes))
+        except KeyError as e:
+            raise ValueError(f"Unsupported currency: {e.args[0]}")
+
+class RateProvider:
+    """Base rate provider; fetch_rates returns {from_currency: {to_currency: rate}}"""
+    
+    name = 'provider'
+    # Whether rates can change, i.e. whether periodic refreshes are worth doing
+    refreshable = True
+    
+    def fetch_rates(self) -> Dict[str, Dict[str, float]]:
+        """Fetch the latest exchange rates"""
+        raise NotImplementedError("Rate provider must implement fetch_rates method")
+
+class StaticRateProvider(RateProvider):
+    """Serves a fixed set of rates"""
+    
+    name = 'static'
+    refreshable = False
+    
+    def __init__(self, exchange_rates: Dict[str, Dict[str, float]]):
+        self.exchange_rates = exchange_rates
+    
+    def fetch_rates(self) -> Dict[str, Dict[str, float]]:
+        """Return the configured rates"""
+        return self.exchange_rates
+
+class JSONFileRateProvider(RateProvider):
+    """Reads rates from a JSON file, standing in for an upstream rate API.
+    
+    The file holds either the nested rates mapping itself or an object with
+    the mapping under "rates".
+    """
+    
+    name = 'json_file'
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    def fetch_rates(self) -> Dict[str, Dict[str, float]]:
+        """Load and validate rates from the file"""
+        with open(self.path) as f:
+            payload = json.load(f)
+        
+        rates = payload.get('rates', payload)
+        if not isinstance(rates, dict) or not rates:
+            raise ValueError(f"No rates found in {self.path}")
+        
+        return {
+            str(from_currency).upper(): {
+                str(to_currency).upper(): float(rate) for to_currency, rate in quotes.items()
+            }
+            for from_currency, quotes in rates.items()
+        }
+
+class RateFeed:
+    """In-process TTL cache over a rate provider.
+    
+    Lookups always return the last good snapshot immediately. A timer
+    refreshes it in the background, and a lookup that finds it older than
+    the TTL triggers an extra background refresh (stale-while-revalidate).
+    Failed refreshes keep serving the previous snapshot.
+    """
+    
+    def __init__(self, provider: RateProvider, markup_percentage: float,
+                 ttl_seconds: float = 300, refresh_interval: float = 60,
+                 retry_interval: float = 5,
+                 fallback_rates: Optional[Dict[str, Dict[str, float]]] = None):
+        self.provider = provider
+        self.markup_percentage = markup_percentage
+        self.ttl_seconds = ttl_seconds
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.table: Optional[RateTable] = None
+        self.exchange_rates: Dict[str, Dict[str, float]] = {}
+        self.version = 0
+        self.last_error = None
+        self.retry_at = 0.0
+        self.refresh_count = 0
+        self.failure_count = 0
+        self._publish_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresh_thread = None
+        
+        # Load synchronously once so the plugin never starts without rates
+        if not self.refresh() and fallback_rates:
+            self.publish(fallback_rates, source='fallback')
+    
+    def publish(self, exchange_rates: Dict[str, Dict[str, float]],
+                markup_percentage: Optional[float] = None, source: Optional[str] = None) -> RateTable:
+        """Build a new snapshot and swap it in"""
+        with self._publish_lock:
+            if markup_percentage is not None:
+                self.markup_percentage = markup_percentage
+            table = RateTable(exchange_rates, self.markup_percentage,
+                              version=self.version + 1, source=source or self.provider.name)
+            self.version = table.version
+            self.exchange_rates = exchange_rates
+            self.table = table
+        return table
+    
+    def refresh(self) -> bool:
+        """Fetch from the provider and publish; only one refresh runs at a time"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        
+        try:
+            rates = self.provider.fetch_rates()
+            self.publish(rates)
+            self.refresh_count += 1
+            self.last_error = None
+            return True
+        except Exception as e:
+            self.failure_count += 1
+            self.retry_at = time.time() + self.retry_interval
+            self.last_error = str(e)
+            logger.warning(f"FX rate refresh from {self.provider.name} failed, serving last snapshot: {str(e)}")
+            return False
+        finally:
+            self._refresh_lock.release()
+    
+    def get_table(self) -> RateTable:
+        """Get the current snapshot, revalidating in the background when stale"""
+        table = self.table
+        if table is not None and self.is_stale(table):
+            self._refresh_in_background()
+        return table
+    
+    def is_stale(self, table: Optional[RateTable] = None) -> bool:
+        """Check whether a snapshot is older than the TTL"""
+        table = table or self.table
+        return bool(self.ttl_seconds) and table.age_seconds() > self.ttl_seconds
+    
+    def _refresh_in_background(self):
+        """Kick off a refresh without blocking, unless one is running or just failed"""
+        if self._refresh_lock.locked() or time.time() < self.retry_at:
+            return
+        threading.Thread(target=self.refresh, daemon=True).start()
+    
+    def start(self):
+        """Start periodic background refreshes"""
+        if not self.provider.refreshable or not self.refresh_interval:
+            return
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresh_thread.start()
+    
+    def stop(self):
+        """Stop periodic refreshes"""
+        self._stop_event.set()
+    
+    def _refresh_loop(self):
+        """Refresh on a fixed timer until stopped"""
+        while not self._stop_event.wait(self.refresh_interval):
+            self.refresh()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get feed status for monitoring"""
+        table = self.table
+        return {
+            'provider': self.provider.name,
+            'version': table.version if table else None,
+            'source': table.source if table else None,
+            'fetched_at': table.fetched_at.isoformat() if table else None,
+            'age_seconds': round(table.age_seconds(), 1) if table else None,
+            'stale': self.is_stale(table) if table else True,
+            'refresh_count': self.refresh_count,
+            'failure_count': self.failure_count,
+            'last_error': self.last_error
+        }
@@ -5,20 +5,77 @@ Manages plugin loading, execution, and orchestration
 
 import asyncio
 import importlib
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
 from src.models.plugin_log import PluginLog
 
+class BasePlugin:
+    """Base plugin class"""
+    
+    # Transaction data keys the plugin reads and writes. The scheduler uses these
+    # to run independent plugins concurrently; None means the plugin may touch
+    # any key and is always run in order.
+    input_keys: Optional[Tuple[str, ...]] = None
+    output_keys: Optional[Tuple[str, ...]] = None
+    
+    def __init__(self):
+        self.name = self.__class__.__name__
+        self.version = "1.0.0"
+    
+    async def execute(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute plugin logic"""
+        raise NotImplementedError("Plugin must implement execute method")
+    
+    def shutdown(self):
+        """Release background resources when the plugin is replaced"""
+        pass
+
 class PluginManager:
     """Plugin Manager for orchestrating payment processing plugins"""
     
-    def __init__(self):
+    def __init__(self, execution_mode: str = 'concurrent'):
         self.plugins = {}
         self.enabled_plugins = []
+        # 'concurrent' runs independent plugins together, 'sequential' runs them one by one
+        self.execution_mode = execution_mode
+        self.lock = threading.RLock()
+        self.load_metrics = {}
+        self.reload_count = 0
         self.load_plugins()
     
     def load_plugins(self):
         """Load and initialize all plugins"""
+        plugins, metrics = self._build_plugins(reload_modules=False)
+        self._swap_plugins(plugins, metrics)
+    
+    def reload_plugins(self) -> Dict[str, Any]:
+        """Re-import and re-initialize all plugins, then swap them in atomically"""
+        plugins, metrics = self._build_plugins(reload_modules=True)
+        
+        with self.lock:
+            # Keep enable/disable decisions made at runtime across reloads
+            for name, plugin in plugins.items():
+                current = self.plugins.get(name)
+                if current and plugin['instance'] is not None:
+                    plugin['enabled'] = current['enabled']
+            self.reload_count += 1
+            previous = self.plugins
+            self._swap_plugins(plugins, metrics)
+        
+        # Let replaced instances stop any background work
+        for plugin in previous.values():
+            if plugin['instance'] is not None and hasattr(plugin['instance'], 'shutdown'):
+                try:
+                    plugin['instance'].shutdown()
+                except Exception as e:
+                    print(f"Failed to shut down plugin {plugin['config']['class']}: {str(e)}")
+        
+        return self.get_load_metrics()
+    
+    def _build_plugins(self, reload_modules: bool):
+        """Import and construct plugin instances without touching the live registry"""
         # Plugin configurations
         plugin_configs = {
             'fx_converter': {
@@ -41,130 +98,273 @@ class PluginManager:
             }
         }
         
+        plugins = {}
+        init_times = {}
+        load_start_time = time.time()
+        
         for name, config in plugin_configs.items():
+            plugin_start_time = time.time()
             try:
                 # Import plugin module
                 module = importlib.import_module(config['module'])
+                if reload_modules:
+                    module = importlib.reload(module)
                 plugin_class = getattr(module, config['class'])
                 
                 # Initialize plugin
                 plugin_instance = plugin_class()
                 
-                self.plugins[name] = {
+                plugins[name] = {
                     'instance': plugin_instance,
                     'config': config,
                     'enabled': config['enabled']
                 }
-                
-                if config['enabled']:
-                    self.enabled_plugins.append(name)
                     
             except Exception as e:
                 print(f"Failed to load plugin {name}: {str(e)}")
-                self.plugins[name] = {
+                plugins[name] = {
                     'instance': None,
                     'config': config,
                     'enabled': False,
                     'error': str(e)
                 }
+            
+            init_times[name] = round((time.time() - plugin_start_time) * 1000, 3)
+        
+        metrics = {
+            'total_init_time_ms': round((time.time() - load_start_time) * 1000, 3),
+            'plugin_init_time_ms': init_times,
+            'loaded_at': datetime.utcnow().isoformat()
+        }
+        
+        return plugins, metrics
+    
+    def _swap_plugins(self, plugins: Dict[str, Dict[str, Any]], metrics: Dict[str, Any]):
+        """Publish a new plugin registry in one step"""
+        with self.lock:
+            self.plugins = plugins
+            self.enabled_plugins = [name for name, plugin in plugins.items() if plugin['enabled']]
+            self.load_metrics = metrics
+    
+    def get_load_metrics(self) -> Dict[str, Any]:
+        """Get plugin bootstrap cost for the current registry"""
+        with self.lock:
+            return {
+                **self.load_metrics,
+                'reload_count': self.reload_count
+            }
     
     async def execute_plugins(self, transaction_data: Dict[str, Any], transaction_id: str) -> Dict[str, Any]:
-        """Execute all enabled plugins in sequence"""
+        """Execute all enabled plugins, running independent plugins concurrently"""
         start_time = time.time()
         results = {
             'success': True,
             'data': transaction_data.copy(),
             'plugin_results': {},
             'errors': [],
+            'execution_mode': self.execution_mode,
+            'critical_path': {},
             'execution_time_ms': 0
         }
         
-        for plugin_name in self.enabled_plugins:
-            plugin_info = self.plugins.get(plugin_name)
+        # Work on a snapshot so a concurrent reload or toggle cannot change plugins mid-run
+        with self.lock:
+            plugins = self.plugins
+            enabled_plugins = self.enabled_plugins
+        
+        runnable = []
+        for plugin_name in enabled_plugins:
+            plugin_info = plugins.get(plugin_name)
             if not plugin_info or not plugin_info['enabled']:
                 continue
-                
-            plugin_instance = plugin_info['instance']
-            if not plugin_instance:
+            if not plugin_info['instance']:
                 continue
+            runnable.append(plugin_name)
+        
+        dependencies = self._build_dependency_graph(plugins, runnable)
+        outcomes = {}
+        tasks = {}
+        
+        async def run_plugin(plugin_name: str):
+            # Wait for upstream plugins whose outputs this plugin reads
+            if dependencies[plugin_name]:
+                await asyncio.gather(*(tasks[dep] for dep in dependencies[plugin_name]))
+            
+            # Each plugin sees the original data plus its dependencies' outputs
+            plugin_data = transaction_data.copy()
+            for dep in dependencies[plugin_name]:
+                dep_result = outcomes[dep]['result']
+                if dep_result.get('success', False):
+                    plugin_data.update(dep_result.get('data', {}))
             
+            plugin_start_time = time.time()
             try:
-                plugin_start_time = time.time()
-                
-                # Execute plugin
                 plugin_result = await self._execute_single_plugin(
-                    plugin_instance, 
-                    plugin_name, 
-                    results['data']
+                    plugins[plugin_name]['instance'],
+                    plugin_name,
+                    plugin_data
                 )
-                
-                plugin_execution_time = int((time.time() - plugin_start_time) * 1000)
-                
-                # Update results with plugin output
-                if plugin_result.get('success', False):
-                    results['data'].update(plugin_result.get('data', {}))
-                    results['plugin_results'][plugin_name] = {
-                        'status': 'success',
-                        'data': plugin_result.get('data', {}),
-                        'execution_time_ms': plugin_execution_time
-                    }
-                else:
-                    results['errors'].append({
-                        'plugin': plugin_name,
-                        'error': plugin_result.get('error', 'Unknown error')
-                    })
-                    results['plugin_results'][plugin_name] = {
-                        'status': 'error',
-                        'error': plugin_result.get('error'),
-                        'execution_time_ms': plugin_execution_time
-                    }
-                
-                # Log plugin execution
-                PluginLog.log_plugin_execution(
-                    transaction_id=transaction_id,
-                    plugin_name=plugin_name,
-                    plugin_version=plugin_info['config']['version'],
-                    input_data=transaction_data,
-                    output_data=plugin_result.get('data'),
-                    execution_time_ms=plugin_execution_time,
-                    error_message=plugin_result.get('error') if not plugin_result.get('success') else None
-                )
-                
+                raised = False
             except Exception as e:
-                error_msg = f"Plugin execution failed: {str(e)}"
+                plugin_result = {
+                    'success': False,
+                    'error': f"Plugin execution failed: {str(e)}"
+                }
+                raised = True
+            plugin_end_time = time.time()
+            
+            outcomes[plugin_name] = {
+                'result': plugin_result,
+                'raised': raised,
+                'started_at_ms': int((plugin_start_time - start_time) * 1000),
+                'execution_time_ms': int((plugin_end_time - plugin_start_time) * 1000)
+            }
+        
+        # Plugins are listed in dependency order, so upstream tasks always exist first
+        for plugin_name in runnable:
+            tasks[plugin_name] = asyncio.ensure_future(run_plugin(plugin_name))
+        if tasks:
+            await asyncio.gather(*tasks.values())
+        
+        critical_path = self._get_critical_path(runnable, dependencies, outcomes)
+        
+        # Merge outputs in plugin order so results do not depend on completion order
+        for plugin_name in runnable:
+            plugin_info = plugins[plugin_name]
+            outcome = outcomes[plugin_name]
+            plugin_result = outcome['result']
+            timings = {
+                'execution_time_ms': outcome['execution_time_ms'],
+                'started_at_ms': outcome['started_at_ms'],
+                'depends_on': dependencies[plugin_name],
+                'on_critical_path': plugin_name in critical_path['plugins']
+            }
+            
+            if outcome['raised']:
                 results['errors'].append({
                     'plugin': plugin_name,
-                    'error': error_msg
+                    'error': plugin_result['error']
                 })
                 results['plugin_results'][plugin_name] = {
                     'status': 'error',
-                    'error': error_msg
+                    'error': plugin_result['error'],
+                    **timings
                 }
                 
                 # Log the error
-                PluginLog.log_plugin_execution(
+                PluginLog.queue_plugin_execution(
                     transaction_id=transaction_id,
                     plugin_name=plugin_name,
                     plugin_version=plugin_info['config']['version'],
                     input_data=transaction_data,
-                    error_message=error_msg
+                    error_message=plugin_result['error']
                 )
+                continue
+            
+            # Update results with plugin output
+            if plugin_result.get('success', False):
+                results['data'].update(plugin_result.get('data', {}))
+                results['plugin_results'][plugin_name] = {
+                    'status': 'success',
+                    'data': plugin_result.get('data', {}),
+                    **timings
+                }
+            else:
+                results['errors'].append({
+                    'plugin': plugin_name,
+                    'error': plugin_result.get('error', 'Unknown error')
+                })
+                results['plugin_results'][plugin_name] = {
+                    'status': 'error',
+                    'error': plugin_result.get('error'),
+                    **timings
+                }
+            
+            # Log plugin execution
+            PluginLog.queue_plugin_execution(
+                transaction_id=transaction_id,
+                plugin_name=plugin_name,
+                plugin_version=plugin_info['config']['version'],
+                input_data=transaction_data,
+                output_data=plugin_result.get('data'),
+                execution_time_ms=outcome['execution_time_ms'],
+                error_message=plugin_result.get('error') if not plugin_result.get('success') else None
+            )
         
         # Set overall success status
         if results['errors']:
             results['success'] = False
         
+        results['critical_path'] = critical_path
+        
         # Calculate total execution time
         results['execution_time_ms'] = int((time.time() - start_time) * 1000)
         
         return results
     
+    def _build_dependency_graph(self, plugins: Dict[str, Dict[str, Any]],
+                                plugin_names: List[str]) -> Dict[str, List[str]]:
+        """Map each plugin to the earlier plugins it has to wait for"""
+        dependencies = {}
+        for index, plugin_name in enumerate(plugin_names):
+            instance = plugins[plugin_name]['instance']
+            dependencies[plugin_name] = [
+                earlier for earlier in plugin_names[:index]
+                if self.execution_mode == 'sequential'
+                or self._plugins_conflict(plugins[earlier]['instance'], instance)
+            ]
+        return dependencies
+    
+    @staticmethod
+    def _plugins_conflict(earlier, later) -> bool:
+        """Check whether a later plugin must run after an earlier one"""
+        earlier_writes = getattr(earlier, 'output_keys', None)
+        later_reads = getattr(later, 'input_keys', None)
+        later_writes = getattr(later, 'output_keys', None)
+        
+        # Undeclared keys could touch anything, so keep the original order
+        if earlier_writes is None or later_reads is None or later_writes is None:
+            return True
+        
+        # Read-after-write, or both writing the same key
+        earlier_writes = set(earlier_writes)
+        return bool(earlier_writes & set(later_reads) or earlier_writes & set(later_writes))
+    
+    @staticmethod
+    def _get_critical_path(plugin_names: List[str], dependencies: Dict[str, List[str]],
+                           outcomes: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Find the longest chain of dependent plugin executions"""
+        path_time = {}
+        path_parent = {}
+        for plugin_name in plugin_names:
+            parent = max(dependencies[plugin_name], key=lambda dep: path_time[dep], default=None)
+            path_parent[plugin_name] = parent
+            path_time[plugin_name] = outcomes[plugin_name]['execution_time_ms'] + (path_time[parent] if parent else 0)
+        
+        path = []
+        node = max(reversed(plugin_names), key=lambda name: path_time[name], default=None)
+        while node:
+            path.insert(0, node)
+            node = path_parent[node]
+        
+        critical_time = path_time[path[-1]] if path else 0
+        sequential_time = sum(outcomes[name]['execution_time_ms'] for name in plugin_names)
+        
+        return {
+            'plugins': path,
+            'critical_path_ms': critical_time,
+            'sequential_time_ms': sequential_time,
+            'parallel_savings_ms': sequential_time - critical_time
+        }
+    
     async def _execute_single_plugin(self, plugin_instance, plugin_name: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a single plugin safely"""
         try:
             # Check if plugin has async execute method
             if hasattr(plugin_instance, 'execute_async'):
                 return await plugin_instance.execute_async(data)
+            elif asyncio.iscoroutinefunction(getattr(plugin_instance, 'execute', None)):
+                return await plugin_instance.execute(data)
             elif hasattr(plugin_instance, 'execute'):
                 # Run sync method in executor to avoid blocking
                 loop = asyncio.get_event_loop()
@@ -191,7 +391,8 @@ class PluginManager:
             'version': plugin['config']['version'],
             'enabled': plugin['enabled'],
             'has_error': 'error' in plugin,
-            'error': plugin.get('error')
+            'error': plugin.get('error'),
+            'init_time_ms': self.load_metrics.get('plugin_init_time_ms', {}).get(plugin_name)
         }
     
     def get_all_plugins_info(self) -> Dict[str, Dict[str, Any]]:
@@ -201,25 +402,33 @@ class PluginManager:
             plugins_info[name] = self.get_plugin_info(name)
         return plugins_info
     
+    def is_plugin_enabled(self, plugin_name: str) -> bool:
+        """Check whether a plugin is loaded and enabled"""
+        plugin = self.plugins.get(plugin_name)
+        return bool(plugin and plugin['enabled'])
+    
     def enable_plugin(self, plugin_name: str) -> bool:
         """Enable a plugin"""
-        if plugin_name not in self.plugins:
-            return False
-        
-        self.plugins[plugin_name]['enabled'] = True
-        if plugin_name not in self.enabled_plugins:
-            self.enabled_plugins.append(plugin_name)
-        
-        return True
+        return self._set_plugin_enabled(plugin_name, True)
     
     def disable_plugin(self, plugin_name: str) -> bool:
         """Disable a plugin"""
-        if plugin_name not in self.plugins:
-            return False
-        
-        self.plugins[plugin_name]['enabled'] = False
-        if plugin_name in self.enabled_plugins:
-            self.enabled_plugins.remove(plugin_name)
+        return self._set_plugin_enabled(plugin_name, False)
+    
+    def _set_plugin_enabled(self, plugin_name: str, enabled: bool) -> bool:
+        """Toggle a plugin by publishing a new registry rather than mutating the live one"""
+        with self.lock:
+            plugin = self.plugins.get(plugin_name)
+            if not plugin:
+                return False
+            
+            # A plugin that failed to load has nothing to run
+            if enabled and plugin['instance'] is None:
+                return False
+            
+            plugins = dict(self.plugins)
+            plugins[plugin_name] = {**plugin, 'enabled': enabled}
+            self._swap_plugins(plugins, self.load_metrics)
         
         return True
     
@@ -253,4 +462,28 @@ class PluginManager:
                 'avg_execution_time_ms': round(avg_execution_time, 2)
             })
         
-        return stats
\ No newline at end of file
+        return stats
+
+# Process-wide plugin registry, created once at app start
+plugin_manager: Optional[PluginManager] = None
+_plugin_manager_lock = threading.Lock()
+
+def get_plugin_manager() -> PluginManager:
+    """Get the shared plugin manager, creating it on first use"""
+    global plugin_manager
+    
+    if plugin_manager is None:
+        with _plugin_manager_lock:
+            if plugin_manager is None:
+                plugin_manager = PluginManager()
+    return plugin_manager
+
+def init_plugins(app) -> PluginManager:
+    """Initialize the shared plugin manager with warm plugin instances"""
+    manager = get_plugin_manager()
+    app.plugin_manager = manager
+    
+    metrics = manager.get_load_metrics()
+    app.logger.info(f"Plugin system initialized - {len(manager.enabled_plugins)} plugins enabled "
+                    f"in {metrics['total_init_time_ms']}ms")
+    return manager
@@ -3,14 +3,28 @@ Risk Checker Plugin for SatuPay Payment Switch
 Analyzes transaction risk and applies risk management rules
 """
 
-import asyncio
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, timezone
 from typing import Dict, Any, List
 from .plugin_manager import BasePlugin
+from src.services.user_activity_store import user_activity_store
 
 class RiskCheckerPlugin(BasePlugin):
     """Risk Checker Plugin for transaction risk assessment"""
     
+    input_keys = ('amount', 'currency', 'user_id', 'merchant_id', 'created_at')
+    output_keys = ('risk_assessment', 'risk_action', 'risk_checks_completed')
+    
+    # Checks in score matrix column order
+    RISK_CHECKS = (
+        'amount_check',
+        'frequency_check',
+        'velocity_check',
+        'time_pattern_check',
+        'merchant_reputation_check'
+    )
+    RISK_LEVELS = ('MINIMAL', 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+    
     def __init__(self):
         super().__init__()
         self.name = "Risk Checker"
@@ -50,337 +64,29 @@ class RiskCheckerPlugin(BasePlugin):
             'manual_review_threshold': 70,
             'risk_thresholds': self.risk_thresholds
         }
-    
-    async def execute(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute risk assessment"""
-        try:
-            risk_assessment = await self._perform_risk_assessment(data)
-            
-            # Determine action based on risk score
-            action = self._determine_action(risk_assessment['risk_score'])
-            
-            return {
-                'success': True,
-                'data': {
-                    'risk_assessment': risk_assessment,
-                    'risk_action': action,
-                    'risk_checks_completed': True
-                }
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': f"Risk assessment failed: {str(e)}",
-                'critical': False
-            }
-    
-    async def _perform_risk_assessment(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Perform comprehensive risk assessment"""
-        
-        risk_factors = {}
-        total_risk_score = 0
-        
-        # Amount-based risk
-        if 'amount_check' in self.config['enabled_checks']:
-            amount_risk = await self._check_amount_risk(data)
-            risk_factors['amount_risk'] = amount_risk
-            total_risk_score += amount_risk['score'] * self.risk_weights['amount_factor']
-        
-        # Frequency-based risk
-        if 'frequency_check' in self.config['enabled_checks']:
-            frequency_risk = await self._check_frequency_risk(data)
-            risk_factors['frequency_risk'] = frequency_risk
-            total_risk_score += frequency_risk['score'] * self.risk_weights['frequency_factor']
-        
-        # Velocity-based risk
-        if 'velocity_check' in self.config['enabled_checks']:
-            velocity_risk = await self._check_velocity_risk(data)
-            risk_factors['velocity_risk'] = velocity_risk
-            total_risk_score += velocity_risk['score'] * self.risk_weights['velocity_factor']
-        
-        # Time pattern risk
-        if 'time_pattern_check' in self.config['enabled_checks']:
-            time_risk = await self._check_time_pattern_risk(data)
-            risk_factors['time_risk'] = time_risk
-            total_risk_score += time_risk['score'] * self.risk_weights['time_factor']
-        
-        # Merchant reputation risk
-        if 'merchant_reputation_check' in self.config['enabled_checks']:
-            merchant_risk = await self._check_merchant_reputation_risk(data)
-            risk_factors['merchant_risk'] = merchant_risk
-            total_risk_score += merchant_risk['score'] * self.risk_weights['merchant_factor']
-        
-        return {
-            'risk_score': min(round(total_risk_score, 1), 100),
-            'risk_level': self._get_risk_level(total_risk_score),
-            'risk_factors': risk_factors,
-            'assessment_timestamp': datetime.utcnow().isoformat()
-        }
-    
-    async def _check_amount_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check amount-based risk"""
-        amount = float(data.get('amount', 0))
-        currency = data.get('currency', 'MYR')
-        
-        # Convert to MYR if needed (simplified)
-        if currency != 'MYR':
-            # Use rough conversion rates for risk assessment
-            conversion_rates = {'USD': 4.7, 'SGD': 3.5, 'EUR': 5.1}
-            amount = amount * conversion_rates.get(currency, 1)
-        
-        risk_score = 0
-        risk_factors = []
-        
-        if amount >= self.risk_thresholds['very_high_amount']:
-            risk_score = 80
-            risk_factors.append(f"Very high amount: {amount:.2f} MYR")
-        elif amount >= self.risk_thresholds['high_amount']:
-            risk_score = 50
-            risk_factors.append(f"High amount: {amount:.2f} MYR")
-        elif amount >= self.risk_thresholds['high_amount'] * 0.5:
-            risk_score = 25
-            risk_factors.append(f"Moderate amount: {amount:.2f} MYR")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal amount: {amount:.2f} MYR")
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'amount_myr': amount
-        }
-    
-    async def _check_frequency_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check frequency-based risk (mock implementation)"""
-        # In production, this would query the database for recent transactions
-        await asyncio.sleep(0.05)  # Simulate DB query
-        
-        # Mock frequency data
-        user_id = data.get('user_id')
-        recent_txn_count = 3  # Mock: user has 3 transactions in last hour
-        
-        risk_score = 0
-        risk_factors = []
-        
-        if recent_txn_count >= self.risk_thresholds['suspicious_frequency']:
-            risk_score = 70
-            risk_factors.append(f"Suspicious frequency: {recent_txn_count} txns/hour")
-        elif recent_txn_count >= self.risk_thresholds['suspicious_frequency'] * 0.6:
-            risk_score = 40
-            risk_factors.append(f"High frequency: {recent_txn_count} txns/hour")
-        elif recent_txn_count >= 5:
-            risk_score = 20
-            risk_factors.append(f"Moderate frequency: {recent_txn_count} txns/hour")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal frequency: {recent_txn_count} txns/hour")
         
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'recent_transaction_count': recent_txn_count
-        }
-    
-    async def _check_velocity_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check velocity-based risk (daily spending limit)"""
-        # Mock implementation
-        await asyncio.sleep(0.05)
-        
-        user_id = data.get('user_id')
-        daily_total = 5500.0  # Mock: user has spent 5500 MYR today
-        current_amount = float(data.get('amount', 0))
-        
-        projected_total = daily_total + current_amount
-        
-        risk_score = 0
-        risk_factors = []
-        
-        if projected_total >= self.risk_thresholds['velocity_limit']:
-            risk_score = 75
-            risk_factors.append(f"Velocity limit exceeded: {projected_total:.2f} MYR/day")
-        elif projected_total >= self.risk_thresholds['velocity_limit'] * 0.8:
-            risk_score = 45
-            risk_factors.append(f"High velocity: {projected_total:.2f} MYR/day")
-        elif projected_total >= self.risk_thresholds['velocity_limit'] * 0.5:
-            risk_score = 20
-            risk_factors.append(f"Moderate velocity: {projected_total:.2f} MYR/day")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal velocity: {projected_total:.2f} MYR/day")
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'daily_total': daily_total,
-            'projected_total': projected_total
-        }
-    
-    async def _check_time_pattern_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check time-based risk patterns"""
-        current_hour = datetime.utcnow().hour
-        
-        risk_score = 0
-        risk_factors = []
-        
-        # High-risk hours (late night/early morning)
-        if current_hour >= 23 or current_hour <= 5:
-            risk_score = 30
-            risk_factors.append(f"Late night transaction: {current_hour}:00")
-        elif current_hour <= 7:
-            risk_score = 15
-            risk_factors.append(f"Early morning transaction: {current_hour}:00")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal hours transaction: {current_hour}:00")
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'transaction_hour': current_hour
-        }
-    
-    async def _check_merchant_reputation_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check merchant reputation risk"""
-        merchant_id = data.get('merchant_id')
+        # Rough conversion rates to MYR for risk assessment
+        self.risk_conversion_rates = {'USD': 4.7, 'SGD': 3.5, 'EUR': 5.1}
         
         # Mock merchant reputation data
-        merchant_reputation = {
+        self.merchant_reputation = {
             'MERCH_001': {'score': 95, 'category': 'trusted'},
             'MERCH_002': {'score': 60, 'category': 'moderate'},
             'UNKNOWN': {'score': 30, 'category': 'unknown'}
         }
         
-        merchant_data = merchant_reputation.get(merchant_id, merchant_reputation['UNKNOWN'])
-        merchant_score = merchant_data['score']
-        
-        # Invert score for risk (high reputation = low risk)
-        risk_score = max(0, 100 - merchant_score) * 0.3
-        
-        risk_factors = [f"Merchant reputation: {merchant_data['category']} ({merchant_score}/100)"]
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'merchant_reputation': merchant_data
-        }
-    
-    def _get_risk_level(self, risk_score: float) -> str:
-        """Get risk level based on score"""
-        if risk_score >= 85:
-            return 'CRITICAL'
-        elif risk_score >= 70:
-            return 'HIGH'
-        elif risk_score >= 40:
-            return 'MEDIUM'
-        elif risk_score >= 20:
-            return 'LOW'
-        else:
-            return 'MINIMAL'
-    
-    def _determine_action(self, risk_score: float) -> Dict[str, Any]:
-        """Determine action based on risk score"""
-        if risk_score >= self.config['auto_block_threshold']:
-            return {
-                'action': 'BLOCK',
-                'reason': 'High risk transaction blocked automatically',
-                'require_approval': False
-            }
-        elif risk_score >= self.config['manual_review_threshold']:
-            return {
-                'action': 'MANUAL_REVIEW',
-                'reason': 'Transaction requires manual review',
-                'require_approval': True
-            }
-        else:
-            return {
-                'action': 'APPROVE',
-                'reason': 'Low risk transaction approved',
-                'require_approval': False
-            }
-    
-    def validate_input(self, data: Dict[str, Any]) -> bool:
-        """Validate input data for risk assessment"""
-        required_fields = ['amount', 'user_id']
-        
-        for field in required_fields:
-            if field not in data:
-                return False
-        
-        # Validate amount
-        try:
-            amount = float(data['amount'])
-            if amount <= 0:
-                return False
-        except (ValueError, TypeError):
-            return False
-        
-        return True 
-Risk Checker Plugin for SatuPay Payment Switch
-Analyzes transaction risk and applies risk management rules
-"""
-
-import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
-from .plugin_manager import BasePlugin
-
-class RiskCheckerPlugin(BasePlugin):
-    """Risk Checker Plugin for transaction risk assessment"""
-    
-    def __init__(self):
-        super().__init__()
-        self.name = "Risk Checker"
-        self.version = "1.0.0"
-        self.description = "Transaction risk assessment and fraud detection"
-        self.critical = False
-        
-        # Risk thresholds
-        self.risk_thresholds = {
-            'high_amount': 10000.0,  # MYR
-            'very_high_amount': 50000.0,  # MYR
-            'suspicious_frequency': 10,  # transactions per hour
-            'velocity_limit': 50000.0,  # MYR per day
-            'international_limit': 25000.0,  # MYR for international
-            'max_risk_score': 85  # Block if risk score > 85
-        }
-        
-        # Risk factors weights
-        self.risk_weights = {
-            'amount_factor': 0.3,
-            'frequency_factor': 0.25,
-            'velocity_factor': 0.2,
-            'time_factor': 0.1,
-            'merchant_factor': 0.1,
-            'location_factor': 0.05
-        }
-        
-        self.config = {
-            'enabled_checks': [
-                'amount_check',
-                'frequency_check', 
-                'velocity_check',
-                'time_pattern_check',
-                'merchant_reputation_check'
-            ],
-            'auto_block_threshold': 85,
-            'manual_review_threshold': 70,
-            'risk_thresholds': self.risk_thresholds
-        }
+        self._compile_rules()
     
     async def execute(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute risk assessment"""
         try:
-            risk_assessment = await self._perform_risk_assessment(data)
-            
-            # Determine action based on risk score
-            action = self._determine_action(risk_assessment['risk_score'])
+            result = self.score_batch([data], explain=True)[0]
             
             return {
                 'success': True,
                 'data': {
-                    'risk_assessment': risk_assessment,
-                    'risk_action': action,
+                    'risk_assessment': result['risk_assessment'],
+                    'risk_action': result['risk_action'],
                     'risk_checks_completed': True
                 }
             }
@@ -392,218 +98,237 @@ class RiskCheckerPlugin(BasePlugin):
                 'critical': False
             }
     
-    async def _perform_risk_assessment(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Perform comprehensive risk assessment"""
-        
-        risk_factors = {}
-        total_risk_score = 0
+    def _compile_rules(self):
+        """Compile thresholds and weights into lookup arrays for score_batch.
+        
+        Call again after changing risk_thresholds, risk_weights or the
+        reputation table so batch scoring picks up the new values.
+        """
+        thresholds = self.risk_thresholds
+        
+        # Tier edges in ascending order; np.searchsorted maps a value to its tier
+        self._amount_edges = np.array([
+            thresholds['high_amount'] * 0.5,
+            thresholds['high_amount'],
+            thresholds['very_high_amount']
+        ])
+        self._amount_scores = np.array([5.0, 25.0, 50.0, 80.0])
+        
+        self._frequency_edges = np.array([
+            5,
+            thresholds['suspicious_frequency'] * 0.6,
+            thresholds['suspicious_frequency']
+        ])
+        self._frequency_scores = np.array([5.0, 20.0, 40.0, 70.0])
+        
+        self._velocity_edges = np.array([
+            thresholds['velocity_limit'] * 0.5,
+            thresholds['velocity_limit'] * 0.8,
+            thresholds['velocity_limit']
+        ])
+        self._velocity_scores = np.array([5.0, 20.0, 45.0, 75.0])
+        
+        # Score per hour of day: late night (23:00-05:59), early morning (06:00-07:59), normal
+        self._hour_tiers = np.array([0] * 6 + [1] * 2 + [2] * 15 + [0])
+        self._hour_scores = np.array([30.0, 15.0, 5.0])
+        
+        self._check_weights = np.array([
+            self.risk_weights['amount_factor'],
+            self.risk_weights['frequency_factor'],
+            self.risk_weights['velocity_factor'],
+            self.risk_weights['time_factor'],
+            self.risk_weights['merchant_factor']
+        ])
+        
+        self._level_edges = np.array([20, 40, 70, 85])
+    
+    def score_batch(self, transactions: List[Dict[str, Any]], explain: bool = False) -> List[Dict[str, Any]]:
+        """Score many transactions at once with vectorized rule evaluation.
+        
+        Returns one {'risk_assessment', 'risk_action'} dict per transaction, in
+        input order. The human-readable 'factors' strings are only built when
+        explain is True.
+        """
+        if not transactions:
+            return []
+        
+        count = len(transactions)
+        now = datetime.utcnow()
+        
+        # Gather raw inputs into arrays
+        amounts = np.array([float(txn.get('amount', 0)) for txn in transactions])
+        currency_rates = np.array([
+            1.0 if txn.get('currency', 'MYR') == 'MYR'
+            else self.risk_conversion_rates.get(txn.get('currency'), 1.0)
+            for txn in transactions
+        ])
+        hours = np.array([self._get_transaction_hour(txn, now) for txn in transactions])
+        merchants = [
+            self.merchant_reputation.get(txn.get('merchant_id'), self.merchant_reputation['UNKNOWN'])
+            for txn in transactions
+        ]
+        merchant_scores = np.array([merchant['score'] for merchant in merchants], dtype=float)
+        recent_counts, daily_totals = self._lookup_user_activity(transactions)
         
         # Amount-based risk
-        if 'amount_check' in self.config['enabled_checks']:
-            amount_risk = await self._check_amount_risk(data)
-            risk_factors['amount_risk'] = amount_risk
-            total_risk_score += amount_risk['score'] * self.risk_weights['amount_factor']
+        amounts_myr = amounts * currency_rates
+        amount_tiers = np.searchsorted(self._amount_edges, amounts_myr, side='right')
+        amount_scores = self._amount_scores[amount_tiers]
         
         # Frequency-based risk
-        if 'frequency_check' in self.config['enabled_checks']:
-            frequency_risk = await self._check_frequency_risk(data)
-            risk_factors['frequency_risk'] = frequency_risk
-            total_risk_score += frequency_risk['score'] * self.risk_weights['frequency_factor']
+        frequency_tiers = np.searchsorted(self._frequency_edges, recent_counts, side='right')
+        frequency_scores = self._frequency_scores[frequency_tiers]
         
-        # Velocity-based risk
-        if 'velocity_check' in self.config['enabled_checks']:
-            velocity_risk = await self._check_velocity_risk(data)
-            risk_factors['velocity_risk'] = velocity_risk
-            total_risk_score += velocity_risk['score'] * self.risk_weights['velocity_factor']
+        # Velocity-based risk (daily spending limit)
+        projected_totals = daily_totals + amounts
+        velocity_tiers = np.searchsorted(self._velocity_edges, projected_totals, side='right')
+        velocity_scores = self._velocity_scores[velocity_tiers]
         
         # Time pattern risk
-        if 'time_pattern_check' in self.config['enabled_checks']:
-            time_risk = await self._check_time_pattern_risk(data)
-            risk_factors['time_risk'] = time_risk
-            total_risk_score += time_risk['score'] * self.risk_weights['time_factor']
-        
-        # Merchant reputation risk
-        if 'merchant_reputation_check' in self.config['enabled_checks']:
-            merchant_risk = await self._check_merchant_reputation_risk(data)
-            risk_factors['merchant_risk'] = merchant_risk
-            total_risk_score += merchant_risk['score'] * self.risk_weights['merchant_factor']
-        
-        return {
-            'risk_score': min(round(total_risk_score, 1), 100),
-            'risk_level': self._get_risk_level(total_risk_score),
-            'risk_factors': risk_factors,
-            'assessment_timestamp': datetime.utcnow().isoformat()
-        }
-    
-    async def _check_amount_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check amount-based risk"""
-        amount = float(data.get('amount', 0))
-        currency = data.get('currency', 'MYR')
-        
-        # Convert to MYR if needed (simplified)
-        if currency != 'MYR':
-            # Use rough conversion rates for risk assessment
-            conversion_rates = {'USD': 4.7, 'SGD': 3.5, 'EUR': 5.1}
-            amount = amount * conversion_rates.get(currency, 1)
-        
-        risk_score = 0
-        risk_factors = []
-        
-        if amount >= self.risk_thresholds['very_high_amount']:
-            risk_score = 80
-            risk_factors.append(f"Very high amount: {amount:.2f} MYR")
-        elif amount >= self.risk_thresholds['high_amount']:
-            risk_score = 50
-            risk_factors.append(f"High amount: {amount:.2f} MYR")
-        elif amount >= self.risk_thresholds['high_amount'] * 0.5:
-            risk_score = 25
-            risk_factors.append(f"Moderate amount: {amount:.2f} MYR")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal amount: {amount:.2f} MYR")
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'amount_myr': amount
-        }
-    
-    async def _check_frequency_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check frequency-based risk (mock implementation)"""
-        # In production, this would query the database for recent transactions
-        await asyncio.sleep(0.05)  # Simulate DB query
-        
-        # Mock frequency data
-        user_id = data.get('user_id')
-        recent_txn_count = 3  # Mock: user has 3 transactions in last hour
-        
-        risk_score = 0
-        risk_factors = []
-        
-        if recent_txn_count >= self.risk_thresholds['suspicious_frequency']:
-            risk_score = 70
-            risk_factors.append(f"Suspicious frequency: {recent_txn_count} txns/hour")
-        elif recent_txn_count >= self.risk_thresholds['suspicious_frequency'] * 0.6:
-            risk_score = 40
-            risk_factors.append(f"High frequency: {recent_txn_count} txns/hour")
-        elif recent_txn_count >= 5:
-            risk_score = 20
-            risk_factors.append(f"Moderate frequency: {recent_txn_count} txns/hour")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal frequency: {recent_txn_count} txns/hour")
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'recent_transaction_count': recent_txn_count
-        }
-    
-    async def _check_velocity_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check velocity-based risk (daily spending limit)"""
-        # Mock implementation
-        await asyncio.sleep(0.05)
-        
-        user_id = data.get('user_id')
-        daily_total = 5500.0  # Mock: user has spent 5500 MYR today
-        current_amount = float(data.get('amount', 0))
-        
-        projected_total = daily_total + current_amount
-        
-        risk_score = 0
-        risk_factors = []
-        
-        if projected_total >= self.risk_thresholds['velocity_limit']:
-            risk_score = 75
-            risk_factors.append(f"Velocity limit exceeded: {projected_total:.2f} MYR/day")
-        elif projected_total >= self.risk_thresholds['velocity_limit'] * 0.8:
-            risk_score = 45
-            risk_factors.append(f"High velocity: {projected_total:.2f} MYR/day")
-        elif projected_total >= self.risk_thresholds['velocity_limit'] * 0.5:
-            risk_score = 20
-            risk_factors.append(f"Moderate velocity: {projected_total:.2f} MYR/day")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal velocity: {projected_total:.2f} MYR/day")
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'daily_total': daily_total,
-            'projected_total': projected_total
-        }
+        hour_tiers = self._hour_tiers[hours]
+        time_scores = self._hour_scores[hour_tiers]
+        
+        # Merchant reputation risk (high reputation = low risk)
+        merchant_risk_scores = np.maximum(0, 100 - merchant_scores) * 0.3
+        
+        # Weighted total over enabled checks
+        enabled_checks = self.config['enabled_checks']
+        check_mask = np.array([check in enabled_checks for check in self.RISK_CHECKS], dtype=float)
+        score_matrix = np.column_stack([
+            amount_scores, frequency_scores, velocity_scores, time_scores, merchant_risk_scores
+        ])
+        weights = self._check_weights * check_mask
+        
+        # Accumulate column by column (not a matmul) so rounding matches the per-check sum
+        total_scores = np.zeros(count)
+        for column, weight in enumerate(weights):
+            if weight:
+                total_scores += score_matrix[:, column] * weight
+        
+        # Python's round() is decimal-exact; np.round can land on the other side of .x5
+        risk_scores = np.array([min(round(score, 1), 100) for score in total_scores.tolist()])
+        level_indexes = np.searchsorted(self._level_edges, total_scores, side='right')
+        action_indexes = np.searchsorted(
+            np.array([self.config['manual_review_threshold'], self.config['auto_block_threshold']]),
+            risk_scores,
+            side='right'
+        )
+        
+        assessment_timestamp = now.isoformat()
+        results = []
+        for i in range(count):
+            risk_factors = {}
+            
+            if check_mask[0]:
+                risk_factors['amount_risk'] = {
+                    'score': float(amount_scores[i]),
+                    'amount_myr': float(amounts_myr[i])
+                }
+            if check_mask[1]:
+                risk_factors['frequency_risk'] = {
+                    'score': float(frequency_scores[i]),
+                    'recent_transaction_count': int(recent_counts[i])
+                }
+            if check_mask[2]:
+                risk_factors['velocity_risk'] = {
+                    'score': float(velocity_scores[i]),
+                    'daily_total': float(daily_totals[i]),
+                    'projected_total': float(projected_totals[i])
+                }
+            if check_mask[3]:
+                risk_factors['time_risk'] = {
+                    'score': float(time_scores[i]),
+                    'transaction_hour': int(hours[i])
+                }
+            if check_mask[4]:
+                risk_factors['merchant_risk'] = {
+                    'score': float(merchant_risk_scores[i]),
+                    'merchant_reputation': merchants[i]
+                }
+            
+            if explain:
+                self._explain_factors(risk_factors, {
+                    'amount_risk': amount_tiers[i],
+                    'frequency_risk': frequency_tiers[i],
+                    'velocity_risk': velocity_tiers[i],
+                    'time_risk': hour_tiers[i]
+                })
+            
+            results.append({
+                'risk_assessment': {
+                    'risk_score': float(risk_scores[i]),
+                    'risk_level': self.RISK_LEVELS[level_indexes[i]],
+                    'risk_factors': risk_factors,
+                    'assessment_timestamp': assessment_timestamp
+                },
+                'risk_action': self._build_action(action_indexes[i])
+            })
+        
+        return results
     
-    async def _check_time_pattern_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check time-based risk patterns"""
-        current_hour = datetime.utcnow().hour
-        
-        risk_score = 0
-        risk_factors = []
-        
-        # High-risk hours (late night/early morning)
-        if current_hour >= 23 or current_hour <= 5:
-            risk_score = 30
-            risk_factors.append(f"Late night transaction: {current_hour}:00")
-        elif current_hour <= 7:
-            risk_score = 15
-            risk_factors.append(f"Early morning transaction: {current_hour}:00")
-        else:
-            risk_score = 5
-            risk_factors.append(f"Normal hours transaction: {current_hour}:00")
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'transaction_hour': current_hour
-        }
+    def _lookup_user_activity(self, transactions: List[Dict[str, Any]]):
+        """Get last-hour transaction counts and last-day totals from the activity store"""
+        activity = [user_activity_store.get_activity(txn.get('user_id')) for txn in transactions]
+        recent_counts = np.array([count for count, _ in activity])
+        daily_totals = np.array([total for _, total in activity], dtype=float)
+        return recent_counts, daily_totals
     
-    async def _check_merchant_reputation_risk(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Check merchant reputation risk"""
-        merchant_id = data.get('merchant_id')
-        
-        # Mock merchant reputation data
-        merchant_reputation = {
-            'MERCH_001': {'score': 95, 'category': 'trusted'},
-            'MERCH_002': {'score': 60, 'category': 'moderate'},
-            'UNKNOWN': {'score': 30, 'category': 'unknown'}
-        }
-        
-        merchant_data = merchant_reputation.get(merchant_id, merchant_reputation['UNKNOWN'])
-        merchant_score = merchant_data['score']
-        
-        # Invert score for risk (high reputation = low risk)
-        risk_score = max(0, 100 - merchant_score) * 0.3
-        
-        risk_factors = [f"Merchant reputation: {merchant_data['category']} ({merchant_score}/100)"]
-        
-        return {
-            'score': risk_score,
-            'factors': risk_factors,
-            'merchant_reputation': merchant_data
-        }
+    @staticmethod
+    def _get_transaction_hour(data: Dict[str, Any], now: datetime) -> int:
+        """Get the UTC hour a transaction was made, defaulting to now"""
+        created_at = data.get('created_at')
+        if created_at:
+            try:
+                timestamp = datetime.fromisoformat(str(created_at).replace('Z', '+00:00'))
+                if timestamp.tzinfo is not None:
+                    timestamp = timestamp.astimezone(timezone.utc)
+                return timestamp.hour
+            except ValueError:
+                pass
+        return now.hour
     
-    def _get_risk_level(self, risk_score: float) -> str:
-        """Get risk level based on score"""
-        if risk_score >= 85:
-            return 'CRITICAL'
-        elif risk_score >= 70:
-            return 'HIGH'
-        elif risk_score >= 40:
-            return 'MEDIUM'
-        elif risk_score >= 20:
-            return 'LOW'
-        else:
-            return 'MINIMAL'
+    def _explain_factors(self, risk_factors: Dict[str, Any], tiers: Dict[str, int]):
+        """Attach human-readable explanations to each risk factor"""
+        if 'amount_risk' in risk_factors:
+            label = ['Normal amount', 'Moderate amount', 'High amount', 'Very high amount'][tiers['amount_risk']]
+            risk_factors['amount_risk']['factors'] = [
+                f"{label}: {risk_factors['amount_risk']['amount_myr']:.2f} MYR"
+            ]
+        
+        if 'frequency_risk' in risk_factors:
+            label = ['Normal frequency', 'Moderate frequency', 'High frequency', 'Suspicious frequency'][tiers['frequency_risk']]
+            risk_factors['frequency_risk']['factors'] = [
+                f"{label}: {risk_factors['frequency_risk']['recent_transaction_count']} txns/hour"
+            ]
+        
+        if 'velocity_risk' in risk_factors:
+            label = ['Normal velocity', 'Moderate velocity', 'High velocity', 'Velocity limit exceeded'][tiers['velocity_risk']]
+            risk_factors['velocity_risk']['factors'] = [
+                f"{label}: {risk_factors['velocity_risk']['projected_total']:.2f} MYR/day"
+            ]
+        
+        if 'time_risk' in risk_factors:
+            label = ['Late night transaction', 'Early morning transaction', 'Normal hours transaction'][tiers['time_risk']]
+            risk_factors['time_risk']['factors'] = [
+                f"{label}: {risk_factors['time_risk']['transaction_hour']}:00"
+            ]
+        
+        if 'merchant_risk' in risk_factors:
+            merchant_data = risk_factors['merchant_risk']['merchant_reputation']
+            risk_factors['merchant_risk']['factors'] = [
+                f"Merchant reputation: {merchant_data['category']} ({merchant_data['score']}/100)"
+            ]
     
-    def _determine_action(self, risk_score: float) -> Dict[str, Any]:
-        """Determine action based on risk score"""
-        if risk_score >= self.config['auto_block_threshold']:
+    @staticmethod
+    def _build_action(action_index: int) -> Dict[str, Any]:
+        """Build the action for an index: 0 approve, 1 manual review, 2 block"""
+        if action_index >= 2:
             return {
                 'action': 'BLOCK',
                 'reason': 'High risk transaction blocked automatically',
                 'require_approval': False
             }
-        elif risk_score >= self.config['manual_review_threshold']:
+        elif action_index == 1:
             return {
                 'action': 'MANUAL_REVIEW',
                 'reason': 'Transaction requires manual review',
@@ -632,4 +357,4 @@ class RiskCheckerPlugin(BasePlugin):
         except (ValueError, TypeError):
             return False
         
-        return True 
\ No newline at end of file
+        return True
@@ -0,0 +1,156 @@
+"""
+Settlement Engine - Contention-safe balance transfers for SatuPay
+Moves money between users with conditional in-database updates
+"""
+
+import logging
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+from typing import Any, Callable, Dict
+
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError, DBAPIError
+
+from src.database.connection import db
+from src.services.user_activity_store import RingCounter
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementError(Exception):
+    """A settlement that cannot succeed, such as insufficient funds"""
+
+
+class SettlementEngine:
+    """Transfers balances with atomic conditional UPDATEs.
+
+    The payer is debited with UPDATE ... SET balance = balance - :amount
+    WHERE id = :id AND balance >= :amount, so concurrent settlements can
+    neither lose updates nor overdraw. Both rows are updated in ascending id
+    order, so two transfers between the same pair always lock in the same
+    order and cannot deadlock each other. Lock timeouts and serialization
+    failures are retried with jittered backoff and counted as conflicts.
+    """
+
+    def __init__(self, max_retries: int = 5, retry_backoff: float = 0.01):
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.lock = threading.Lock()
+        self.totals = {'settled': 0, 'conflicts': 0, 'insufficient_funds': 0, 'failed': 0}
+        self.settled_window = RingCounter(1, 60)
+        self.conflict_window = RingCounter(1, 60)
+
+    def settle(self, payer_id, payee_id, amount, within: Callable[[], Any] = None) -> Dict[str, Any]:
+        """Move amount from payer to payee and commit; raises SettlementError if it cannot succeed.
+
+        within, when given, runs after the balance updates in the same
+        transaction, so the records it writes commit or roll back together
+        with the transfer; it is re-run on retries.
+        """
+        payer_id, payee_id = self._as_uuid(payer_id), self._as_uuid(payee_id)
+        amount = Decimal(str(amount))
+        if amount <= 0:
+            raise SettlementError('Amount must be positive')
+        if payer_id == payee_id:
+            raise SettlementError('Payer and payee must differ')
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                balances = self.apply_balance_deltas({payer_id: -amount, payee_id: amount})
+                if within is not None:
+                    within()
+                db.session.commit()
+                self._record('settled', self.settled_window)
+                return {
+                    'payer_new_balance': balances.get(payer_id),
+                    'payee_new_balance': balances.get(payee_id),
+                    'attempts': attempt + 1
+                }
+            except SettlementError:
+                db.session.rollback()
+                raise
+            except (OperationalError, DBAPIError) as e:
+                db.session.rollback()
+                if attempt == self.max_retries or not self._is_conflict(e):
+                    self._record('failed')
+                    raise
+                self._record('conflicts', self.conflict_window)
+                time.sleep(self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def apply_balance_deltas(self, deltas: Dict[uuid.UUID, Decimal]) -> Dict[uuid.UUID, float]:
+        """Apply per-user balance changes in the current transaction, without committing.
+
+        Rows are updated in ascending id order. Debits only match while the
+        balance covers them; a debit or credit that matches no row raises
+        SettlementError and the caller must roll back.
+        """
+        users = db.metadata.tables['users']
+        returning = db.engine.dialect.update_returning
+        balances = {}
+
+        # Consistent lock order: always touch the lower id first
+        for user_id in sorted(deltas, key=str):
+            delta = deltas[user_id]
+            if not delta:
+                continue
+
+            statement = update(users).where(users.c.id == user_id).values(balance=users.c.balance + delta)
+            if delta < 0:
+                statement = statement.where(users.c.balance >= -delta)
+            if returning:
+                statement = statement.returning(users.c.balance)
+
+            result = db.session.execute(statement)
+            row = result.first() if returning else None
+            if (returning and row is None) or (not returning and result.rowcount == 0):
+                raise self._rejection(user_id)
+            if row is not None:
+                balances[user_id] = float(row[0])
+
+        return balances
+
+    def _rejection(self, user_id) -> SettlementError:
+        """Explain why a conditional update matched no row"""
+        users = db.metadata.tables['users']
+        exists = db.session.execute(users.select().with_only_columns(users.c.id).where(users.c.id == user_id)).first()
+        if not exists:
+            return SettlementError('User not found')
+        self._record('insufficient_funds')
+        return SettlementError('Insufficient payer balance')
+
+    def _is_conflict(self, error: Exception) -> bool:
+        """Whether a database error is a transient lock or serialization conflict"""
+        code = getattr(getattr(error, 'orig', None), 'pgcode', None)
+        if code in ('40001', '40P01', '55P03'):
+            return True
+        message = str(error).lower()
+        return 'database is locked' in message or 'deadlock' in message or 'could not serialize' in message
+
+    def _as_uuid(self, value):
+        """Normalize user ids to UUID objects"""
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+    def _record(self, counter: str, window: RingCounter = None):
+        """Count an outcome, and its per-second window when given"""
+        with self.lock:
+            self.totals[counter] += 1
+            if window is not None:
+                window.add(time.time(), 0.0)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get settlement counters and per-second rates over the last minute"""
+        now = time.time()
+        with self.lock:
+            settled, _ = self.settled_window.totals(now)
+            conflicts, _ = self.conflict_window.totals(now)
+            return {
+                **self.totals,
+                'settlements_per_second': round(settled / 60, 2),
+                'conflicts_per_second': round(conflicts / 60, 2)
+            }
+
+# Global settlement engine instance
+settlement_engine = SettlementEngine()
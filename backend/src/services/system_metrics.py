@@ -0,0 +1,208 @@
+"""
+System Metrics Sampler - Background host and dependency probes for SatuPay
+Health endpoints read the latest snapshot instead of measuring on the request thread
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import psutil
+from sqlalchemy import text
+
+from src.database.connection import db, test_supabase_connection
+
+logger = logging.getLogger(__name__)
+
+# Fields kept in history windows; the full snapshot is only needed for the latest sample
+HISTORY_FIELDS = ('cpu_percent', 'memory_percent', 'disk_percent', 'active_connections')
+
+
+class SystemMetricsSampler:
+    """Samples host metrics and dependency health on a fixed cadence into a ring buffer.
+
+    CPU usage is measured over the interval between samples, so nothing
+    ever sleeps inside a request. The Supabase probe goes over the network
+    and runs on its own slower cadence; its last result is carried forward
+    into the samples in between. Only one sample runs at a time; readers
+    never wait for one once a snapshot exists.
+    """
+
+    def __init__(self, interval: float = 5.0, history_size: int = 720, supabase_interval: float = 30.0):
+        self.app = None
+        self.interval = interval
+        self.supabase_interval = supabase_interval
+        self.samples: deque = deque(maxlen=history_size)
+        self.lock = threading.Lock()
+        self.sample_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.worker_thread = None
+        self.supabase_status: Dict[str, Any] = {'status': 'unknown'}
+        self.supabase_checked_at = 0.0
+        self.stats = {'samples': 0, 'failed_samples': 0, 'last_sample_ms': 0}
+
+    def sample(self) -> Dict[str, Any]:
+        """Take one snapshot and append it to the ring buffer"""
+        with self.sample_lock:
+            return self._sample()
+
+    def _sample(self) -> Dict[str, Any]:
+        """Collect a snapshot; callers hold sample_lock"""
+        start_time = time.time()
+        snapshot = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'sampled_at': start_time,
+            'uptime_seconds': round(start_time - psutil.boot_time(), 1)
+        }
+        snapshot.update(self._host_metrics())
+
+        if self.app:
+            with self.app.app_context():
+                snapshot['database'] = self._ping_database()
+                snapshot['supabase'] = self._check_supabase(start_time)
+        else:
+            snapshot['database'] = self._ping_database()
+            snapshot['supabase'] = self._check_supabase(start_time)
+
+        snapshot['sample_ms'] = round((time.time() - start_time) * 1000, 2)
+        with self.lock:
+            self.samples.append(snapshot)
+            self.stats['samples'] += 1
+            self.stats['last_sample_ms'] = snapshot['sample_ms']
+        return snapshot
+
+    def _host_metrics(self) -> Dict[str, Any]:
+        """CPU, memory, disk and socket counts"""
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('/')
+        try:
+            active_connections = len(psutil.net_connections())
+        except (psutil.AccessDenied, OSError):
+            active_connections = None
+
+        return {
+            # Usage since the previous call; the first call after start primes it
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': memory.percent,
+            'memory_available_mb': round(memory.available / 1024 / 1024, 2),
+            'disk_percent': disk.percent,
+            'disk_free_gb': round(disk.free / 1024 / 1024 / 1024, 2),
+            'active_connections': active_connections
+        }
+
+    def _ping_database(self) -> Dict[str, Any]:
+        """Round trip of SELECT 1 on a pooled connection"""
+        start_time = time.time()
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return {'status': 'healthy', 'latency_ms': round((time.time() - start_time) * 1000, 2)}
+        except Exception as e:
+            return {'status': 'error', 'message': str(e)}
+
+    def _check_supabase(self, now: float) -> Dict[str, Any]:
+        """Supabase reachability, re-probed every supabase_interval"""
+        if now - self.supabase_checked_at < self.supabase_interval:
+            return self.supabase_status
+
+        try:
+            healthy = test_supabase_connection()
+            self.supabase_status = {'status': 'healthy' if healthy else 'error'}
+        except Exception as e:
+            self.supabase_status = {'status': 'error', 'message': str(e)}
+        self.supabase_status['checked_at'] = datetime.utcnow().isoformat()
+        self.supabase_checked_at = now
+        return self.supabase_status
+
+    def latest(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Most recent snapshot, flagged stale when older than max_age.
+
+        A stale snapshot is served as-is rather than re-sampled on the
+        request thread, since the sampler is then usually stuck on a slow
+        probe. Only before the first snapshot does a caller sample inline,
+        and concurrent callers wait for that one sample.
+        """
+        max_age = self.interval * 3 if max_age is None else max_age
+        with self.lock:
+            snapshot = self.samples[-1] if self.samples else None
+
+        if snapshot is None:
+            with self.sample_lock:
+                with self.lock:
+                    snapshot = self.samples[-1] if self.samples else None
+                if snapshot is None:
+                    snapshot = self._sample()
+
+        age = time.time() - snapshot['sampled_at']
+        return {**snapshot, 'age_seconds': round(age, 3), 'stale': age > max_age}
+
+    def history(self, window_seconds: float) -> List[Dict[str, Any]]:
+        """Trend points for the last window_seconds, oldest first"""
+        cutoff = time.time() - window_seconds
+        with self.lock:
+            samples = [snapshot for snapshot in self.samples if snapshot['sampled_at'] >= cutoff]
+        return [{
+            'timestamp': snapshot['timestamp'],
+            **{field: snapshot[field] for field in HISTORY_FIELDS},
+            'database_latency_ms': snapshot['database'].get('latency_ms')
+        } for snapshot in samples]
+
+    def start(self):
+        """Start the background sampling thread"""
+        if self.worker_thread and self.worker_thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker_thread.start()
+
+    def stop(self):
+        """Stop the sampling thread"""
+        self.stop_event.set()
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=5)
+
+    def _worker_loop(self):
+        """Sample every interval until stopped"""
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                self.stats['failed_samples'] += 1
+                logger.error(f"System metrics sample failed: {str(e)}")
+            if self.stop_event.wait(self.interval):
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get sampler statistics"""
+        with self.lock:
+            return {
+                **self.stats,
+                'buffered_samples': len(self.samples),
+                'history_size': self.samples.maxlen,
+                'interval_seconds': self.interval,
+                'running': bool(self.worker_thread and self.worker_thread.is_alive())
+            }
+
+
+# Global system metrics sampler instance
+system_metrics = SystemMetricsSampler()
+
+
+def init_system_metrics(app):
+    """Configure and start the system metrics sampler"""
+    system_metrics.app = app
+    system_metrics.interval = app.config.get('SYSTEM_METRICS_INTERVAL', 5.0)
+    system_metrics.supabase_interval = app.config.get('SYSTEM_METRICS_SUPABASE_INTERVAL', 30.0)
+    history_size = app.config.get('SYSTEM_METRICS_HISTORY_SIZE', 720)
+    if history_size != system_metrics.samples.maxlen:
+        system_metrics.samples = deque(system_metrics.samples, maxlen=history_size)
+    system_metrics.start()
+
+    atexit.register(system_metrics.stop)
+
+    app.system_metrics = system_metrics
+    app.logger.info(f"System metrics sampled every {system_metrics.interval}s")
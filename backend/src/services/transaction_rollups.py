@@ -0,0 +1,361 @@
+"""
+Transaction Rollups - Hourly and daily dashboard aggregates for SatuPay
+Keeps per-bucket counts and volume of finished transactions so time series
+read a bounded number of rows instead of scanning the transactions table
+"""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.database.connection import db
+
+logger = logging.getLogger(__name__)
+
+# Statuses a transaction finishes in; rollups count each transaction once, when it gets there
+FINISHED_STATUSES = ('completed', 'failed', 'refunded')
+
+# Upper bound (inclusive, MYR) and label of each amount range
+AMOUNT_BUCKETS = [(50, '0-50'), (200, '51-200'), (500, '201-500'), (1000, '501-1000'), (None, '1000+')]
+
+GRANULARITIES = ('hour', 'day')
+
+
+def amount_bucket(amount) -> str:
+    """Label of the amount range an amount falls in"""
+    for upper, label in AMOUNT_BUCKETS:
+        if upper is None or amount <= upper:
+            return label
+
+
+def _naive_utc(timestamp) -> datetime:
+    """Normalize to the naive UTC datetimes the rollup table stores"""
+    if timestamp is None:
+        return datetime.utcnow()
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def bucket_start(timestamp, granularity: str) -> datetime:
+    """Start of the hour or day bucket containing timestamp"""
+    timestamp = _naive_utc(timestamp)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rollup_table():
+    """The transaction_rollups table"""
+    from src.models.transaction_rollup import TransactionRollup
+    return TransactionRollup.__table__
+
+
+def _upsert_rollups(connection, rows: List[Dict[str, Any]]):
+    """Add counts and amounts to existing buckets, creating missing ones"""
+    table = _rollup_table()
+    dialect = connection.dialect.name
+
+    if dialect in ('postgresql', 'sqlite'):
+        statement = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key.columns],
+            set_={
+                'transaction_count': table.c.transaction_count + statement.excluded.transaction_count,
+                'total_amount': table.c.total_amount + statement.excluded.total_amount,
+                'updated_at': statement.excluded.updated_at
+            }
+        )
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        key = [table.c[column.name] == row[column.name] for column in table.primary_key.columns]
+        result = connection.execute(update(table).where(*key).values(
+            transaction_count=table.c.transaction_count + row['transaction_count'],
+            total_amount=table.c.total_amount + row['total_amount'],
+            updated_at=row['updated_at']
+        ))
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+
+class RollupWriter:
+    """Accumulates rollup deltas in memory and upserts them in periodic batches.
+
+    Every finished transaction adds one to an hourly and a daily bucket.
+    Folding those increments in memory first turns a burst of completions
+    into one upsert per bucket, so concurrent requests never queue on the
+    same hot rollup row. Deltas that fail to write are kept for the next
+    flush; anything lost in a crash is re-derived by backfill_rollups.
+    """
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.app = None
+        self.flush_interval = flush_interval
+        self.pending: Dict[Tuple, list] = {}  # bucket key -> [count, amount]
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.worker_thread = None
+        self.stats = {'recorded': 0, 'retracted': 0, 'flushes': 0, 'flushed_buckets': 0, 'failed_flushes': 0, 'last_flush_ms': 0}
+
+    def record(self, status: str, payment_rail: str, amount, completed_at=None, count: int = 1):
+        """Count a transaction that just finished; count=-1 takes back an earlier record"""
+        if status not in FINISHED_STATUSES:
+            return
+
+        amount = Decimal(str(amount or 0))
+        label = amount_bucket(amount)
+        with self.lock:
+            for granularity in GRANULARITIES:
+                key = (granularity, bucket_start(completed_at, granularity), status, payment_rail or 'unknown', label)
+                delta = self.pending.setdefault(key, [0, Decimal('0')])
+                delta[0] += count
+                delta[1] += amount * count
+            self.stats['recorded' if count > 0 else 'retracted'] += 1
+
+    def move(self, previous_status: str, previous_completed_at, status: str, payment_rail: str, amount, completed_at=None):
+        """Re-count a transaction that changed status, e.g. completed to refunded"""
+        self.record(previous_status, payment_rail, amount, previous_completed_at, count=-1)
+        self.record(status, payment_rail, amount, completed_at)
+
+    def flush(self) -> int:
+        """Upsert all pending deltas in one transaction; returns the number of buckets written"""
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            if not pending:
+                return 0
+
+            start_time = time.time()
+            now = datetime.utcnow()
+            # Sorted so concurrent workers lock shared buckets in the same order
+            rows = [{
+                'granularity': key[0], 'bucket_start': key[1], 'status': key[2],
+                'payment_rail': key[3], 'amount_bucket': key[4],
+                'transaction_count': count, 'total_amount': amount, 'updated_at': now
+            } for key, (count, amount) in sorted(pending.items())]
+
+            try:
+                if self.app:
+                    with self.app.app_context():
+                        self._write(rows)
+                else:
+                    self._write(rows)
+            except Exception as e:
+                self._restore(pending)
+                self.stats['failed_flushes'] += 1
+                logger.error(f"Failed to write {len(rows)} rollup buckets: {str(e)}")
+                return 0
+
+            self.stats['flushes'] += 1
+            self.stats['flushed_buckets'] += len(rows)
+            self.stats['last_flush_ms'] = round((time.time() - start_time) * 1000, 2)
+            return len(rows)
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        """Run the upsert in its own transaction"""
+        table = _rollup_table()
+        with db.engine.begin() as connection:
+            _upsert_rollups(connection, rows)
+            # Retractions can empty a bucket; drop it so the table matches a backfill
+            for row in rows:
+                if row['transaction_count'] < 0:
+                    key = [table.c[column.name] == row[column.name] for column in table.primary_key.columns]
+                    connection.execute(delete(table).where(*key, table.c.transaction_count == 0))
+
+    def _restore(self, pending: Dict[Tuple, list]):
+        """Put deltas from a failed flush back for the next one"""
+        with self.lock:
+            for key, (count, amount) in pending.items():
+                delta = self.pending.setdefault(key, [0, Decimal('0')])
+                delta[0] += count
+                delta[1] += amount
+
+    def discard(self, start: datetime, end: datetime):
+        """Drop pending deltas for buckets in [start, end); they are being recomputed"""
+        with self.lock:
+            for key in [key for key in self.pending if start <= key[1] < end]:
+                del self.pending[key]
+
+    def start(self):
+        """Start the background flush thread"""
+        if self.worker_thread and self.worker_thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker_thread.start()
+
+    def stop(self):
+        """Stop the flush thread and write out pending deltas"""
+        self.stop_event.set()
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=5)
+        self.flush()
+
+    def _worker_loop(self):
+        """Flush every flush_interval until stopped"""
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get writer statistics"""
+        with self.lock:
+            return {
+                **self.stats,
+                'pending_buckets': len(self.pending),
+                'flush_interval_seconds': self.flush_interval
+            }
+
+
+def _hour_expression(dialect: str, column):
+    """SQL expression truncating a timestamp to its hour"""
+    if dialect == 'sqlite':
+        return func.strftime('%Y-%m-%d %H:00:00', column)
+    return func.date_trunc('hour', column)
+
+
+def _compute_rollups(connection, start_day: datetime, end_day: datetime) -> Tuple[List[Dict[str, Any]], int]:
+    """Rollup rows for [start_day, end_day) computed from the transactions table, and the transaction count"""
+    from src.models.transaction import Transaction
+
+    transactions = Transaction.__table__
+    amount_range = case(
+        *[(transactions.c.amount <= upper, label) for upper, label in AMOUNT_BUCKETS if upper is not None],
+        else_=AMOUNT_BUCKETS[-1][1]
+    )
+    query = select(
+        _hour_expression(connection.dialect.name, transactions.c.completed_at).label('hour'),
+        transactions.c.status.label('status'),
+        func.coalesce(transactions.c.payment_rail, 'unknown').label('payment_rail'),
+        amount_range.label('amount_bucket'),
+        func.count().label('transaction_count'),
+        func.sum(transactions.c.amount).label('total_amount')
+    ).where(
+        transactions.c.status.in_(FINISHED_STATUSES),
+        transactions.c.completed_at >= start_day,
+        transactions.c.completed_at < end_day
+    ).group_by('hour', 'status', 'payment_rail', 'amount_bucket')
+
+    # Hourly buckets come straight from the scan; days are sums of their hours
+    buckets: Dict[Tuple, list] = {}
+    total = 0
+    for row in connection.execute(query):
+        hour = row.hour
+        if isinstance(hour, str):
+            hour = datetime.strptime(hour, '%Y-%m-%d %H:%M:%S')
+        amount = Decimal(str(row.total_amount or 0))
+        total += row.transaction_count
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(hour, granularity), row.status, row.payment_rail, row.amount_bucket)
+            delta = buckets.setdefault(key, [0, Decimal('0')])
+            delta[0] += row.transaction_count
+            delta[1] += amount
+
+    now = datetime.utcnow()
+    rows = [{
+        'granularity': key[0], 'bucket_start': key[1], 'status': key[2],
+        'payment_rail': key[3], 'amount_bucket': key[4],
+        'transaction_count': count, 'total_amount': amount, 'updated_at': now
+    } for key, (count, amount) in sorted(buckets.items())]
+    return rows, total
+
+
+def backfill_rollups(start: datetime, end: datetime = None) -> Dict[str, int]:
+    """Recompute the rollups of whole days from start to end from the transactions table.
+
+    Existing buckets in the range are replaced in one transaction, and
+    pending in-memory deltas for the range are dropped, since the rescan
+    already counts those transactions.
+    """
+    start_day = bucket_start(start, 'day')
+    end_day = bucket_start(end, 'day') + timedelta(days=1)
+    table = _rollup_table()
+
+    rollup_writer.flush()
+    with rollup_writer.flush_lock, db.engine.begin() as connection:
+        rows, total = _compute_rollups(connection, start_day, end_day)
+        connection.execute(delete(table).where(table.c.bucket_start >= start_day, table.c.bucket_start < end_day))
+        if rows:
+            connection.execute(insert(table), rows)
+        rollup_writer.discard(start_day, end_day)
+
+    return {
+        'transactions': total,
+        'hour_buckets': sum(1 for row in rows if row['granularity'] == 'hour'),
+        'day_buckets': sum(1 for row in rows if row['granularity'] == 'day'),
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat()
+    }
+
+
+def verify_rollups(start: datetime, end: datetime = None) -> List[Dict[str, Any]]:
+    """Compare stored rollups of whole days from start to end with a fresh scan.
+
+    Pending deltas are flushed first. Returns the buckets whose count or
+    amount differ, empty when the incremental rollups match a backfill.
+    """
+    start_day = bucket_start(start, 'day')
+    end_day = bucket_start(end, 'day') + timedelta(days=1)
+    table = _rollup_table()
+    key_columns = [column.name for column in table.primary_key.columns]
+
+    rollup_writer.flush()
+    with db.engine.connect() as connection:
+        expected_rows, _ = _compute_rollups(connection, start_day, end_day)
+        stored_rows = connection.execute(
+            select(table).where(table.c.bucket_start >= start_day, table.c.bucket_start < end_day)
+        ).mappings().all()
+
+    expected = {tuple(row[name] for name in key_columns): row for row in expected_rows}
+    stored = {tuple(row[name] for name in key_columns): row for row in stored_rows}
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        want, have = expected.get(key), stored.get(key)
+        want_count, want_amount = (want['transaction_count'], Decimal(str(want['total_amount']))) if want else (0, Decimal('0'))
+        have_count, have_amount = (have['transaction_count'], Decimal(str(have['total_amount']))) if have else (0, Decimal('0'))
+        if want_count != have_count or want_amount != have_amount:
+            mismatches.append({
+                **dict(zip(key_columns, key)),
+                'expected_count': want_count, 'stored_count': have_count,
+                'expected_amount': float(want_amount), 'stored_amount': float(have_amount)
+            })
+    return mismatches
+
+
+def read_rollups(granularity: str, start: datetime, end: datetime = None) -> List[Any]:
+    """Rollup buckets of one granularity from the bucket containing start up to end"""
+    from src.models.transaction_rollup import TransactionRollup
+
+    query = TransactionRollup.query.filter(
+        TransactionRollup.granularity == granularity,
+        TransactionRollup.bucket_start >= bucket_start(start, granularity)
+    )
+    if end is not None:
+        query = query.filter(TransactionRollup.bucket_start <= _naive_utc(end))
+    return query.order_by(TransactionRollup.bucket_start).all()
+
+
+# Global rollup writer instance
+rollup_writer = RollupWriter()
+
+
+def init_transaction_rollups(app):
+    """Configure and start the rollup writer"""
+    rollup_writer.app = app
+    rollup_writer.flush_interval = app.config.get('ROLLUP_FLUSH_INTERVAL', 5.0)
+    rollup_writer.start()
+
+    # Write pending deltas on shutdown
+    atexit.register(rollup_writer.stop)
+
+    app.rollup_writer = rollup_writer
+    app.logger.info(f"Transaction rollups flushed every {rollup_writer.flush_interval}s")
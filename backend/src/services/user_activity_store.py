@@ -0,0 +1,196 @@
+"""
+User Activity Store - Sliding-window transaction counters for SatuPay
+Backs the frequency and velocity risk checks without a database round trip
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _to_epoch(timestamp) -> float:
+    """Convert a datetime (naive values are UTC) or epoch seconds to epoch seconds"""
+    if timestamp is None:
+        return time.time()
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+class RingCounter:
+    """Fixed-size ring of time buckets holding a count and a sum each.
+
+    Running totals are kept alongside the ring, so recording an event and
+    reading the window totals are both O(1); advancing the ring costs one
+    step per elapsed bucket, capped at the ring size.
+    """
+
+    __slots__ = ('bucket_seconds', 'size', 'counts', 'sums', 'head', 'total_count', 'total_sum')
+
+    def __init__(self, bucket_seconds: int, size: int):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.counts = [0] * size
+        self.sums = [0.0] * size
+        self.head = None  # Index of the newest bucket in the window
+        self.total_count = 0
+        self.total_sum = 0.0
+
+    def _advance(self, bucket: int):
+        """Move the window forward so it ends at bucket, expiring older buckets"""
+        if self.head is None or bucket - self.head >= self.size:
+            self.counts = [0] * self.size
+            self.sums = [0.0] * self.size
+            self.total_count = 0
+            self.total_sum = 0.0
+            self.head = bucket
+            return
+
+        while self.head < bucket:
+            self.head += 1
+            slot = self.head % self.size
+            self.total_count -= self.counts[slot]
+            self.total_sum -= self.sums[slot]
+            self.counts[slot] = 0
+            self.sums[slot] = 0.0
+
+    def add(self, epoch: float, amount: float):
+        """Record one event at epoch seconds"""
+        bucket = int(epoch // self.bucket_seconds)
+        if self.head is None or bucket > self.head:
+            self._advance(bucket)
+        elif bucket <= self.head - self.size:
+            return  # Older than the window
+
+        slot = bucket % self.size
+        self.counts[slot] += 1
+        self.sums[slot] += amount
+        self.total_count += 1
+        self.total_sum += amount
+
+    def totals(self, epoch: float) -> Tuple[int, float]:
+        """Get (count, sum) over the window ending at epoch seconds"""
+        if self.head is None:
+            return 0, 0.0
+
+        bucket = int(epoch // self.bucket_seconds)
+        if bucket > self.head:
+            self._advance(bucket)
+        return self.total_count, max(self.total_sum, 0.0)
+
+
+class UserActivityStore:
+    """In-memory per-user activity windows for risk checks.
+
+    Each user has a ring of 60 one-minute buckets (last hour) and a ring of
+    24 one-hour buckets (last day, at hour granularity).
+    """
+
+    def __init__(self, idle_seconds: int = 86400, prune_every: int = 10000):
+        self.app = None
+        self.users: Dict[str, Tuple[RingCounter, RingCounter, float]] = {}
+        self.lock = threading.Lock()
+        self.idle_seconds = idle_seconds
+        self.prune_every = prune_every
+        self.records_since_prune = 0
+        self.warmed_up = False
+
+    def record(self, user_id, amount: float, timestamp=None):
+        """Record a completed transaction for a user"""
+        if not user_id:
+            return
+
+        epoch = _to_epoch(timestamp)
+        key = str(user_id)
+
+        with self.lock:
+            entry = self.users.get(key)
+            if entry is None:
+                minute_ring, hour_ring, last_seen = RingCounter(60, 60), RingCounter(3600, 24), epoch
+            else:
+                minute_ring, hour_ring, last_seen = entry
+
+            minute_ring.add(epoch, float(amount))
+            hour_ring.add(epoch, float(amount))
+            self.users[key] = (minute_ring, hour_ring, max(epoch, last_seen))
+
+            self.records_since_prune += 1
+            if self.records_since_prune >= self.prune_every:
+                self._prune(epoch)
+
+    def get_activity(self, user_id, timestamp=None) -> Tuple[int, float]:
+        """Get (transactions in the last hour, amount in the last day) for a user"""
+        if not user_id:
+            return 0, 0.0
+
+        epoch = _to_epoch(timestamp)
+        with self.lock:
+            entry = self.users.get(str(user_id))
+            if entry is None:
+                return 0, 0.0
+
+            minute_ring, hour_ring, _ = entry
+            hour_count, _ = minute_ring.totals(epoch)
+            _, day_total = hour_ring.totals(epoch)
+            return hour_count, day_total
+
+    def _prune(self, now: float):
+        """Drop users with no activity inside the day window"""
+        cutoff = now - self.idle_seconds
+        idle_users = [key for key, entry in self.users.items() if entry[2] < cutoff]
+        for key in idle_users:
+            del self.users[key]
+        self.records_since_prune = 0
+
+    def warm_up(self) -> int:
+        """Rebuild the windows from transactions completed in the last day"""
+        from src.models.transaction import Transaction
+
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.idle_seconds)
+        rows = Transaction.query.with_entities(
+            Transaction.user_id,
+            Transaction.amount,
+            Transaction.completed_at
+        ).filter(
+            Transaction.status == 'completed',
+            Transaction.user_id.isnot(None),
+            Transaction.completed_at >= since
+        ).order_by(Transaction.completed_at).yield_per(1000)
+
+        loaded = 0
+        for user_id, amount, completed_at in rows:
+            self.record(user_id, float(amount), completed_at)
+            loaded += 1
+
+        self.warmed_up = True
+        return loaded
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get store statistics"""
+        with self.lock:
+            return {
+                'tracked_users': len(self.users),
+                'warmed_up': self.warmed_up
+            }
+
+# Global user activity store instance
+user_activity_store = UserActivityStore()
+
+def init_user_activity_store(app):
+    """Warm the activity store from the database"""
+    user_activity_store.app = app
+
+    try:
+        with app.app_context():
+            loaded = user_activity_store.warm_up()
+        app.logger.info(f"User activity store warmed up with {loaded} transactions")
+    except Exception as e:
+        app.logger.warning(f"User activity warm-up failed, starting empty: {str(e)}")
+
+    app.user_activity_store = user_activity_store
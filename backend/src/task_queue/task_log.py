@@ -0,0 +1,228 @@
+"""
+Task Log for SatuPay Payment Switch
+Append-only write-ahead log that makes the in-memory task queue crash-recoverable
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+class TaskLog:
+    """Write-ahead log of task state transitions.
+    
+    Each transition is one JSON line. Appends are buffered and a background
+    writer group-commits everything buffered with a single write and fsync,
+    so many tasks share one fsync. Callers that need durability wait for
+    the commit covering their record. The log is rewritten with only the
+    live tasks once enough records have piled up.
+    """
+    
+    def __init__(self, path: str, commit_interval: float = 0.0, compact_every: int = 10000):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.compact_every = compact_every
+        self.live: Dict[str, Dict[str, Any]] = {}  # task_id -> task still pending or running
+        self.buffer: List[str] = []
+        self.appended_seq = 0
+        self.committed_seq = 0
+        self.records_since_compaction = 0
+        self.commits = 0
+        self.compactions = 0
+        self.file = None
+        self.writer_active = False
+        self.writer_thread = None
+        self.lock = threading.Lock()
+        self.committed = threading.Condition(self.lock)
+        self.work_available = threading.Condition(self.lock)
+    
+    def replay(self) -> List[Dict[str, Any]]:
+        """Read the log and return tasks that had not finished, in log order"""
+        self.live = {}
+        if not os.path.exists(self.path):
+            return []
+        
+        records = 0
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final write from a crash; everything before it is intact
+                    logger.warning(f"Ignoring unreadable task log record in {self.path}")
+                    break
+                
+                records += 1
+                op = record.get('op')
+                if op == 'add':
+                    self.live[record['task']['id']] = record['task']
+                elif op == 'retry' and record['id'] in self.live:
+                    self.live[record['id']]['retries'] = record['retries']
+                elif op in ('completed', 'failed'):
+                    self.live.pop(record['id'], None)
+        
+        self.records_since_compaction = records
+        logger.info(f"Replayed {records} task log records, {len(self.live)} tasks to recover")
+        return list(self.live.values())
+    
+    def start(self):
+        """Open the log for appending and start the group-commit writer"""
+        if self.writer_active:
+            return
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        # Start from a compacted log so replayed tasks are not carried twice
+        self._compact()
+        self.writer_active = True
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+    
+    def stop(self):
+        """Commit anything buffered and close the log"""
+        with self.lock:
+            if not self.writer_active:
+                return
+            self.writer_active = False
+            self.work_available.notify_all()
+        
+        if self.writer_thread and self.writer_thread.is_alive():
+            self.writer_thread.join(timeout=5)
+        self._commit()
+        if self.file:
+            self.file.close()
+            self.file = None
+    
+    def append(self, op: str, task: Dict[str, Any], **fields) -> int:
+        """Buffer a transition record and return its sequence number"""
+        if op == 'add':
+            record = {'op': op, 'task': self._snapshot(task)}
+        else:
+            record = {'op': op, 'id': task['id'], **fields}
+        line = json.dumps(record, default=str) + '\n'
+        
+        with self.lock:
+            if op == 'add':
+                self.live[task['id']] = task
+            elif op in ('completed', 'failed'):
+                self.live.pop(task['id'], None)
+            
+            self.buffer.append(line)
+            self.appended_seq += 1
+            self.work_available.notify()
+            return self.appended_seq
+    
+    def wait_for_commit(self, seq: int, timeout: float = 5.0) -> bool:
+        """Block until the record with this sequence number is on disk"""
+        with self.lock:
+            return self.committed.wait_for(
+                lambda: self.committed_seq >= seq or not self.writer_active, timeout
+            ) and self.committed_seq >= seq
+    
+    def _snapshot(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy the task fields worth persisting"""
+        return {
+            'id': task['id'],
+            'type': task['type'],
+            'data': task['data'],
+            'priority': task['priority'],
+            'created_at': task['created_at'],
+            'retries': task['retries'],
+            'max_retries': task['max_retries']
+        }
+    
+    def _writer_loop(self):
+        """Group-commit buffered records until stopped"""
+        while self.writer_active:
+            with self.lock:
+                if not self.buffer:
+                    self.work_available.wait(1.0)
+            
+            # Appends arriving during the previous fsync are already batched;
+            # the optional interval widens the window further
+            if self.commit_interval:
+                time.sleep(self.commit_interval)
+            try:
+                self._commit()
+                if self._should_compact():
+                    self._compact()
+            except Exception as e:
+                logger.error(f"Task log commit error: {str(e)}")
+    
+    def _should_compact(self) -> bool:
+        """Compact once the log is large and mostly records of finished tasks"""
+        with self.lock:
+            return bool(self.compact_every) and \
+                self.records_since_compaction >= max(self.compact_every, 2 * len(self.live))
+    
+    def _commit(self):
+        """Write and fsync everything buffered"""
+        with self.lock:
+            if not self.buffer or self.file is None:
+                return
+            lines, self.buffer = self.buffer, []
+            seq = self.appended_seq
+        
+        self.file.write(''.join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        
+        with self.lock:
+            self.committed_seq = seq
+            self.records_since_compaction += len(lines)
+            self.commits += 1
+            self.committed.notify_all()
+    
+    def _compact(self):
+        """Rewrite the log with one add record per live task"""
+        with self.lock:
+            # Buffered records are reflected in live, so they can be folded in
+            live = [self._snapshot(task) for task in self.live.values()]
+            self.buffer = []
+            seq = self.appended_seq
+            
+            tmp_path = f"{self.path}.compact"
+            with open(tmp_path, 'w') as f:
+                for task in live:
+                    f.write(json.dumps({'op': 'add', 'task': task}, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            
+            if self.file:
+                self.file.close()
+            os.replace(tmp_path, self.path)
+            self._fsync_directory()
+            self.file = open(self.path, 'a')
+            
+            self.committed_seq = seq
+            self.records_since_compaction = len(live)
+            self.compactions += 1
+            self.committed.notify_all()
+    
+    def _fsync_directory(self):
+        """Persist the rename of the compacted log"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get log statistics"""
+        with self.lock:
+            return {
+                'path': self.path,
+                'live_tasks': len(self.live),
+                'buffered_records': len(self.buffer),
+                'records_since_compaction': self.records_since_compaction,
+                'commits': self.commits,
+                'compactions': self.compactions
+            }
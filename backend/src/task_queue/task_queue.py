@@ -4,31 +4,61 @@ Handles async processing of transactions and background tasks
 """
 
 import asyncio
+import atexit
+import heapq
+import itertools
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Any, List
 from collections import deque
+from .task_log import TaskLog
 import threading
 import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 class TaskQueue:
-    """Simple in-memory task queue for async processing"""
+    """Simple in-memory task queue for async processing.
     
-    def __init__(self):
+    Pending tasks live in one binary heap per task type, ordered by
+    priority, then FIFO. The next task is the best heap head among types
+    that are below their concurrency limit, so slow task types cannot
+    occupy every worker. With aging enabled a task gains one priority level
+    per aging_seconds spent waiting, so low-priority work cannot be starved
+    indefinitely. Since every pending task ages at the same rate, the aged
+    ordering only depends on priority and enqueue time and can be fixed at
+    enqueue.
+    
+    Workers block on a condition variable and are woken when a task is
+    added or a concurrency slot frees up.
+    """
+    
+    def __init__(self, aging_seconds: float = 60.0, num_workers: int = 4,
+                 type_limits: Dict[str, int] = None):
         self.app = None
-        self.tasks = deque()
+        self.tasks: Dict[str, list] = {}  # task type -> heap of (sort_key, sequence, task)
+        self.pending_count = 0
+        self.sequence = itertools.count()
+        self.aging_seconds = aging_seconds
+        self.num_workers = num_workers
+        self.type_limits = dict(type_limits or {})
+        self.running_by_type: Dict[str, int] = {}
+        self.type_stats: Dict[str, Dict[str, float]] = {}
+        self.index: Dict[str, Dict[str, Any]] = {}  # task_id -> task, for every tracked task
         self.processing = {}
         self.completed = deque(maxlen=1000)  # Keep last 1000 completed tasks
         self.failed = deque(maxlen=500)      # Keep last 500 failed tasks
+        self.task_log: TaskLog = None  # Set when persistence is enabled
+        self.durable_adds = True
         self.worker_active = False
-        self.worker_thread = None
+        self.worker_threads: List[threading.Thread] = []
         self.lock = threading.Lock()
+        self.task_available = threading.Condition(self.lock)
     
     def add_task(self, task_type: str, task_data: Dict[str, Any], priority: int = 0) -> str:
         """Add a task to the queue"""
-        task_id = f"{task_type}_{int(time.time())}_{len(self.tasks)}"
+        task_id = f"{task_type}_{int(time.time())}_{uuid.uuid4().hex}"
         
         task = {
             'id': task_id,
@@ -42,121 +72,235 @@ class TaskQueue:
         }
         
         with self.lock:
-            # Insert based on priority (higher priority first)
-            inserted = False
-            for i, existing_task in enumerate(self.tasks):
-                if priority > existing_task['priority']:
-                    self.tasks.insert(i, task)
-                    inserted = True
-                    break
-            
-            if not inserted:
-                self.tasks.append(task)
+            self.index[task_id] = task
+            seq = self.task_log.append('add', task) if self.task_log else None
+            self._push(task, self._sort_key(priority))
+        
+        # Group commit: many concurrent adds share the fsync that covers them
+        if seq and self.durable_adds and not self.task_log.wait_for_commit(seq):
+            logger.warning(f"Task {task_id} queued before its log record was committed")
         
         logger.info(f"Added task {task_id} to queue (type: {task_type}, priority: {priority})")
         return task_id
     
-    def get_next_task(self) -> Dict[str, Any]:
-        """Get next task from queue"""
+    def enable_persistence(self, path: str, commit_interval: float = 0.0,
+                           compact_every: int = 10000, durable_adds: bool = True) -> int:
+        """Log task transitions to a write-ahead log and recover unfinished tasks from it.
+        
+        Tasks that were pending or running when the process stopped are
+        queued again, so processing is at-least-once.
+        """
+        task_log = TaskLog(path, commit_interval=commit_interval, compact_every=compact_every)
+        recovered = task_log.replay()
+        
         with self.lock:
-            if self.tasks:
-                return self.tasks.popleft()
+            for task in recovered:
+                task['status'] = 'pending'
+                self.index[task['id']] = task
+                self._push(task, self._sort_key(task['priority']))
+            self.task_log = task_log
+            self.durable_adds = durable_adds
+        
+        task_log.start()
+        logger.info(f"Task queue persistence enabled at {path}, recovered {len(recovered)} tasks")
+        return len(recovered)
+    
+    def _sort_key(self, priority: int) -> float:
+        """Heap key for a task enqueued now; smaller keys run first (higher priority first)"""
+        if not self.aging_seconds:
+            return -priority
+        return time.monotonic() / self.aging_seconds - priority
+    
+    def _push(self, task: Dict[str, Any], sort_key: float):
+        """Push a pending task and wake one worker; caller holds the lock"""
+        task['enqueued_at'] = time.monotonic()
+        heapq.heappush(self.tasks.setdefault(task['type'], []), (sort_key, next(self.sequence), task))
+        self.pending_count += 1
+        self.task_available.notify()
+    
+    def _pop_next(self) -> Dict[str, Any]:
+        """Pop the best task whose type has a free slot; caller holds the lock"""
+        best = None
+        for task_type, heap in self.tasks.items():
+            if not heap:
+                continue
+            limit = self.type_limits.get(task_type)
+            if limit and self.running_by_type.get(task_type, 0) >= limit:
+                continue
+            if best is None or heap[0][:2] < self.tasks[best][0][:2]:
+                best = task_type
+        
+        if best is None:
             return None
+        
+        task = heapq.heappop(self.tasks[best])[2]
+        self.pending_count -= 1
+        self.running_by_type[best] = self.running_by_type.get(best, 0) + 1
+        return task
+    
+    def get_next_task(self, block: bool = False, timeout: float = None) -> Dict[str, Any]:
+        """Get next task from queue, reserving a slot for its type.
+        
+        The slot is released when the task is marked completed or failed.
+        With block=True, waits until a task is runnable, the timeout passes
+        or the workers are stopped.
+        """
+        with self.lock:
+            task = self._pop_next()
+            if task is not None or not block:
+                return task
+            
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while task is None and self.worker_active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.task_available.wait(remaining)
+                task = self._pop_next()
+            return task
+    
+    def _release_slot(self, task: Dict[str, Any]):
+        """Free the task type's slot and record timings; caller holds the lock"""
+        task_type = task['type']
+        if self.running_by_type.get(task_type, 0) > 0:
+            self.running_by_type[task_type] -= 1
+        
+        stats = self.type_stats.setdefault(task_type, {'runs': 0, 'queue_wait_ms': 0.0, 'run_time_ms': 0.0})
+        stats['runs'] += 1
+        stats['queue_wait_ms'] += task.get('queue_wait_ms', 0.0)
+        stats['run_time_ms'] += task.get('run_time_ms', 0.0)
+        
+        # A freed slot may unblock a waiting task of this type
+        self.task_available.notify()
     
     def mark_processing(self, task: Dict[str, Any]):
         """Mark task as processing"""
+        now = time.monotonic()
         task['status'] = 'processing'
         task['processing_started'] = datetime.utcnow().isoformat()
-        self.processing[task['id']] = task
+        task['queue_wait_ms'] = round((now - task.get('enqueued_at', now)) * 1000, 2)
+        task['run_started_at'] = now
+        with self.lock:
+            self.processing[task['id']] = task
+    
+    def _record_run_time(self, task: Dict[str, Any]):
+        """Store how long the task ran, excluding time spent queued"""
+        started = task.pop('run_started_at', None)
+        if started is not None:
+            task['run_time_ms'] = round((time.monotonic() - started) * 1000, 2)
     
     def mark_completed(self, task: Dict[str, Any], result: Any = None):
         """Mark task as completed"""
+        self._record_run_time(task)
         task['status'] = 'completed'
         task['completed_at'] = datetime.utcnow().isoformat()
         task['result'] = result
         
-        if task['id'] in self.processing:
-            del self.processing[task['id']]
-        
-        self.completed.append(task)
+        with self.lock:
+            self.processing.pop(task['id'], None)
+            self._release_slot(task)
+            if self.task_log:
+                self.task_log.append('completed', task)
+            self._append_finished(self.completed, task)
         logger.info(f"Task {task['id']} completed successfully")
     
     def mark_failed(self, task: Dict[str, Any], error: str):
         """Mark task as failed"""
+        self._record_run_time(task)
         task['status'] = 'failed'
         task['failed_at'] = datetime.utcnow().isoformat()
         task['error'] = error
         task['retries'] += 1
         
-        if task['id'] in self.processing:
-            del self.processing[task['id']]
+        with self.lock:
+            self.processing.pop(task['id'], None)
+            self._release_slot(task)
+            
+            # Retry if under max retries
+            if task['retries'] < task['max_retries']:
+                task['status'] = 'pending'
+                if self.task_log:
+                    self.task_log.append('retry', task, retries=task['retries'])
+                self._push(task, float('-inf'))  # Add back to front for retry
+            else:
+                if self.task_log:
+                    self.task_log.append('failed', task)
+                self._append_finished(self.failed, task)
         
-        # Retry if under max retries
-        if task['retries'] < task['max_retries']:
-            task['status'] = 'pending'
-            with self.lock:
-                self.tasks.appendleft(task)  # Add back to front for retry
+        if task['status'] == 'pending':
             logger.warning(f"Task {task['id']} failed, retrying ({task['retries']}/{task['max_retries']})")
         else:
-            self.failed.append(task)
             logger.error(f"Task {task['id']} failed permanently: {error}")
     
+    def _append_finished(self, history: deque, task: Dict[str, Any]):
+        """Append to a bounded history, dropping the evicted task from the index; caller holds the lock"""
+        if len(history) == history.maxlen:
+            evicted = history[0]
+            if self.index.get(evicted['id']) is evicted:
+                del self.index[evicted['id']]
+        history.append(task)
+    
     def get_stats(self) -> Dict[str, Any]:
         """Get queue statistics"""
         with self.lock:
+            task_types = {}
+            for task_type in set(self.tasks) | set(self.type_stats):
+                stats = self.type_stats.get(task_type, {'runs': 0, 'queue_wait_ms': 0.0, 'run_time_ms': 0.0})
+                runs = stats['runs']
+                task_types[task_type] = {
+                    'pending': len(self.tasks.get(task_type, [])),
+                    'running': self.running_by_type.get(task_type, 0),
+                    'concurrency_limit': self.type_limits.get(task_type),
+                    'runs': runs,
+                    'avg_queue_wait_ms': round(stats['queue_wait_ms'] / runs, 2) if runs else 0.0,
+                    'avg_run_time_ms': round(stats['run_time_ms'] / runs, 2) if runs else 0.0
+                }
+            
             return {
-                'pending_tasks': len(self.tasks),
+                'pending_tasks': self.pending_count,
                 'processing_tasks': len(self.processing),
                 'completed_tasks': len(self.completed),
                 'failed_tasks': len(self.failed),
+                'tracked_tasks': len(self.index),
                 'worker_active': self.worker_active,
+                'workers': sum(1 for thread in self.worker_threads if thread.is_alive()),
+                'task_types': task_types,
+                'task_log': self.task_log.get_stats() if self.task_log else None,
                 'timestamp': datetime.utcnow().isoformat()
             }
     
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
         """Get status of a specific task"""
-        # Check processing
-        if task_id in self.processing:
-            return self.processing[task_id]
-        
-        # Check completed
-        for task in self.completed:
-            if task['id'] == task_id:
-                return task
-        
-        # Check failed
-        for task in self.failed:
-            if task['id'] == task_id:
-                return task
-        
-        # Check pending
         with self.lock:
-            for task in self.tasks:
-                if task['id'] == task_id:
-                    return task
-        
-        return None
+            return self.index.get(task_id)
     
     def start_worker(self):
-        """Start background worker thread"""
+        """Start the background worker pool"""
         if not self.worker_active:
             self.worker_active = True
-            self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
-            self.worker_thread.start()
-            logger.info("Task queue worker started")
+            self.worker_threads = [
+                threading.Thread(target=self._worker_loop, name=f"task-worker-{i}", daemon=True)
+                for i in range(max(1, self.num_workers))
+            ]
+            for thread in self.worker_threads:
+                thread.start()
+            logger.info(f"Task queue started {len(self.worker_threads)} workers")
     
     def stop_worker(self):
-        """Stop background worker thread"""
-        self.worker_active = False
-        if self.worker_thread and self.worker_thread.is_alive():
-            self.worker_thread.join(timeout=5)
-        logger.info("Task queue worker stopped")
+        """Stop the background worker pool"""
+        with self.lock:
+            self.worker_active = False
+            self.task_available.notify_all()
+        for thread in self.worker_threads:
+            if thread.is_alive():
+                thread.join(timeout=5)
+        logger.info("Task queue workers stopped")
     
     def _worker_loop(self):
         """Background worker loop"""
         while self.worker_active:
             try:
-                task = self.get_next_task()
+                task = self.get_next_task(block=True)
                 if task:
                     self.mark_processing(task)
                     try:
@@ -168,8 +312,6 @@ class TaskQueue:
                         self.mark_completed(task, result)
                     except Exception as e:
                         self.mark_failed(task, str(e))
-                else:
-                    time.sleep(0.1)  # Short sleep when no tasks
             except Exception as e:
                 logger.error(f"Worker loop error: {str(e)}")
                 time.sleep(1)
@@ -187,6 +329,8 @@ class TaskQueue:
             return self._cleanup_tokens(task_data)
         elif task_type == 'qr_cleanup':
             return self._cleanup_qr_codes(task_data)
+        elif task_type == 'rollup_backfill':
+            return self._backfill_rollups(task_data)
         elif task_type == 'notification':
             return self._send_notification(task_data)
         else:
@@ -217,11 +361,13 @@ class TaskQueue:
     def _cleanup_tokens(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Cleanup expired tokens"""
         from src.models.offline_token import OfflineToken
+        from src.middleware.idempotency import idempotency_store
         
         try:
             cleaned_count = OfflineToken.cleanup_expired_tokens()
             return {
                 'cleaned_tokens': cleaned_count,
+                'cleaned_idempotency_keys': idempotency_store.purge_expired(),
                 'cleanup_time': datetime.utcnow().isoformat()
             }
         except Exception as e:
@@ -246,6 +392,14 @@ class TaskQueue:
                 'cleanup_time': datetime.utcnow().isoformat()
             }
     
+    def _backfill_rollups(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Recompute dashboard rollups for the last few days"""
+        from src.services.transaction_rollups import backfill_rollups
+        
+        days = int(data.get('days', 1))
+        result = backfill_rollups(datetime.utcnow() - timedelta(days=days))
+        return {**result, 'backfill_time': datetime.utcnow().isoformat()}
+    
     def _send_notification(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Send notification (mock implementation)"""
         # Mock notification sending
@@ -261,6 +415,15 @@ class TaskQueue:
 # Global task queue instance
 task_queue = TaskQueue()
 
+def _parse_type_limits(value: str) -> Dict[str, int]:
+    """Parse "task_type:limit,..." into per-type concurrency limits"""
+    limits = {}
+    for item in value.split(','):
+        if ':' in item:
+            task_type, limit = item.split(':', 1)
+            limits[task_type.strip()] = int(limit)
+    return limits
+
 def init_celery(app):
     """Initialize task queue (Celery replacement for demo)"""
     # In production, this would initialize Celery
@@ -268,6 +431,20 @@ def init_celery(app):
     
     app.task_queue = task_queue
     task_queue.app = app
+    task_queue.aging_seconds = app.config.get('TASK_QUEUE_AGING_SECONDS', task_queue.aging_seconds)
+    task_queue.num_workers = app.config.get('TASK_QUEUE_WORKERS', task_queue.num_workers)
+    task_queue.type_limits = _parse_type_limits(app.config.get('TASK_QUEUE_TYPE_LIMITS', ''))
+    
+    # Persist queued work across restarts when a log path is configured
+    wal_path = app.config.get('TASK_QUEUE_WAL_PATH')
+    if wal_path:
+        recovered = task_queue.enable_persistence(
+            wal_path,
+            commit_interval=app.config.get('TASK_QUEUE_WAL_COMMIT_MS', 0) / 1000,
+            compact_every=app.config.get('TASK_QUEUE_WAL_COMPACT_EVERY', 10000)
+        )
+        atexit.register(task_queue.task_log.stop)
+        app.logger.info(f"Task queue recovered {recovered} tasks from {wal_path}")
     task_queue.start_worker()
     
     # Schedule periodic tasks after a delay to ensure app is ready
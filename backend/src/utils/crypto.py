@@ -6,70 +6,259 @@ Handles token signing, verification, and secure payload creation
 import hmac
 import hashlib
 import secrets
+import functools
 import json
+import logging
 import os
+import struct
+import threading
 from base64 import b64encode, b64decode
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, ed25519, padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
+from src.config.settings import Config
 
-# Server's private key for signing tokens (in production, use proper key management)
+logger = logging.getLogger(__name__)
+
+# Server's private key for signing tokens, loaded through the key manager
 SERVER_PRIVATE_KEY = None
 SERVER_PUBLIC_KEY = None
 
+# RSA padding and hash objects are immutable, so one instance serves every call
+RSA_HASH_ALGORITHM = hashes.SHA256()
+RSA_SIGNATURE_PADDING = padding.PSS(
+    mgf=padding.MGF1(RSA_HASH_ALGORITHM),
+    salt_length=padding.PSS.MAX_LENGTH
+)
+
+# Bluetooth payload encryption framing
+BLUETOOTH_KEY_INFO = b'satupay-bluetooth-payload-v1'
+STREAM_AAD_PREFIX = b'satupay-stream-v1'
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+FRAME_LENGTH = struct.Struct('>I')
+STREAM_HEADER = struct.Struct('>BI')  # flags, ciphertext length
+
+_key_manager = None
+_key_manager_lock = threading.Lock()
+
+
+class SigningKey:
+    """A private or public key together with its scheme and key ID"""
+
+    def __init__(self, key):
+        self.private_key = key if hasattr(key, 'public_key') else None
+        self.public_key = key.public_key() if self.private_key else key
+
+        if isinstance(self.public_key, ed25519.Ed25519PublicKey):
+            self.scheme = 'ed25519'
+        elif isinstance(self.public_key, rsa.RSAPublicKey):
+            self.scheme = 'rsa'
+        else:
+            raise ValueError(f"Unsupported signing key type: {type(self.public_key).__name__}")
+
+        # Key ID: short fingerprint of the public key, stable across processes
+        public_der = self.public_key.public_bytes(
+            encoding=serialization.Encoding.DER,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.key_id = f"{self.scheme}-{hashlib.sha256(public_der).hexdigest()[:16]}"
+
+    def sign(self, data):
+        """Sign bytes"""
+        if self.scheme == 'ed25519':
+            return self.private_key.sign(data)
+        return self.private_key.sign(data, RSA_SIGNATURE_PADDING, RSA_HASH_ALGORITHM)
+
+    def verify(self, signature, data):
+        """Verify a signature over bytes; raises InvalidSignature on mismatch"""
+        if self.scheme == 'ed25519':
+            self.public_key.verify(signature, data)
+        else:
+            self.public_key.verify(signature, data, RSA_SIGNATURE_PADDING, RSA_HASH_ALGORITHM)
+
+
+class KeyManager:
+    """Loads the server signing keys once and signs/verifies with key IDs.
+
+    The active key comes from the SIGNING_PRIVATE_KEY environment variable
+    (PEM text) or from the PEM file at SIGNING_KEY_FILE. A missing file is
+    created with a fresh key of SIGNING_SCHEME (Ed25519 by default, RSA for
+    compatibility), so every worker sharing the file signs with the same
+    key. Keys listed in SIGNING_RETIRED_KEY_FILES stay valid for
+    verification, which lets keys rotate.
+
+    Signatures are "<key_id>:<base64 signature>". Bare base64 signatures
+    from before key IDs are checked against the RSA keys.
+    """
+
+    def __init__(self, key_file=None, key_pem=None, password=None, scheme='ed25519', retired_key_files=()):
+        self.key_file = key_file
+        self.scheme = scheme
+        self.source = None
+        self.active_key = SigningKey(self._load_private_key(key_pem, password))
+        self.private_key = self.active_key.private_key
+        self.public_key = self.active_key.public_key
+
+        self.keys = {self.active_key.key_id: self.active_key}
+        for path in retired_key_files:
+            retired_key = SigningKey(self._read_key_file(path, password.encode() if password else None))
+            self.keys.setdefault(retired_key.key_id, retired_key)
+
+    def _load_private_key(self, key_pem, password):
+        """Load the key from PEM text or the key file, creating the file if needed"""
+        password_bytes = password.encode() if password else None
+
+        if key_pem:
+            self.source = 'env'
+            return serialization.load_pem_private_key(
+                key_pem.encode(), password=password_bytes, backend=default_backend())
+
+        if not self.key_file:
+            self.source = 'ephemeral'
+            logger.warning("No signing key configured; signatures will only verify in this process")
+            return self._generate_private_key()
+
+        if not os.path.exists(self.key_file):
+            self._create_key_file(password_bytes)
+
+        self.source = 'file'
+        return self._read_key_file(self.key_file, password_bytes)
+
+    def _read_key_file(self, path, password_bytes):
+        """Read a PEM private key, or a public key for verification only"""
+        with open(path, 'rb') as f:
+            pem = f.read()
+        if b'PUBLIC KEY' in pem:
+            return serialization.load_pem_public_key(pem, backend=default_backend())
+        return serialization.load_pem_private_key(pem, password=password_bytes, backend=default_backend())
+
+    def _create_key_file(self, password_bytes):
+        """Write a new key to the key file unless another worker got there first"""
+        private_key = self._generate_private_key()
+        encryption = (serialization.BestAvailableEncryption(password_bytes)
+                      if password_bytes else serialization.NoEncryption())
+        pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=encryption
+        )
+
+        directory = os.path.dirname(self.key_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Write fully to a private temp file, then link it into place atomically
+        tmp_path = f"{self.key_file}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pem)
+            os.link(tmp_path, self.key_file)
+            logger.info(f"Generated {self.scheme} signing key at {self.key_file}")
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def _generate_private_key(self):
+        """Generate a new private key for the configured scheme"""
+        if self.scheme == 'rsa':
+            return rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048,
+                backend=default_backend()
+            )
+        if self.scheme == 'ed25519':
+            return ed25519.Ed25519PrivateKey.generate()
+        raise ValueError(f"Unsupported signing scheme: {self.scheme}")
+
+    def sign(self, data):
+        """Sign bytes with the active key; returns a "<key_id>:<base64 signature>" string"""
+        signature = self.active_key.sign(data)
+        return f"{self.active_key.key_id}:{b64encode(signature).decode('utf-8')}"
+
+    def verify(self, data, signature):
+        """Verify a signature string over bytes"""
+        return self.verify_many([data], [signature])[0]
+
+    def verify_many(self, payloads, signatures):
+        """Verify signature strings over byte payloads in one pass; returns a list of booleans"""
+        legacy_keys = [key for key in self.keys.values() if key.scheme == 'rsa']
+        results = []
+
+        for data, signature in zip(payloads, signatures):
+            try:
+                key_id, _, encoded = signature.rpartition(':')
+                signature_bytes = b64decode(encoded.encode('utf-8'))
+                candidates = [self.keys[key_id]] if key_id else legacy_keys
+            except Exception:
+                results.append(False)
+                continue
+
+            results.append(any(self._verify_with(key, signature_bytes, data) for key in candidates))
+
+        return results
+
+    def _verify_with(self, key, signature_bytes, data):
+        """Check one signature against one key"""
+        try:
+            key.verify(signature_bytes, data)
+            return True
+        except Exception:
+            return False
+
+
+def get_key_manager():
+    """Get the process-wide key manager, loading the keys on first use"""
+    global _key_manager
+
+    if _key_manager is None:
+        with _key_manager_lock:
+            if _key_manager is None:
+                _key_manager = KeyManager(
+                    key_file=Config.SIGNING_KEY_FILE,
+                    key_pem=Config.SIGNING_PRIVATE_KEY,
+                    password=Config.SIGNING_KEY_PASSWORD,
+                    scheme=Config.SIGNING_SCHEME,
+                    retired_key_files=Config.SIGNING_RETIRED_KEY_FILES
+                )
+    return _key_manager
+
 
 def initialize_crypto():
     """Initialize cryptographic keys"""
     global SERVER_PRIVATE_KEY, SERVER_PUBLIC_KEY
 
-    # Generate RSA key pair if not exists
-    if SERVER_PRIVATE_KEY is None:
-        SERVER_PRIVATE_KEY = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
-        SERVER_PUBLIC_KEY = SERVER_PRIVATE_KEY.public_key()
+    key_manager = get_key_manager()
+    SERVER_PRIVATE_KEY = key_manager.private_key
+    SERVER_PUBLIC_KEY = key_manager.public_key
 
 
 def generate_signature(data):
     """Generate cryptographic signature for data"""
-    initialize_crypto()
-
-    # Create signature using RSA
-    signature = SERVER_PRIVATE_KEY.sign(
-        data.encode('utf-8'),
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()),
-            salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256()
-    )
-
-    return b64encode(signature).decode('utf-8')
+    return get_key_manager().sign(data.encode('utf-8'))
 
 
 def verify_signature(data, signature):
     """Verify cryptographic signature"""
-    initialize_crypto()
-
     try:
-        signature_bytes = b64decode(signature.encode('utf-8'))
-        SERVER_PUBLIC_KEY.verify(
-            signature_bytes,
-            data.encode('utf-8'),
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
-        return True
+        return get_key_manager().verify(data.encode('utf-8'), signature)
     except Exception:
         return False
 
 
+def verify_many(payloads, signatures):
+    """Verify a batch of signatures over string payloads; returns a list of booleans"""
+    try:
+        return get_key_manager().verify_many([data.encode('utf-8') for data in payloads], signatures)
+    except Exception:
+        return [False] * len(payloads)
+
+
 def generate_device_fingerprint(device_info):
     """Generate unique device fingerprint"""
     device_string = f"{device_info.get('model', '')}-{device_info.get('platform', '')}-{device_info.get('uniqueId', '')}"
@@ -112,25 +301,45 @@ def verify_payment_payload(payload_data, signature):
         return False
 
 
-def encrypt_payment_data(data, session_key):
-    """Encrypt payment data for Bluetooth transmission"""
-    # Generate encryption key from session key
-    key = hashlib.sha256(session_key.encode()).digest()
-    iv = os.urandom(16)
+@functools.lru_cache(maxsize=1024)
+def _session_cipher(session_key):
+    """Derive the AES-256-GCM key for a session once and cache it by session key"""
+    key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=BLUETOOTH_KEY_INFO,
+        backend=default_backend()
+    ).derive(session_key.encode())
+    return key, AESGCM(key)
 
-    # Encrypt data
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv),
-                    backend=default_backend())
-    encryptor = cipher.encryptor()
 
-    # Pad data to block size
-    data_bytes = json.dumps(data).encode()
-    padded_data = data_bytes + b'\0' * (16 - len(data_bytes) % 16)
-    encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
+def encrypt_frame(plaintext, session_key, associated_data=None):
+    """Encrypt bytes into a length-prefixed frame: length, nonce, ciphertext with tag"""
+    _, aead = _session_cipher(session_key)
+    nonce = os.urandom(GCM_NONCE_SIZE)
+    ciphertext = aead.encrypt(nonce, plaintext, associated_data)
+    return FRAME_LENGTH.pack(len(ciphertext)) + nonce + ciphertext
+
+
+def decrypt_frame(frame, session_key, associated_data=None):
+    """Decrypt a frame from encrypt_frame; raises InvalidTag if it was tampered with"""
+    _, aead = _session_cipher(session_key)
+    frame = memoryview(frame)
+    (length,) = FRAME_LENGTH.unpack_from(frame)
+    header_size = FRAME_LENGTH.size + GCM_NONCE_SIZE
+    if len(frame) != header_size + length:
+        raise ValueError("Frame length does not match its header")
+    return aead.decrypt(bytes(frame[FRAME_LENGTH.size:header_size]), bytes(frame[header_size:]), associated_data)
+
+
+def encrypt_payment_data(data, session_key):
+    """Encrypt payment data for Bluetooth transmission"""
+    frame = encrypt_frame(json.dumps(data, separators=(',', ':')).encode(), session_key)
 
     return {
-        'encrypted_data': b64encode(encrypted_data).decode(),
-        'iv': b64encode(iv).decode(),
+        'encrypted_data': b64encode(frame).decode(),
+        'algorithm': 'AES-256-GCM',
         'session_key_hash': hashlib.sha256(session_key.encode()).hexdigest()
     }
 
@@ -138,24 +347,132 @@ def encrypt_payment_data(data, session_key):
 def decrypt_payment_data(encrypted_data, session_key):
     """Decrypt payment data from Bluetooth transmission"""
     try:
-        # Generate decryption key from session key
-        key = hashlib.sha256(session_key.encode()).digest()
-        iv = b64decode(encrypted_data['iv'].encode())
-        data = b64decode(encrypted_data['encrypted_data'].encode())
-
-        # Decrypt data
-        cipher = Cipher(algorithms.AES(key), modes.CBC(iv),
-                        backend=default_backend())
-        decryptor = cipher.decryptor()
-        decrypted_data = decryptor.update(data) + decryptor.finalize()
-
-        # Remove padding
-        decrypted_data = decrypted_data.rstrip(b'\0')
-        return json.loads(decrypted_data.decode())
+        if encrypted_data.get('algorithm') == 'AES-256-GCM':
+            frame = b64decode(encrypted_data['encrypted_data'].encode())
+            return json.loads(decrypt_frame(frame, session_key))
+
+        return _decrypt_legacy_payment_data(encrypted_data, session_key)
     except Exception:
         return None
 
 
+def _decrypt_legacy_payment_data(encrypted_data, session_key):
+    """Decrypt zero-padded AES-CBC payloads from older clients"""
+    key = hashlib.sha256(session_key.encode()).digest()
+    iv = b64decode(encrypted_data['iv'].encode())
+    data = b64decode(encrypted_data['encrypted_data'].encode())
+
+    cipher = Cipher(algorithms.AES(key), modes.CBC(iv),
+                    backend=default_backend())
+    decryptor = cipher.decryptor()
+    decrypted_data = decryptor.update(data) + decryptor.finalize()
+
+    # Remove padding
+    decrypted_data = decrypted_data.rstrip(b'\0')
+    return json.loads(decrypted_data.decode())
+
+
+class StreamCipher:
+    """Chunked AES-256-GCM encryption for large sync bundles.
+
+    The stream is a sequence of frames: flags, length, nonce, ciphertext,
+    tag. Nonces are a random per-stream prefix plus a chunk counter, and
+    the counter and final flag are authenticated, so reordered, replayed
+    or truncated streams fail to decrypt. Input and output go through
+    buffers allocated once per cipher and reused for every chunk.
+    """
+
+    FINAL_CHUNK = 0x01
+
+    def __init__(self, session_key, chunk_size=64 * 1024):
+        self.key, _ = _session_cipher(session_key)
+        self.chunk_size = chunk_size
+        self.in_buffer = bytearray(chunk_size)
+        self.out_buffer = bytearray(chunk_size + 15)  # update_into needs block_size - 1 spare bytes
+
+    def encrypt_stream(self, source, sink):
+        """Encrypt a readable binary stream into a writable one; returns bytes written"""
+        nonce_prefix = os.urandom(GCM_NONCE_SIZE - 4)
+        in_view = memoryview(self.in_buffer)
+        written = 0
+        counter = 0
+
+        size = self._read_chunk(source, in_view)
+        while True:
+            # Read ahead one chunk so the last frame can be flagged as final
+            next_chunk = source.read(self.chunk_size)
+            flags = 0 if next_chunk else self.FINAL_CHUNK
+            nonce = nonce_prefix + counter.to_bytes(4, 'big')
+
+            encryptor = Cipher(algorithms.AES(self.key), modes.GCM(nonce), backend=default_backend()).encryptor()
+            encryptor.authenticate_additional_data(self._chunk_aad(counter, flags))
+            length = encryptor.update_into(in_view[:size], self.out_buffer)
+            encryptor.finalize()
+
+            sink.write(STREAM_HEADER.pack(flags, length) + nonce)
+            sink.write(memoryview(self.out_buffer)[:length])
+            sink.write(encryptor.tag)
+            written += STREAM_HEADER.size + GCM_NONCE_SIZE + length + GCM_TAG_SIZE
+
+            if flags & self.FINAL_CHUNK:
+                return written
+
+            size = len(next_chunk)
+            in_view[:size] = next_chunk
+            counter += 1
+
+    def decrypt_stream(self, source, sink):
+        """Decrypt a stream from encrypt_stream into a writable one; returns plaintext bytes written"""
+        in_view = memoryview(self.in_buffer)
+        written = 0
+        counter = 0
+        nonce_prefix = None
+
+        while True:
+            header = source.read(STREAM_HEADER.size + GCM_NONCE_SIZE)
+            if len(header) < STREAM_HEADER.size + GCM_NONCE_SIZE:
+                raise ValueError("Truncated stream")
+
+            flags, length = STREAM_HEADER.unpack_from(header)
+            nonce = header[STREAM_HEADER.size:]
+            if nonce_prefix is None:
+                nonce_prefix = nonce[:-4]
+            if length > self.chunk_size or nonce != nonce_prefix + counter.to_bytes(4, 'big'):
+                raise ValueError("Unexpected chunk in stream")
+
+            if self._read_chunk(source, in_view[:length]) != length:
+                raise ValueError("Truncated stream")
+            tag = source.read(GCM_TAG_SIZE)
+
+            decryptor = Cipher(algorithms.AES(self.key), modes.GCM(nonce, tag), backend=default_backend()).decryptor()
+            decryptor.authenticate_additional_data(self._chunk_aad(counter, flags))
+            size = decryptor.update_into(in_view[:length], self.out_buffer)
+            decryptor.finalize()
+
+            # Only authenticated plaintext reaches the sink
+            sink.write(memoryview(self.out_buffer)[:size])
+            written += size
+
+            if flags & self.FINAL_CHUNK:
+                return written
+            counter += 1
+
+    def _read_chunk(self, source, view):
+        """Fill view from source, returning the number of bytes read"""
+        filled = 0
+        while filled < len(view):
+            chunk = source.read(len(view) - filled)
+            if not chunk:
+                break
+            view[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+        return filled
+
+    def _chunk_aad(self, counter, flags):
+        """Associated data binding a chunk to its position in the stream"""
+        return STREAM_AAD_PREFIX + counter.to_bytes(4, 'big') + bytes([flags])
+
+
 def generate_session_key():
     """Generate secure session key for Bluetooth communication"""
     return secrets.token_hex(32)
@@ -0,0 +1,76 @@
+"""
+Pagination utilities for SatuPay Payment Switch
+Opaque keyset cursors and short-lived total counts for list endpoints
+"""
+
+import base64
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Hashable, Optional, Tuple
+from sqlalchemy import text
+from src.database.connection import db
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that cannot be decoded"""
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    """Opaque cursor pointing just past the (created_at, id) of the last row on a page"""
+    payload = json.dumps([created_at.isoformat(), str(row_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Decode a cursor from encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Invalid pagination cursor') from e
+
+class CountCache:
+    """Total row counts per filter combination, reused for a short TTL.
+    
+    Keyset pages no longer need the total, so it is only computed when a
+    client asks for it, and repeated requests for the same filters share
+    one count instead of rescanning the table on every page.
+    """
+    
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()  # key -> (count, computed_at)
+        self.lock = threading.Lock()
+    
+    def get_or_compute(self, key: Hashable, compute: Callable[[], int]) -> Tuple[int, float]:
+        """Return (count, age in seconds), computing the count when missing or stale"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self.entries.move_to_end(key)
+                return entry[0], now - entry[1]
+        
+        count = compute()
+        with self.lock:
+            self.entries[key] = (count, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return count, 0.0
+
+def estimate_row_count(table_name: str) -> Optional[int]:
+    """Planner row estimate for a whole table; None where the database has none"""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    estimate = db.session.execute(
+        text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table_name)"),
+        {'table_name': table_name}
+    ).scalar()
+    # -1 means the table was never analyzed
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
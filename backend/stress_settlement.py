@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Concurrent stress test for PSP settlement in services/settlement_engine
+Runs random transfers between a small pool of users from many threads and
+checks that money is conserved and no balance goes negative. Uses a
+throwaway SQLite file unless DATABASE_URL points at Postgres.
+"""
+
+import sys
+import os
+import random
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+# Add src to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from flask import Flask
+from src.database.connection import db
+from src.services.settlement_engine import SettlementEngine, SettlementError
+
+THREADS = 8
+TRANSFERS_PER_THREAD = 200
+USERS = 6
+OPENING_BALANCE = Decimal('100.00')
+
+def create_stress_app(database_url):
+    """Minimal app bound to the stress database"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 1}}
+    db.init_app(app)
+    return app
+
+def reset_users(app):
+    """Recreate the user pool with opening balances"""
+    from src.models.user import User
+    
+    with app.app_context():
+        User.query.filter(User.phone_number.like('stress-%')).delete(synchronize_session=False)
+        users = [User(phone_number=f'stress-{i}', full_name=f'Stress {i}', balance=OPENING_BALANCE)
+                 for i in range(USERS)]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+def legacy_settle(payer_id, payee_id, amount):
+    """The previous read-modify-write settlement, for comparison"""
+    from src.models.user import User
+    
+    payer = User.query.get(payer_id)
+    payee = User.query.get(payee_id)
+    if payer.balance < amount:
+        raise SettlementError('Insufficient payer balance')
+    payer.balance -= amount
+    payee.balance += amount
+    db.session.commit()
+
+def run(app, name, settle, user_ids):
+    """Hammer settle from THREADS threads and verify the resulting balances"""
+    from src.models.user import User
+    
+    outcomes = {'settled': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    
+    def worker(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            for _ in range(TRANSFERS_PER_THREAD):
+                payer_id, payee_id = rng.sample(user_ids, 2)
+                amount = Decimal(rng.randint(1, 2500)) / 100
+                try:
+                    settle(payer_id, payee_id, amount)
+                    outcome = 'settled'
+                except SettlementError:
+                    outcome = 'rejected'
+                except Exception:
+                    db.session.rollback()
+                    outcome = 'errors'
+                with lock:
+                    outcomes[outcome] += 1
+    
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    with app.app_context():
+        balances = [Decimal(str(user.balance)) for user in User.query.filter(User.id.in_(user_ids))]
+        total = sum(balances)
+    expected = OPENING_BALANCE * USERS
+    
+    print(f"{name:<10} {outcomes['settled'] / elapsed:>8,.0f} settlements/s   settled {outcomes['settled']}, "
+          f"rejected {outcomes['rejected']}, errors {outcomes['errors']}")
+    print(f"{'':<10} total {total} (expected {expected}), min balance {min(balances)}"
+          f" -> {'OK' if total == expected and min(balances) >= 0 else 'INCONSISTENT'}")
+
+if __name__ == '__main__':
+    import logging
+    import warnings
+    logging.disable(logging.WARNING)
+    warnings.simplefilter('ignore')  # legacy Query.get in the comparison path
+    
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stress_settlement.db')}"
+    print(f"Database: {database_url.split('@')[-1]}")
+    
+    app = create_stress_app(database_url)
+    with app.app_context():
+        import src.models.user, src.models.transaction, src.models.offline_token
+        import src.models.qr_code, src.models.plugin_log
+        db.create_all()
+    
+    run(app, 'legacy', legacy_settle, reset_users(app))
+    
+    engine = SettlementEngine()
+    run(app, 'engine', engine.settle, reset_users(app))
+    metrics = engine.get_metrics()
+    print(f"{'':<10} conflicts retried {metrics['conflicts']}, failed {metrics['failed']}, "
+          f"{metrics['conflicts_per_second']} conflicts/s over the last minute")
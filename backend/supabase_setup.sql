@@ -76,6 +76,11 @@ CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_a
 CREATE INDEX IF NOT EXISTS idx_transactions_merchant_id ON transactions(merchant_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_payment_rail ON transactions(payment_rail);
 
+-- Composite indexes for keyset pagination on (created_at, id), optionally filtered
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at_id ON transactions(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_created_at_id ON transactions(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_payment_rail_created_at_id ON transactions(payment_rail, created_at, id);
+
 -- Plugin Logs table
 CREATE TABLE IF NOT EXISTS plugin_logs (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -102,19 +107,55 @@ CREATE TABLE IF NOT EXISTS offline_tokens (
     token_id VARCHAR(100) UNIQUE NOT NULL,
     user_id UUID NOT NULL REFERENCES users(id),
     amount DECIMAL(15, 2) NOT NULL,
+    remaining_amount DECIMAL(15, 2), -- unspent part of amount; NULL means unspent
     currency VARCHAR(3) DEFAULT 'MYR',
+    device_id VARCHAR(255),
+    signature TEXT,
+    payload_hash VARCHAR(64),
     status VARCHAR(20) DEFAULT 'active', -- active, redeemed, expired, cancelled
     redeemed_at TIMESTAMP WITH TIME ZONE,
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Columns used by the mobile offline payment API on existing databases
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS remaining_amount DECIMAL(15, 2);
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS device_id VARCHAR(255);
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS signature TEXT;
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS payload_hash VARCHAR(64);
+
 -- Create indexes for offline tokens
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_token_id ON offline_tokens(token_id);
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_user_id ON offline_tokens(user_id);
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_status ON offline_tokens(status);
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_expires_at ON offline_tokens(expires_at);
 
+-- Idempotency keys for retried payment and sync requests
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(300) PRIMARY KEY, -- endpoint:Idempotency-Key header
+    request_hash VARCHAR(64) NOT NULL,
+    status_code INTEGER, -- NULL while the first request is in flight
+    response_body BYTEA,
+    content_type VARCHAR(100),
+    created_at TIMESTAMP DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- Hourly and daily rollups of finished transactions for the dashboard
+CREATE TABLE IF NOT EXISTS transaction_rollups (
+    granularity VARCHAR(8) NOT NULL, -- hour, day
+    bucket_start TIMESTAMP NOT NULL, -- UTC, by completion time
+    status VARCHAR(20) NOT NULL,
+    payment_rail VARCHAR(50) NOT NULL,
+    amount_bucket VARCHAR(20) NOT NULL,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    total_amount DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (granularity, bucket_start, status, payment_rail, amount_bucket)
+);
+
 -- Create updated_at trigger function
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -267,6 +308,11 @@ CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_a
 CREATE INDEX IF NOT EXISTS idx_transactions_merchant_id ON transactions(merchant_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_payment_rail ON transactions(payment_rail);
 
+-- Composite indexes for keyset pagination on (created_at, id), optionally filtered
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at_id ON transactions(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_created_at_id ON transactions(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_payment_rail_created_at_id ON transactions(payment_rail, created_at, id);
+
 -- Plugin Logs table
 CREATE TABLE IF NOT EXISTS plugin_logs (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -293,19 +339,55 @@ CREATE TABLE IF NOT EXISTS offline_tokens (
     token_id VARCHAR(100) UNIQUE NOT NULL,
     user_id UUID NOT NULL REFERENCES users(id),
     amount DECIMAL(15, 2) NOT NULL,
+    remaining_amount DECIMAL(15, 2), -- unspent part of amount; NULL means unspent
     currency VARCHAR(3) DEFAULT 'MYR',
+    device_id VARCHAR(255),
+    signature TEXT,
+    payload_hash VARCHAR(64),
     status VARCHAR(20) DEFAULT 'active', -- active, redeemed, expired, cancelled
     redeemed_at TIMESTAMP WITH TIME ZONE,
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Columns used by the mobile offline payment API on existing databases
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS remaining_amount DECIMAL(15, 2);
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS device_id VARCHAR(255);
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS signature TEXT;
+ALTER TABLE offline_tokens ADD COLUMN IF NOT EXISTS payload_hash VARCHAR(64);
+
 -- Create indexes for offline tokens
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_token_id ON offline_tokens(token_id);
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_user_id ON offline_tokens(user_id);
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_status ON offline_tokens(status);
 CREATE INDEX IF NOT EXISTS idx_offline_tokens_expires_at ON offline_tokens(expires_at);
 
+-- Idempotency keys for retried payment and sync requests
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(300) PRIMARY KEY, -- endpoint:Idempotency-Key header
+    request_hash VARCHAR(64) NOT NULL,
+    status_code INTEGER, -- NULL while the first request is in flight
+    response_body BYTEA,
+    content_type VARCHAR(100),
+    created_at TIMESTAMP DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- Hourly and daily rollups of finished transactions for the dashboard
+CREATE TABLE IF NOT EXISTS transaction_rollups (
+    granularity VARCHAR(8) NOT NULL, -- hour, day
+    bucket_start TIMESTAMP NOT NULL, -- UTC, by completion time
+    status VARCHAR(20) NOT NULL,
+    payment_rail VARCHAR(50) NOT NULL,
+    amount_bucket VARCHAR(20) NOT NULL,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    total_amount DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (granularity, bucket_start, status, payment_rail, amount_bucket)
+);
+
 -- Create updated_at trigger function
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$